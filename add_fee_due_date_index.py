@@ -0,0 +1,16 @@
+"""
+Script to add the (paid, due_date) index to the Fee table.
+This is needed by the overdue reminder sweep on existing databases;
+new databases get it from db.create_all().
+The change is migration 4 in migrations.py; this applies it (and any earlier ones).
+"""
+import sys
+from migrations import migrate
+
+def add_fee_due_date_index():
+    """Create ix_fee_paid_due_date if it doesn't exist."""
+    return migrate(target=4)
+
+if __name__ == "__main__":
+    if not add_fee_due_date_index():
+        sys.exit(1)
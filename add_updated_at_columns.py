@@ -0,0 +1,17 @@
+"""
+Script to add the updated_at column to every table backed up incrementally.
+Existing rows get the time they were created (or logged), so the first
+incremental backup after a full one only picks up rows changed since.
+The change is migration 6 in migrations.py, which backfills the column in
+batches; this applies it (and any earlier ones).
+"""
+import sys
+from migrations import migrate
+
+def add_updated_at_columns():
+    """Add updated_at and its index to each table, backfilled from the creation time."""
+    return migrate(target=6)
+
+if __name__ == "__main__":
+    if not add_updated_at_columns():
+        sys.exit(1)
@@ -0,0 +1,17 @@
+"""
+Script to add the token_hash column to the User table.
+Magic link tokens are now stored as a SHA-256 hash in a uniquely indexed
+column; any plaintext tokens still in the old column are cleared, so
+outstanding login links stop working and users need to request a new one.
+The change is migration 5 in migrations.py; this applies it (and any earlier ones).
+"""
+import sys
+from migrations import migrate
+
+def add_user_token_hash_column():
+    """Add token_hash and its unique index, and clear plaintext tokens."""
+    return migrate(target=5)
+
+if __name__ == "__main__":
+    if not add_user_token_hash_column():
+        sys.exit(1)
@@ -0,0 +1,295 @@
+"""
+Payment allocation module for StrataHub application.
+Allocates a reconciliation batch of bank payments to unpaid fees as a whole,
+so no fee is offered to two payments, lump sums covering several periods are
+split across the fees they pay, and part payments are recorded against
+Fee.paid_amount.
+
+Amounts are handled in whole cents so sums of fees compare exactly.
+"""
+
+from collections import defaultdict, deque
+
+from models import Fee
+
+# A single fee within this share of the payment still counts as its match
+CLOSE_MATCH_TOLERANCE = 0.05
+# Fees (oldest first) considered when looking for a combination that adds up
+# to a lump-sum payment
+MAX_COMBINATION_FEES = 40
+# Give up on a combination search after this many distinct partial sums
+MAX_COMBINATION_STATES = 200000
+
+def to_cents(amount):
+    """Convert a dollar amount to whole cents."""
+    return int(round((amount or 0) * 100))
+
+def _exact_combination(fees, target):
+    """
+    Find fees whose remaining amounts add up exactly to `target` cents.
+
+    Subset-sum over the partial sums reachable with the fees in order, so the
+    combination found prefers the oldest fees.
+
+    Args:
+        fees (list): (fee_id, cents) pairs, oldest first
+        target (int): Payment amount in cents
+
+    Returns:
+        list: (fee_id, cents) pairs, or None if no combination adds up
+    """
+    # partial sum -> (previous partial sum, index of the fee added)
+    reached = {0: None}
+    for index, (_, cents) in enumerate(fees):
+        for total in list(reached):
+            new_total = total + cents
+            if new_total <= target and new_total not in reached:
+                reached[new_total] = (total, index)
+        if target in reached or len(reached) > MAX_COMBINATION_STATES:
+            break
+
+    if target not in reached:
+        return None
+
+    combination = []
+    total = target
+    while reached[total] is not None:
+        total, index = reached[total]
+        combination.append(fees[index])
+    combination.reverse()
+    return combination
+
+def allocate_property(payments, fees):
+    """
+    Allocate one property's payments to its unpaid fees.
+
+    Works in four passes, each only on what the previous ones left:
+      1. Exact matches: a payment equal to a fee's remaining amount takes the
+         oldest such fee, so two payments never share one.
+      2. Lump sums: a payment equal to the total of several fees is split
+         across them (largest payments first).
+      3. Close matches: payments within CLOSE_MATCH_TOLERANCE of a fee are
+         paired, closest pairs first.
+      4. Everything else is applied to the oldest fees with money still owing,
+         leaving part-paid fees where a payment runs out.
+
+    Args:
+        payments (list): (key, amount in cents) for each payment, in statement order
+        fees (list): (fee_id, remaining amount in cents), oldest first
+
+    Returns:
+        dict: {payment key: [(fee_id, cents allocated), ...]}; payments with
+              nothing allocated are left out
+    """
+    order = [fee_id for fee_id, cents in fees if cents > 0]
+    position = {fee_id: i for i, fee_id in enumerate(order)}
+    remaining = {fee_id: cents for fee_id, cents in fees if cents > 0}
+    allocations = defaultdict(list)
+    left = {}
+
+    def assign(key, fee_id, cents):
+        allocations[key].append((fee_id, cents))
+        remaining[fee_id] -= cents
+        left[key] -= cents
+
+    # 1. Exact one-to-one matches
+    by_amount = defaultdict(deque)
+    for fee_id in order:
+        by_amount[remaining[fee_id]].append(fee_id)
+
+    open_payments = []
+    for key, cents in payments:
+        left[key] = cents
+        if cents <= 0:
+            continue
+        if by_amount.get(cents):
+            assign(key, by_amount[cents].popleft(), cents)
+        else:
+            open_payments.append(key)
+
+    # 2. Lump sums covering several whole fees
+    for key in sorted(open_payments, key=lambda key: -left[key]):
+        unpaid = [(fee_id, remaining[fee_id]) for fee_id in order if remaining[fee_id] > 0]
+        combination = _exact_combination(unpaid[:MAX_COMBINATION_FEES], left[key])
+        if combination:
+            for fee_id, cents in combination:
+                assign(key, fee_id, cents)
+    open_payments = [key for key in open_payments if left[key] > 0]
+
+    # 3. Close single-fee matches, closest first
+    pairs = []
+    for key in open_payments:
+        for fee_id in order:
+            fee_cents = remaining[fee_id]
+            if fee_cents > 0 and abs(fee_cents - left[key]) < CLOSE_MATCH_TOLERANCE * fee_cents:
+                pairs.append((abs(fee_cents - left[key]), key, fee_id))
+    pairs.sort(key=lambda pair: (pair[0], position[pair[2]]))
+
+    matched = set()
+    for _, key, fee_id in pairs:
+        if key in matched or fee_id in matched:
+            continue
+        matched.update((key, fee_id))
+        assign(key, fee_id, min(left[key], remaining[fee_id]))
+
+    # 4. Part payments and overpayments go to the oldest fees still owing
+    for key in open_payments:
+        for fee_id in order:
+            if left[key] <= 0:
+                break
+            if remaining[fee_id] > 0:
+                assign(key, fee_id, min(left[key], remaining[fee_id]))
+
+    return dict(allocations)
+
+def load_unpaid_fees(property_ids):
+    """
+    Get the unpaid fees of several properties in one query.
+
+    Returns:
+        dict: {property_id: [Fee, ...]} with each list oldest first
+    """
+    if not property_ids:
+        return {}
+
+    fees = Fee.query.filter(Fee.property_id.in_(property_ids), Fee.paid == False)\
+        .order_by(Fee.property_id, Fee.date.asc(), Fee.id.asc())\
+        .all()
+
+    by_property = defaultdict(list)
+    for fee in fees:
+        by_property[fee.property_id].append(fee)
+    return by_property
+
+def suggest_allocations(payments):
+    """
+    Suggest fee allocations for a batch of analysed bank payments.
+
+    Every payment with a suggested property is allocated together with the
+    other payments for that property. Adds to each payment:
+      - 'fee_allocations': list of dicts with the fee's id, period, amount and
+        the amount of this payment allocated to it
+      - 'suggested_fee': the first fee allocated (id, amount, period,
+        exact_match), or None
+
+    Args:
+        payments (list): Payment dicts from process_csv()
+
+    Returns:
+        list: The same payments
+    """
+    grouped = defaultdict(list)
+    for index, payment in enumerate(payments):
+        payment['suggested_fee'] = None
+        payment['fee_allocations'] = []
+
+        property_id = (payment.get('suggested_property') or {}).get('id')
+        if property_id and payment.get('amount', 0) > 0:
+            grouped[property_id].append((index, to_cents(payment['amount'])))
+
+    unpaid_fees = load_unpaid_fees(list(grouped))
+
+    for property_id, property_payments in grouped.items():
+        fees = {fee.id: fee for fee in unpaid_fees.get(property_id, [])}
+        owing = {fee_id: to_cents(fee.amount - (fee.paid_amount or 0)) for fee_id, fee in fees.items()}
+        allocations = allocate_property(property_payments, list(owing.items()))
+
+        for index, cents in property_payments:
+            allocated = allocations.get(index)
+            if not allocated:
+                continue
+
+            payment = payments[index]
+            payment['fee_allocations'] = [
+                {
+                    'id': fee_id,
+                    'period': fees[fee_id].period,
+                    'fee_amount': fees[fee_id].amount,
+                    'amount': fee_cents / 100
+                }
+                for fee_id, fee_cents in allocated
+            ]
+
+            # Exact when the payment pays off each of its fees and nothing more
+            exact = sum(fee_cents for _, fee_cents in allocated) == cents and \
+                all(fee_cents == owing[fee_id] for fee_id, fee_cents in allocated)
+            first_fee = fees[allocated[0][0]]
+            payment['suggested_fee'] = {
+                'id': first_fee.id,
+                'amount': first_fee.amount,
+                'period': first_fee.period,
+                'exact_match': exact
+            }
+
+    return payments
+
+def parse_allocations(value):
+    """
+    Decode the fee_allocations form field of the reconciliation page,
+    e.g. "12:250.00,13:250.00".
+
+    Returns:
+        list: (fee_id, amount) pairs; malformed entries are skipped
+    """
+    allocations = []
+    for item in (value or '').split(','):
+        try:
+            fee_id, amount = item.split(':')
+            allocations.append((int(fee_id), float(amount)))
+        except ValueError:
+            continue
+    return allocations
+
+def apply_payment(property_id, amount, fee_id=None, planned=None):
+    """
+    Apply a confirmed payment to a property's unpaid fees.
+
+    The payment goes to the chosen fee first, following the suggested split
+    when the chosen fee is the one it starts with, then any remainder pays off
+    the oldest unpaid fees. Each fee's paid_amount is increased by what it
+    receives and the fee is marked paid once nothing is owing; money left
+    after every fee is paid stays as credit on the property balance.
+
+    Args:
+        property_id (int): Property the payment belongs to
+        amount (float): Payment amount
+        fee_id (int, optional): Fee the payment was matched to
+        planned (list, optional): (fee_id, amount) pairs suggested for this payment
+
+    Returns:
+        list: (Fee, amount applied) pairs
+    """
+    fees = Fee.query.filter_by(property_id=property_id, paid=False)\
+        .order_by(Fee.date.asc(), Fee.id.asc())\
+        .all()
+    by_id = {fee.id: fee for fee in fees}
+
+    steps = []
+    if fee_id is not None:
+        if planned and planned[0][0] == fee_id:
+            steps = [(planned_id, to_cents(planned_amount)) for planned_id, planned_amount in planned]
+        else:
+            steps = [(fee_id, None)]
+    steps += [(fee.id, None) for fee in fees]
+
+    left = to_cents(amount)
+    applied = {}
+    for step_fee_id, limit in steps:
+        if left <= 0:
+            break
+        fee = by_id.get(step_fee_id)
+        if fee is None:
+            continue
+
+        owing = to_cents(fee.amount) - to_cents(fee.paid_amount)
+        cents = min(left, owing) if limit is None else min(left, owing, limit)
+        if cents <= 0:
+            continue
+
+        fee.paid_amount = (to_cents(fee.paid_amount) + cents) / 100
+        if cents == owing:
+            fee.paid = True
+        left -= cents
+        applied[fee] = applied.get(fee, 0) + cents / 100
+
+    return list(applied.items())
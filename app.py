@@ -5,13 +5,17 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 
+import db_pool
+import replica
+
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+# Reads in @replica.read_only views go to DATABASE_REPLICA_URL when it is set
+db = SQLAlchemy(model_class=Base, session_options={"class_": replica.RoutingSession})
 
 # Create the app
 app = Flask(__name__)
@@ -20,16 +24,24 @@ app.secret_key = os.environ.get("SESSION_SECRET")
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///stratahub.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+# Pool size, overflow, timeout and pre-ping come from DB_POOL_* (see db_pool.py);
+# gunicorn.conf.py sizes the pool to each worker's threads
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = db_pool.engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 
 # Initialize the app with the extension
 db.init_app(app)
 
+# Create missing tables whenever the app is imported. Deployments can set
+# AUTO_CREATE_SCHEMA=0 and run `python init_db.py` once per deploy instead,
+# so booting a worker doesn't need a round trip to inspect the schema.
+AUTO_CREATE_SCHEMA = os.environ.get("AUTO_CREATE_SCHEMA", "1") == "1"
+
 with app.app_context():
+    # Count checkouts, waits and invalidations for /api/admin/pool-metrics
+    db_pool.install(db.engine)
+
     # Import models to create tables
     import models
     # Only create tables if they don't exist
-    db.create_all()
+    if AUTO_CREATE_SCHEMA:
+        db.create_all()
@@ -4,14 +4,22 @@ Provides functionality for magic link authentication and role-based access contr
 """
 
 import os
+import time
 import secrets
 import string  # Required for token generation
+import threading
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import render_template, redirect, url_for, request, flash, session, abort
+from flask import render_template, redirect, url_for, request, flash, session, abort, g
+from markupsafe import Markup
+from sqlalchemy.orm import joinedload
 from app import app, db
-from models import Property, Contact, User
+from models import Property, ContactProperty, User
+import change_tracking
+import email_queue
 import email_service
+from rate_limit import Limit, rate_limit, client_ip, form_email, form_property
+from session_store import rotate_session
 
 def obfuscate_email(email):
     """Mask an email address for display purposes."""
@@ -29,6 +37,164 @@ def obfuscate_email(email):
     
     return f"{visible_username}@{visible_domain}.{domain_parts[-1]}"
 
+def sends_login_link():
+    """Whether the current login POST is step 2, which emails a magic link."""
+    return request.form.get('send_link') == 'true'
+
+# Limits on magic link requests, as "<requests>/<seconds>". Choosing a unit
+# (step 1) only counts against the IP limit.
+LOGIN_LIMITS = (
+    Limit('login_ip', os.environ.get('LOGIN_RATE_LIMIT_IP', '20/600'), client_ip),
+    Limit('login_email', os.environ.get('LOGIN_RATE_LIMIT_EMAIL', '3/900'), form_email, when=sends_login_link),
+    Limit('login_property', os.environ.get('LOGIN_RATE_LIMIT_PROPERTY', '10/900'), form_property,
+          when=sends_login_link),
+)
+VERIFY_LIMITS = (
+    Limit('verify_ip', os.environ.get('VERIFY_RATE_LIMIT_IP', '20/600'), client_ip),
+)
+
+# Process-level cache of user snapshots: user_id -> (expires_at, generation, CurrentUser).
+# An entry is dropped once the user table's generation token moves on, so a
+# role change made through another worker applies on the next request.
+USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL', 60))
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+class CurrentUser:
+    """
+    Lightweight snapshot of the logged-in user.
+    Safe to share between requests; the property is loaded per request.
+    """
+    
+    def __init__(self, id, email, role, property_id):
+        self.id = id
+        self.email = email
+        self.role = role
+        self.property_id = property_id
+    
+    def __repr__(self):
+        return f"<CurrentUser {self.email} ({self.role})>"
+    
+    @property
+    def property(self):
+        """Get the user's property, loading it at most once per request."""
+        if 'current_property' not in g:
+            g.current_property = db.session.get(Property, self.property_id) if self.property_id else None
+        return g.current_property
+
+def invalidate_user_cache(user_id=None):
+    """Drop a cached user (or every cached user) so the next request reloads it."""
+    with _user_cache_lock:
+        if user_id is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(user_id, None)
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def _invalidate_changed_user(mapper, connection, target):
+    """Invalidate the cache whenever a user's role, email or property changes."""
+    invalidate_user_cache(target.id)
+
+def get_current_user():
+    """
+    Get the logged-in user for this request.
+    
+    Resolved once per request and stored on flask.g. A cache miss loads the
+    user and their property in a single query; a cache hit needs no query
+    for the user at all.
+    
+    Returns:
+        CurrentUser: The logged-in user, or None if not logged in
+    """
+    if 'current_user' in g:
+        return g.current_user
+    
+    user_id = session.get('user_id')
+    current_user = None
+    
+    if user_id is not None:
+        now = time.monotonic()
+        generation = change_tracking.generations([User.__table__.name])[User.__table__.name]
+        with _user_cache_lock:
+            cached = _user_cache.get(user_id)
+        
+        if cached and cached[0] > now and cached[1] == generation:
+            current_user = cached[2]
+        else:
+            user = User.query.options(joinedload(User.property)).filter(User.id == user_id).first()
+            if user:
+                current_user = CurrentUser(user.id, user.email, user.role, user.property_id)
+                g.current_property = user.property
+                with _user_cache_lock:
+                    _user_cache[user_id] = (now + USER_CACHE_TTL_SECONDS, generation, current_user)
+    
+    g.current_user = current_user
+    return current_user
+
+# Cached property list for the public login page: (expires_at, properties, picker_html)
+PROPERTY_LIST_TTL_SECONDS = int(os.environ.get('PROPERTY_LIST_TTL', 300))
+_property_list = None
+_property_list_lock = threading.Lock()
+
+def invalidate_property_list():
+    """Drop the cached login page property list."""
+    global _property_list
+    with _property_list_lock:
+        _property_list = None
+
+@db.event.listens_for(Property, 'after_insert')
+@db.event.listens_for(Property, 'after_update')
+@db.event.listens_for(Property, 'after_delete')
+def _invalidate_changed_property(mapper, connection, target):
+    """Rebuild the picker whenever a property is added, edited or deleted."""
+    invalidate_property_list()
+
+def _load_property_list():
+    """Load the properties and pre-render the picker fragment."""
+    rows = db.session.query(Property.id, Property.unit_number, Property.description).order_by(Property.id).all()
+    # Descriptions are only needed in the picker HTML, so the list keeps just
+    # what the login steps look up
+    picker_html = Markup(render_template('_property_picker.html', properties=rows))
+    properties = [{'id': row.id, 'unit_number': row.unit_number} for row in rows]
+    return properties, picker_html
+
+def get_property_list():
+    """
+    Get the properties shown on the login page.
+    
+    Cached per process for PROPERTY_LIST_TTL seconds and invalidated when a
+    property changes, so anonymous visitors don't hit the database.
+    
+    Returns:
+        tuple: (list of {'id', 'unit_number'} dicts, picker HTML)
+    """
+    global _property_list
+    now = time.monotonic()
+    with _property_list_lock:
+        cached = _property_list
+    
+    if cached and cached[0] > now:
+        return cached[1], cached[2]
+    
+    properties, picker_html = _load_property_list()
+    with _property_list_lock:
+        _property_list = (now + PROPERTY_LIST_TTL_SECONDS, properties, picker_html)
+    return properties, picker_html
+
+def get_cached_property(property_id):
+    """Look up a property in the cached list by ID (as int or string)."""
+    try:
+        property_id = int(property_id)
+    except (TypeError, ValueError):
+        return None
+    
+    properties, _ = get_property_list()
+    for property in properties:
+        if property['id'] == property_id:
+            return property
+    return None
+
 def require_role(*roles):
     """
     Decorator to restrict route access based on user role.
@@ -41,9 +207,13 @@ def require_role(*roles):
             if 'user_id' not in session:
                 return redirect(url_for('login'))
             
+            current_user = get_current_user()
+            if current_user is None:
+                session.clear()
+                return redirect(url_for('login'))
+            
             # Check if user has required role
-            user_role = session.get('user_role')
-            if user_role not in roles:
+            if current_user.role not in roles:
                 return redirect(url_for('access_denied'))
             
             return f(*args, **kwargs)
@@ -58,10 +228,17 @@ def login_required(f):
     def wrapper(*args, **kwargs):
         if 'user_id' not in session:
             return redirect(url_for('login'))
+        
+        # The account may have been deleted since the session was created
+        if get_current_user() is None:
+            session.clear()
+            return redirect(url_for('login'))
+        
         return f(*args, **kwargs)
     return wrapper
 
 @app.route('/login', methods=['GET', 'POST'])
+@rate_limit(*LOGIN_LIMITS, methods=['POST'])
 def login():
     """
     Login page using magic link authentication.
@@ -72,9 +249,6 @@ def login():
     if 'user_id' in session:
         return redirect(url_for('index'))
     
-    # Get all properties for selection
-    properties = Property.query.all()
-    
     # Process form submission
     if request.method == 'POST':
         # Step 2 - Send login link
@@ -102,73 +276,35 @@ def login():
             
             # Send magic link email
             login_url = url_for('verify_login', token=token, _external=True)
-            property_obj = Property.query.get(property_id)
-            
-            unit_text = ""
-            if property_obj and property_obj.unit_number:
-                unit_text = f" for unit {property_obj.unit_number}"
-            
-            # Prepare email content
-            subject = "StrataHub Login Link"
-            text_content = f"""
-            Hello,
-            
-            Someone requested a login link for StrataHub{unit_text}.
-            
-            Click the link below to log in:
-            {login_url}
+            property_obj = get_cached_property(property_id)
             
-            This link will expire in 30 minutes and can only be used once.
+            unit_number = property_obj['unit_number'] if property_obj else None
+            subject, text_content, html_content = email_service.render_login_link(login_url, unit_number)
             
-            If you did not request this link, please ignore this email.
-            
-            Regards,
-            StrataHub Team
-            """
-            
-            unit_html = ""
-            if property_obj and property_obj.unit_number:
-                unit_html = f" for unit <strong>{property_obj.unit_number}</strong>"
-            
-            html_content = f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <h2>StrataHub Login</h2>
-                <p>Hello,</p>
-                <p>Someone requested a login link for StrataHub{unit_html}.</p>
-                <p><a href="{login_url}" style="display: inline-block; background-color: #007bff; color: white; padding: 10px 20px; text-decoration: none; border-radius: 4px;">Click here to log in</a></p>
-                <p style="font-size: 0.9em; color: #666;">This link will expire in 30 minutes and can only be used once.</p>
-                <p style="font-size: 0.9em; color: #666;">If you did not request this link, please ignore this email.</p>
-                <p>Regards,<br>StrataHub Team</p>
-            </div>
-            """
-            
-            # Send email
-            success = email_service.send_email(
+            # Queue the email on the login lane so it isn't held up by bulk mail
+            email_queue.enqueue_email(
                 to_email=email,
                 subject=subject,
                 text_content=text_content,
-                html_content=html_content
+                html_content=html_content,
+                priority=email_queue.PRIORITY_LOGIN
             )
             
-            if success:
-                flash('Login link sent! Please check your email.', 'success')
-                return redirect(url_for('login_confirm'))
-            else:
-                flash('Failed to send login link. Please try again or contact support.', 'danger')
-                return redirect(url_for('login'))
+            flash('Login link sent! Please check your email.', 'success')
+            return redirect(url_for('login_confirm'))
         
         # Step 1 - Property selection
         property_id = request.form.get('property_id')
         if property_id:
-            property = Property.query.get(property_id)
+            property = get_cached_property(property_id)
             if property:
                 # Get property owner's email
-                owner = property.get_owner()
+                owner = ContactProperty.owners_by_property([property['id']]).get(property['id'])
                 if owner and owner.email:
                     # Display masked email and confirm
                     return render_template('login.html', property_data={
-                        'id': property.id,
-                        'unit_number': property.unit_number,
+                        'id': property['id'],
+                        'unit_number': property['unit_number'],
                         'owner_name': owner.name,
                         'email': owner.email,
                         'masked_email': obfuscate_email(owner.email)
@@ -179,7 +315,8 @@ def login():
                 flash('Invalid property selected.', 'danger')
     
     # Display property selection form
-    return render_template('login.html', properties=properties)
+    properties, property_picker = get_property_list()
+    return render_template('login.html', properties=properties, property_picker=property_picker)
 
 @app.route('/login/confirm')
 def login_confirm():
@@ -187,6 +324,7 @@ def login_confirm():
     return render_template('login_confirm.html')
 
 @app.route('/verify_login')
+@rate_limit(*VERIFY_LIMITS)
 def verify_login():
     """
     Verifies the magic link token and logs in the user.
@@ -197,12 +335,13 @@ def verify_login():
         return redirect(url_for('login'))
     
     # Find user with this token
-    user = User.query.filter_by(token=token).first()
+    user = User.find_by_token(token)
     if not user or not user.is_token_valid(token):
         flash('Invalid or expired login link. Please request a new one.', 'danger')
         return redirect(url_for('login'))
     
-    # Valid token - log the user in
+    # Valid token - log the user in under a fresh session ID
+    rotate_session(session)
     session['user_id'] = user.id
     session['user_email'] = user.email
     session['user_role'] = user.role
@@ -225,6 +364,7 @@ def logout():
     Logs out the user by clearing the session.
     """
     session.clear()
+    rotate_session(session)
     flash('You have been logged out.', 'info')
     return redirect(url_for('login'))
 
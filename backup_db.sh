@@ -14,5 +14,5 @@ python backup_db_data.py
 echo ""
 echo "Database backup complete."
 echo "Schema: db_backups/latest_schema.sql"
-echo "Data: db_backups/latest_data_backup.sql"
+echo "Data: db_backups/latest_data_backup.sql.gz"
 echo ""
\ No newline at end of file
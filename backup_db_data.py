@@ -1,114 +1,609 @@
 #!/usr/bin/env python3
 """
 Script to backup all data from the PostgreSQL database.
-This creates a SQL file with INSERT statements for all data.
+This creates a gzip-compressed SQL file with one COPY block per table, in the
+same text format as pg_dump, so it can be restored with restore_db_data.py or
+piped into psql.
+
+Tables are streamed straight into the compressed file: on PostgreSQL with
+COPY ... TO STDOUT, on other databases with a streaming cursor, so memory use
+does not grow with the size of the database.
+
+With --jobs N the backup is a directory with one compressed file per table
+and a manifest of row counts and checksums. Tables are dumped by N workers
+that share one exported snapshot (PostgreSQL only; other databases are
+dumped one table at a time), so the backup is still consistent.
+
+With --incremental the backup is a directory holding only the rows changed
+since the latest directory backup (by their updated_at column), plus the
+primary keys each table had, so a restore can replay the full backup and
+then each increment in turn, deletions included.
 """
 import os
 import sys
+import io
+import gzip
+import json
+import shutil
+import hashlib
+import threading
 import datetime
-from sqlalchemy import create_engine, inspect, MetaData, Table, text
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session
+import argparse
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, MetaData, select, func
+
+BACKUP_DIR = 'db_backups'
+LATEST_BACKUP = 'latest_data_backup.sql.gz'
+LATEST_DIRECTORY_BACKUP = 'latest_data_backup_dir'
+MANIFEST_FILE = 'manifest.json'
+# Column marking when a row was last inserted or updated
+CHANGE_COLUMN = 'updated_at'
+# How far before the previous backup started to look for changes, to allow
+# for transactions that were still running when it took its snapshot
+INCREMENTAL_OVERLAP_SECONDS = int(os.environ.get('INCREMENTAL_OVERLAP_SECONDS', 300))
+# Workers dumping tables at once (1 writes a single file as before)
+BACKUP_JOBS = int(os.environ.get('BACKUP_JOBS', 1))
+# Rows fetched per round trip when streaming without COPY
+FETCH_SIZE = 10000
+COMPRESS_LEVEL = int(os.environ.get('BACKUP_COMPRESS_LEVEL', 6))
+
+# Migration tracking and data that is rebuilt or expires on its own
+# (search index, server-side sessions, rate limit buckets)
+SKIPPED_TABLES = {'alembic_version', 'schema_version', 'search_document', 'server_session', 'rate_limit_bucket'}
+SKIPPED_PREFIXES = ('search_document_',)
+
+def include_table(table_name):
+    """Whether a table's data belongs in the backup."""
+    return table_name not in SKIPPED_TABLES and not table_name.startswith(SKIPPED_PREFIXES)
+
+def _escape_copy_text(value):
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def encode_copy_value(value):
+    """Encode one value in COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (int, Decimal)):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\\\x' + bytes(value).hex()
+    return _escape_copy_text(str(value))
+
+class _RowCounter(io.TextIOBase):
+    """
+    File wrapper that counts and checksums the COPY rows written through it.
+    A text stream, so psycopg2 writes COPY output to it as str.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.rows = 0
+        self.checksum = hashlib.sha256()
+
+    def write(self, data):
+        self.rows += data.count('\n')
+        self.checksum.update(data.encode('utf-8'))
+        if self.stream is None:
+            return len(data)
+        return self.stream.write(data)
+
+def copy_statement(table_name, columns, preparer):
+    """COPY header for a table, e.g. COPY "user" ("id", "email") FROM stdin;"""
+    column_list = ', '.join(preparer.quote_identifier(column) for column in columns)
+    return f"COPY {preparer.quote_identifier(table_name)} ({column_list}) FROM stdin;\n"
+
+def dump_table(conn, table, out, ordered=False, columns=None, changed_since=None):
+    """
+    Stream one table's rows to `out` in COPY text format.
+
+    Args:
+        conn: SQLAlchemy connection (inside the backup's transaction)
+        table (Table): Reflected table
+        out: Text stream to write to, or None to only count and checksum
+        ordered (bool): Sort rows by primary key, so the checksum is repeatable
+        columns (list, optional): Column names to dump (default: all, in table order)
+        changed_since (datetime, optional): Only dump rows updated at or after
+                                            this time (or never stamped)
+
+    Returns:
+        tuple: (rows written, SHA-256 hex digest of the rows)
+    """
+    counter = _RowCounter(out)
+    preparer = conn.dialect.identifier_preparer
+    selected = [table.c[column] for column in columns] if columns else list(table.columns)
+    order_by = list(table.primary_key.columns) or selected
+
+    if conn.dialect.name == 'postgresql':
+        column_list = ', '.join(preparer.quote_identifier(column.name) for column in selected)
+        source = preparer.quote_identifier(table.name)
+        if ordered or changed_since:
+            query = f"SELECT {column_list} FROM {source}"
+            if changed_since:
+                change_column = preparer.quote_identifier(CHANGE_COLUMN)
+                query += f" WHERE ({change_column} >= %s OR {change_column} IS NULL)"
+            if ordered:
+                query += " ORDER BY " + ', '.join(preparer.quote_identifier(column.name) for column in order_by)
+            source = f"({query})"
+        else:
+            source = f"{source} ({column_list})"
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            copy_sql = f"COPY {source} TO STDOUT"
+            if changed_since:
+                # COPY takes no parameters, so bind the time client-side
+                copy_sql = cursor.mogrify(copy_sql, (changed_since,)).decode('utf-8')
+            cursor.copy_expert(copy_sql, counter)
+        finally:
+            cursor.close()
+        return counter.rows, counter.checksum.hexdigest()
+
+    query = select(*selected)
+    if changed_since:
+        change_column = table.c[CHANGE_COLUMN]
+        query = query.where((change_column >= changed_since) | change_column.is_(None))
+    if ordered:
+        query = query.order_by(*order_by)
+    result = conn.execution_options(stream_results=True).execute(query)
+    for rows in result.partitions(FETCH_SIZE):
+        counter.write(''.join(
+            '\t'.join(encode_copy_value(value) for value in row) + '\n'
+            for row in rows
+        ))
+    return counter.rows, counter.checksum.hexdigest()
+
+def _snapshot_connection(engine, snapshot=None):
+    """
+    Open a connection inside a REPEATABLE READ transaction (on PostgreSQL).
+
+    Args:
+        snapshot (str, optional): Snapshot exported by another transaction
+                                  with pg_export_snapshot(), to read the same data
+    """
+    conn = engine.connect()
+    if engine.dialect.name == 'postgresql':
+        conn = conn.execution_options(isolation_level='REPEATABLE READ')
+    conn.begin()
+    if snapshot:
+        conn.exec_driver_sql("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+    return conn
+
+def run_jobs(func, items, jobs):
+    """Call func on every item using `jobs` worker threads; returns results in order."""
+    if jobs <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(func, items))
+
+def table_file(table_name):
+    return f"{table_name}.copy.gz"
+
+def keys_file(table_name):
+    return f"{table_name}.keys.gz"
+
+def _integer_key(table):
+    """The table's primary key column if it is a single integer, else None."""
+    primary_key = list(table.primary_key.columns)
+    if len(primary_key) != 1:
+        return None
+    try:
+        return primary_key[0] if primary_key[0].type.python_type is int else None
+    except NotImplementedError:
+        return None
+
+def dump_keys(conn, table, out):
+    """
+    Write the primary key of every row in a table, in key order.
+
+    A single integer key is written as ranges of consecutive ids (first and last, tab-separated),
+    which stays small however many rows there are; other keys are written
+    one row per line in COPY text format.
+
+    Returns:
+        tuple: (rows in the table, 'ranges' or 'keys')
+    """
+    primary_key = list(table.primary_key.columns)
+    result = conn.execution_options(stream_results=True).execute(
+        select(*primary_key).order_by(*primary_key)
+    )
+    rows = 0
+
+    if _integer_key(table) is None:
+        for partition in result.partitions(FETCH_SIZE):
+            rows += len(partition)
+            out.write(''.join(
+                '\t'.join(encode_copy_value(value) for value in row) + '\n'
+                for row in partition
+            ))
+        return rows, 'keys'
+
+    first = last = None
+    for partition in result.partitions(FETCH_SIZE):
+        rows += len(partition)
+        for (key,) in partition:
+            if last is not None and key == last + 1:
+                last = key
+                continue
+            if first is not None:
+                out.write(f"{first}\t{last}\n")
+            first = last = key
+    if first is not None:
+        out.write(f"{first}\t{last}\n")
+    return rows, 'ranges'
+
+def write_backup(engine, path):
+    """
+    Write every table's data to a gzip-compressed backup file.
+
+    All tables are read in one transaction (REPEATABLE READ on PostgreSQL) so
+    the backup is a consistent snapshot, in foreign key order so it can be
+    loaded back table by table.
+
+    Args:
+        engine: SQLAlchemy engine for the database to back up
+        path (str): Output file; written under a temporary name and renamed
+                    into place once complete
+
+    Returns:
+        dict: {table name: rows written}
+    """
+    metadata = MetaData()
+    metadata.reflect(bind=engine, only=lambda table_name, _: include_table(table_name))
+
+    counts = {}
+    partial_path = f"{path}.partial"
+    conn = engine.connect()
+    if engine.dialect.name == 'postgresql':
+        conn = conn.execution_options(isolation_level='REPEATABLE READ')
+
+    try:
+        with conn.begin(), gzip.open(partial_path, 'wt', encoding='utf-8', compresslevel=COMPRESS_LEVEL) as f:
+            f.write(f"-- Database Data Backup generated on {datetime.datetime.now()}\n")
+            f.write("-- One COPY block per table (tab-separated, \\N for NULL)\n\n")
+
+            f.write("-- Disable triggers during import\n")
+            f.write("SET session_replication_role = 'replica';\n\n")
+
+            for table in metadata.sorted_tables:
+                f.write(f"-- Table: {table.name}\n")
+                f.write(copy_statement(table.name, [column.name for column in table.columns],
+                                       conn.dialect.identifier_preparer))
+                counts[table.name], _ = dump_table(conn, table, f)
+                f.write("\\.\n")
+                f.write(f"-- {counts[table.name]} rows\n\n")
+                print(f"Backed up {counts[table.name]} rows from {table.name}")
+
+            f.write("-- Re-enable triggers\n")
+            f.write("SET session_replication_role = 'origin';\n")
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    finally:
+        conn.close()
+
+    os.replace(partial_path, path)
+    return counts
+
+def link_latest(backup_filename, latest_backup):
+    """
+    Point `latest_backup` at a finished backup without copying it.
 
-def backup_data():
-    """Backup all data from the database to a SQL file."""
+    Uses a hard link swapped in with an atomic rename, so readers never see a
+    half-written file; falls back to a copy where hard links aren't supported.
+    """
+    temporary_link = f"{latest_backup}.new"
+    if os.path.exists(temporary_link):
+        os.remove(temporary_link)
+    try:
+        os.link(backup_filename, temporary_link)
+    except OSError:
+        shutil.copy2(backup_filename, temporary_link)
+    os.replace(temporary_link, latest_backup)
+
+def write_directory_backup(engine, directory, jobs=BACKUP_JOBS, parent=None):
+    """
+    Write every table's data to its own compressed file, `jobs` tables at a time.
+
+    On PostgreSQL a leading transaction exports its snapshot and every worker
+    imports it, so all tables are read as of the same moment. Rows are sorted
+    by primary key so their checksums can be compared later.
+
+    Given the directory of an earlier backup, only the rows of tables with an
+    updated_at column that changed since that backup started are written,
+    along with every primary key in the table; other tables are written in full.
+
+    Args:
+        engine: SQLAlchemy engine for the database to back up
+        directory (str): Output directory; written under a temporary name and
+                         renamed into place once complete
+        jobs (int): Number of tables to dump at once
+        parent (str, optional): Earlier directory backup to write an increment of
+
+    Returns:
+        dict: The manifest written alongside the table files
+    """
+    metadata = MetaData()
+    metadata.reflect(bind=engine, only=lambda table_name, _: include_table(table_name))
+
+    since = None
+    if parent:
+        parent_manifest = read_manifest(parent)
+        since = (datetime.datetime.fromisoformat(parent_manifest['started_at'])
+                 - datetime.timedelta(seconds=INCREMENTAL_OVERLAP_SECONDS))
+
+    partial_directory = f"{directory}.partial"
+    os.makedirs(partial_directory)
+
+    # Rows stamped after this are picked up by the next increment
+    started_at = datetime.datetime.utcnow()
+    leader = _snapshot_connection(engine)
+    snapshot = None
+    if engine.dialect.name == 'postgresql' and jobs > 1:
+        snapshot = leader.exec_driver_sql("SELECT pg_export_snapshot()").scalar()
+    else:
+        # Only PostgreSQL can share one snapshot between connections
+        jobs = 1
+
+    local = threading.local()
+    connections = []
+    connections_lock = threading.Lock()
+
+    def worker_connection():
+        if jobs == 1:
+            return leader
+        if not hasattr(local, 'conn'):
+            local.conn = _snapshot_connection(engine, snapshot)
+            with connections_lock:
+                connections.append(local.conn)
+        return local.conn
+
+    def dump(table):
+        conn = worker_connection()
+        changed_since = since if since and CHANGE_COLUMN in table.c and table.primary_key else None
+        filename = table_file(table.name)
+        with gzip.open(os.path.join(partial_directory, filename), 'wt', encoding='utf-8',
+                       compresslevel=COMPRESS_LEVEL) as f:
+            rows, checksum = dump_table(conn, table, f, ordered=True, changed_since=changed_since)
+        entry = {
+            'table': table.name,
+            'file': filename,
+            'columns': [column.name for column in table.columns],
+            'mode': 'changes' if changed_since else 'full',
+            'rows': rows,
+            'total_rows': rows,
+            'sha256': checksum
+        }
+        if changed_since:
+            entry['keys_file'] = keys_file(table.name)
+            entry['key_columns'] = [column.name for column in table.primary_key.columns]
+            with gzip.open(os.path.join(partial_directory, entry['keys_file']), 'wt', encoding='utf-8',
+                           compresslevel=COMPRESS_LEVEL) as f:
+                entry['total_rows'], entry['key_format'] = dump_keys(conn, table, f)
+            print(f"Backed up {rows} changed rows from {table.name} ({entry['total_rows']} rows in table)")
+        else:
+            print(f"Backed up {rows} rows from {table.name}")
+        return entry
+
+    try:
+        entries = run_jobs(dump, metadata.sorted_tables, jobs)
+    except Exception:
+        shutil.rmtree(partial_directory, ignore_errors=True)
+        raise
+    finally:
+        for conn in connections + [leader]:
+            conn.close()
+
+    manifest = {
+        'created_at': datetime.datetime.now().isoformat(),
+        'started_at': started_at.isoformat(),
+        'type': 'incremental' if parent else 'full',
+        'parent': os.path.basename(os.path.realpath(parent)) if parent else None,
+        'since': since.isoformat() if since else None,
+        'dialect': engine.dialect.name,
+        'snapshot': snapshot,
+        'jobs': jobs,
+        # In foreign key order
+        'tables': entries
+    }
+    with open(os.path.join(partial_directory, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(partial_directory, directory)
+    return manifest
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+def backup_chain(directory):
+    """
+    The directory backups needed to restore `directory`, oldest first: the
+    full backup it builds on, then every increment up to and including it.
+
+    Returns:
+        list: (directory, manifest) pairs
+    """
+    chain = []
+    directory = os.path.realpath(directory)
+    while True:
+        manifest = read_manifest(directory)
+        chain.append((directory, manifest))
+        if manifest.get('type') != 'incremental':
+            break
+        directory = os.path.join(os.path.dirname(directory), manifest['parent'])
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"Backup {manifest['parent']} that {chain[-1][0]} builds on is missing")
+    chain.reverse()
+    return chain
+
+def count_keys(path, key_format):
+    """Rows listed in a keys file written by dump_keys."""
+    rows = 0
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if key_format == 'ranges':
+                first, last = line.split('\t')
+                rows += int(last) - int(first) + 1
+            else:
+                rows += 1
+    return rows
+
+def verify_backup(directory, engine=None):
+    """
+    Check a directory backup against its manifest.
+
+    Re-reads every table file and compares its row count and checksum with
+    the manifest. Given an engine, also reads each table from that database
+    (e.g. one just restored from the backup) and compares it the same way.
+    Checksums are only compared between databases of the same kind, since
+    PostgreSQL and SQLite write some values differently; row counts always are.
+    For tables an incremental backup only holds the changes of, the database
+    is checked against the number of rows the table had.
+
+    Returns:
+        list: Descriptions of any mismatches; empty if the backup checks out
+    """
+    manifest = read_manifest(directory)
+    problems = []
+
+    for entry in manifest['tables']:
+        counter = _RowCounter()
+        with gzip.open(os.path.join(directory, entry['file']), 'rt', encoding='utf-8') as f:
+            for chunk in iter(lambda: f.read(1 << 20), ''):
+                counter.write(chunk)
+        if counter.rows != entry['rows']:
+            problems.append(f"{entry['file']}: file has {counter.rows} rows, manifest says {entry['rows']}")
+        elif counter.checksum.hexdigest() != entry['sha256']:
+            problems.append(f"{entry['file']}: checksum doesn't match the manifest")
+        if entry.get('mode') == 'changes':
+            keys = count_keys(os.path.join(directory, entry['keys_file']), entry['key_format'])
+            if keys != entry['total_rows']:
+                problems.append(f"{entry['keys_file']}: file has {keys} keys, manifest says {entry['total_rows']}")
+
+    if engine is not None:
+        metadata = MetaData()
+        metadata.reflect(bind=engine, only=[entry['table'] for entry in manifest['tables']])
+        compare_checksums = engine.dialect.name == manifest['dialect']
+        conn = _snapshot_connection(engine)
+        try:
+            for entry in manifest['tables']:
+                table = metadata.tables[entry['table']]
+                if entry.get('mode') == 'changes':
+                    rows = conn.execute(select(func.count()).select_from(table)).scalar()
+                    if rows != entry['total_rows']:
+                        problems.append(f"{entry['table']}: database has {rows} rows, backup has {entry['total_rows']}")
+                    continue
+                rows, checksum = dump_table(conn, table, None, ordered=True, columns=entry['columns'])
+                if rows != entry['rows']:
+                    problems.append(f"{entry['table']}: database has {rows} rows, backup has {entry['rows']}")
+                elif compare_checksums and checksum != entry['sha256']:
+                    problems.append(f"{entry['table']}: database rows differ from the backup")
+        finally:
+            conn.close()
+
+    return problems
+
+def link_latest_directory(directory, latest_link):
+    """Point the `latest_link` symlink at a finished directory backup, swapping it atomically."""
+    temporary_link = f"{latest_link}.new"
+    if os.path.lexists(temporary_link):
+        os.remove(temporary_link)
+    os.symlink(os.path.basename(directory), temporary_link)
+    os.replace(temporary_link, latest_link)
+
+def backup_data(backup_dir=BACKUP_DIR, database_url=None, jobs=1, verify=False,
+                directory=False, incremental=False):
+    """
+    Backup all data from the database.
+
+    Args:
+        backup_dir (str): Directory to write the backup to
+        database_url (str, optional): Database to back up (defaults to DATABASE_URL)
+        jobs (int): Tables to dump at once; above 1 writes a directory backup
+        verify (bool): Check a directory backup's files against its manifest
+        directory (bool): Write a directory backup even with one job
+        incremental (bool): Only write the rows changed since the latest
+                            directory backup in `backup_dir`
+
+    Returns:
+        str: Path of the backup file or directory
+    """
     # Get database connection from environment
-    database_url = os.environ.get('DATABASE_URL')
+    database_url = database_url or os.environ.get('DATABASE_URL')
     if not database_url:
         print("Error: DATABASE_URL environment variable not set")
         sys.exit(1)
-    
+
     # Create the backup directory if it doesn't exist
-    backup_dir = 'db_backups'
     os.makedirs(backup_dir, exist_ok=True)
-    
+
+    latest_directory = f"{backup_dir}/{LATEST_DIRECTORY_BACKUP}"
+    parent = None
+    if incremental:
+        if not os.path.isdir(latest_directory):
+            print(f"Error: no directory backup in {backup_dir} to base an incremental backup on; "
+                  "take one first with --directory or --jobs")
+            sys.exit(1)
+        parent = os.path.realpath(latest_directory)
+    directory = directory or incremental or jobs > 1
+
     # Filename with timestamp
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_filename = f"{backup_dir}/data_backup_{timestamp}.sql"
-    latest_backup = f"{backup_dir}/latest_data_backup.sql"
-    
-    # Connect to database
-    engine = create_engine(database_url)
-    metadata = MetaData()
-    metadata.reflect(bind=engine)
-    
-    # Open the file for writing
-    with open(backup_filename, 'w') as f:
-        f.write(f"-- Database Data Backup generated on {datetime.datetime.now()}\n")
-        f.write("-- This file contains INSERT statements for all data\n\n")
-        
-        f.write("-- Disable triggers during import\n")
-        f.write("SET session_replication_role = 'replica';\n\n")
-        
-        # For each table
-        inspector = inspect(engine)
-        for table_name in inspector.get_table_names():
-            if table_name == 'alembic_version':
-                continue  # Skip migration tracking tables
-                
-            table = Table(table_name, metadata, autoload_with=engine)
-            
-            # Get the number of rows
-            with engine.connect() as conn:
-                result = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}"))
-                count = result.scalar()
-            
-            if count == 0:
-                continue  # Skip empty tables
-                
-            print(f"Backing up {count} rows from {table_name}")
-            f.write(f"-- Table: {table_name}\n")
-            f.write(f"-- {count} rows\n")
-            
-            # Get column names
-            columns = [column.name for column in table.columns]
-            column_list = ", ".join(columns)
-            
-            # Get all rows
-            with engine.connect() as conn:
-                # Fetch column names from result proxy
-                result = conn.execute(text(f"SELECT * FROM {table_name}"))
-                column_names = result.keys()
-                rows = result.fetchall()
-                
-                for row in rows:
-                    # Create value list with proper SQL escaping
-                    values = []
-                    row_dict = dict(zip(column_names, row))
-                    
-                    for column_name in columns:
-                        value = row_dict.get(column_name)
-                        if value is None:
-                            values.append("NULL")
-                        elif isinstance(value, (int, float)):
-                            values.append(str(value))
-                        elif isinstance(value, datetime.datetime):
-                            values.append(f"'{value.isoformat()}'")
-                        elif isinstance(value, bool):
-                            values.append("TRUE" if value else "FALSE")
-                        else:
-                            # Escape single quotes in string values
-                            escaped_value = str(value).replace("'", "''")
-                            values.append(f"'{escaped_value}'")
-                    
-                    value_list = ", ".join(values)
-                    
-                    # Write INSERT statement
-                    f.write(f"INSERT INTO {table_name} ({column_list}) VALUES ({value_list});\n")
-            
-            f.write("\n")
-            
-        f.write("-- Re-enable triggers\n")
-        f.write("SET session_replication_role = 'origin';\n")
-    
-    # Create a copy as latest_data_backup.sql
-    with open(backup_filename, 'r') as src:
-        with open(latest_backup, 'w') as dst:
-            dst.write(src.read())
-    
-    print(f"Database data backed up to {backup_filename}")
+
+    engine = create_engine(database_url, pool_size=max(jobs, 1) + 1)
+    try:
+        if directory:
+            backup_path = f"{backup_dir}/data_backup_{timestamp}"
+            if incremental:
+                backup_path += "_incremental"
+            manifest = write_directory_backup(engine, backup_path, jobs, parent=parent)
+            total_rows = sum(entry['rows'] for entry in manifest['tables'])
+            latest_backup = latest_directory
+            link_latest_directory(backup_path, latest_backup)
+        else:
+            backup_path = f"{backup_dir}/data_backup_{timestamp}.sql.gz"
+            total_rows = sum(write_backup(engine, backup_path).values())
+            latest_backup = f"{backup_dir}/{LATEST_BACKUP}"
+            link_latest(backup_path, latest_backup)
+    finally:
+        engine.dispose()
+
+    print(f"Database data backed up to {backup_path} ({total_rows} rows)")
     print(f"Latest backup also available at {latest_backup}")
-    return backup_filename
+
+    if verify and directory:
+        problems = verify_backup(backup_path)
+        for problem in problems:
+            print(f"Verification failed: {problem}")
+        if problems:
+            sys.exit(1)
+        print("Verified row counts and checksums of every table file")
+
+    return backup_path
+
+def main():
+    """Parse arguments and back up the data."""
+    parser = argparse.ArgumentParser(description='Backup database data to compressed SQL.')
+    parser.add_argument('--dir', default=BACKUP_DIR, help='Directory to write the backup to')
+    parser.add_argument('--jobs', type=int, default=BACKUP_JOBS,
+                        help='Dump this many tables at once from one snapshot (writes a directory backup)')
+    parser.add_argument('--verify', action='store_true',
+                        help='Check the written table files against the manifest (directory backups)')
+    parser.add_argument('--directory', action='store_true',
+                        help='Write a directory backup even with one job')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only back up rows changed since the latest directory backup')
+    args = parser.parse_args()
+
+    backup_data(backup_dir=args.dir, jobs=args.jobs, verify=args.verify,
+                directory=args.directory, incremental=args.incremental)
 
 if __name__ == "__main__":
-    backup_data()
\ No newline at end of file
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark for payment-to-fee allocation.
+Allocates a synthetic reconciliation batch of exact, lump-sum, part and
+slightly-off payments against each property's unpaid fees, reporting
+throughput and how the payments were allocated.
+"""
+import time
+import random
+import argparse
+
+import allocation
+
+def build_data(properties, fees_per_property, seed=1):
+    rng = random.Random(seed)
+    batches = []
+    for property_id in range(properties):
+        levy = rng.choice([18000, 25000, 31250, 42075])
+        fees = [(property_id * 1000 + i, levy) for i in range(fees_per_property)]
+
+        kind = rng.choice(['exact', 'lump', 'part', 'close', 'mixed'])
+        if kind == 'exact':
+            payments = [(0, levy)]
+        elif kind == 'lump':
+            payments = [(0, levy * rng.randint(2, fees_per_property))]
+        elif kind == 'part':
+            payments = [(0, rng.randint(1000, levy - 1))]
+        elif kind == 'close':
+            payments = [(0, levy + rng.randint(-levy // 25, levy // 25))]
+        else:
+            payments = [(0, levy), (1, levy * 2), (2, rng.randint(1000, levy))]
+        batches.append((kind, payments, fees))
+    return batches
+
+def run_benchmark(properties, fees_per_property):
+    batches = build_data(properties, fees_per_property)
+    payment_count = sum(len(payments) for _, payments, _ in batches)
+    fee_count = properties * fees_per_property
+
+    start = time.perf_counter()
+    split = fully_allocated = 0
+    for kind, payments, fees in batches:
+        allocations = allocation.allocate_property(payments, fees)
+        for key, cents in payments:
+            allocated = allocations.get(key, [])
+            if len(allocated) > 1:
+                split += 1
+            if sum(fee_cents for _, fee_cents in allocated) == cents:
+                fully_allocated += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"Allocated {payment_count} payments against {fee_count} fees in {elapsed:.3f} s "
+          f"({elapsed / payment_count * 1e6:.0f} us/payment)")
+    print(f"Fully allocated {fully_allocated}, split across several fees {split}")
+    return elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark payment-to-fee allocation.')
+    parser.add_argument('--properties', type=int, default=2000, help='Number of properties in the batch')
+    parser.add_argument('--fees', type=int, default=8, help='Unpaid fees per property')
+    args = parser.parse_args()
+    run_benchmark(args.properties, args.fees)
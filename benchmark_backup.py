@@ -0,0 +1,108 @@
+"""
+Benchmark for the streaming data backup and restore.
+Adds a large synthetic ActivityLog and Payment history to the database in
+DATABASE_URL, backs it up with backup_db_data.py, restores the backup into an
+empty SQLite database with restore_db_data.py and reports throughput,
+compressed size and peak memory. Run it against a scratch database; the
+synthetic rows are deleted again afterwards unless --keep is given.
+"""
+import os
+import time
+import random
+import resource
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+
+from app import app, db
+from models import ActivityLog, Payment
+import backup_db_data
+import restore_db_data
+
+INSERT_BATCH_SIZE = 10000
+BENCHMARK_EVENT = 'benchmark'
+BENCHMARK_REFERENCE = 'BENCH'
+
+def _peak_memory_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def populate(rows, seed=1):
+    """Insert `rows` activity log entries and `rows` payments in batches."""
+    rng = random.Random(seed)
+    start_date = datetime(2015, 1, 1)
+
+    for offset in range(0, rows, INSERT_BATCH_SIZE):
+        count = min(INSERT_BATCH_SIZE, rows - offset)
+        db.session.execute(insert(ActivityLog), [
+            {
+                'timestamp': start_date + timedelta(minutes=offset + i),
+                'event_type': BENCHMARK_EVENT,
+                'description': f"Payment of ${rng.randint(100, 900)}.00 reconciled to property Unit {rng.randint(1, 200)}",
+                'related_object_type': 'Payment',
+                'related_object_id': offset + i
+            }
+            for i in range(count)
+        ])
+        db.session.execute(insert(Payment), [
+            {
+                'amount': rng.randint(10000, 90000) / 100,
+                'date': start_date + timedelta(hours=offset + i),
+                'description': f"DEPOSIT UNIT {rng.randint(1, 200)} STRATA LEVY; Q{rng.randint(1, 4)}\ttab",
+                'reference': f"{BENCHMARK_REFERENCE}{offset + i:09d}",
+                'reconciled': True,
+                'confirmed': True,
+                'is_duplicate': False,
+                'created_at': start_date + timedelta(hours=offset + i)
+            }
+            for i in range(count)
+        ])
+        db.session.commit()
+
+def cleanup():
+    ActivityLog.query.filter(ActivityLog.event_type == BENCHMARK_EVENT).delete(synchronize_session=False)
+    Payment.query.filter(Payment.reference.like(f"{BENCHMARK_REFERENCE}%")).delete(synchronize_session=False)
+    db.session.commit()
+
+def run_benchmark(rows, keep=False):
+    with app.app_context():
+        start = time.perf_counter()
+        populate(rows)
+        print(f"Inserted {rows:,} activity log entries and {rows:,} payments in {time.perf_counter() - start:.1f} s")
+
+        memory_before = _peak_memory_mb()
+        try:
+            with tempfile.TemporaryDirectory() as backup_dir:
+                path = os.path.join(backup_dir, 'benchmark_backup.sql.gz')
+                start = time.perf_counter()
+                counts = backup_db_data.write_backup(db.engine, path)
+                elapsed = time.perf_counter() - start
+                size = os.path.getsize(path)
+
+                restore_engine = create_engine(f"sqlite:///{os.path.join(backup_dir, 'restore.db')}")
+                db.metadata.create_all(restore_engine)
+                start = time.perf_counter()
+                with restore_engine.begin() as conn, restore_db_data.open_backup(path) as f:
+                    restore_db_data.restore_stream(conn, f)
+                restore_elapsed = time.perf_counter() - start
+                restore_engine.dispose()
+        finally:
+            if not keep:
+                cleanup()
+
+        total = sum(counts.values())
+        print(f"Backed up {total:,} rows in {elapsed:.1f} s ({total / elapsed:,.0f} rows/s)")
+        print(f"Compressed backup {size / 1024 / 1024:.1f} MB")
+        print(f"Restored {total:,} rows into SQLite in {restore_elapsed:.1f} s ({total / restore_elapsed:,.0f} rows/s)")
+        print(f"Peak memory {_peak_memory_mb():.0f} MB (was {memory_before:.0f} MB before the backup)")
+        return elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the streaming data backup and restore.')
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='Synthetic activity log entries and payments to add (each)')
+    parser.add_argument('--keep', action='store_true', help='Keep the synthetic rows afterwards')
+    args = parser.parse_args()
+    run_benchmark(args.rows, keep=args.keep)
@@ -0,0 +1,110 @@
+"""
+Query count check for the contact directory.
+Adds synthetic contacts to the database in DATABASE_URL (linked to the
+existing properties as owners and managers, with some unlinked) and counts
+the SQL statements behind /api/contacts and the admin /contacts page at each
+size. The count must not grow with the number of contacts; the script exits
+with an error if it does. Run it against a scratch database with some
+properties in it, e.g. from seed_data.py; the synthetic contacts and the
+load test admin user are deleted again afterwards.
+"""
+import sys
+import time
+import argparse
+
+from sqlalchemy import event, insert
+
+from app import app, db
+import main  # Registers the routes
+from models import Contact, ContactProperty, Property
+from benchmark_load import login_token, remove_user
+
+BENCHMARK_NOTE = 'benchmark_contacts'
+PATHS = ['/api/contacts', '/contacts']
+
+def populate(count, start):
+    """Add contacts numbered from `start` up to `count`, linking most of them to a property."""
+    property_ids = [property_id for property_id, in db.session.query(Property.id).order_by(Property.id)]
+    if not property_ids:
+        raise SystemExit("The database has no properties; seed it first")
+
+    for i in range(start, count):
+        contact = Contact(name=f"Benchmark Contact {i}", email=f"contact{i}@example.com",
+                          phone=f"0400 {i:06d}", notes=BENCHMARK_NOTE, emergency_contact=i % 50 == 0)
+        db.session.add(contact)
+        db.session.flush()
+        # Every tenth contact has no property
+        if i % 10:
+            relationship_type = 'manager' if i % 3 == 0 else 'owner'
+            db.session.execute(insert(ContactProperty), [{
+                'contact_id': contact.id,
+                'property_id': property_ids[i % len(property_ids)],
+                'relationship_type': relationship_type,
+            }])
+    db.session.commit()
+
+def remove_contacts():
+    contact_ids = db.session.query(Contact.id).filter(Contact.notes == BENCHMARK_NOTE)
+    ContactProperty.query.filter(ContactProperty.contact_id.in_(contact_ids)).delete(synchronize_session=False)
+    Contact.query.filter(Contact.notes == BENCHMARK_NOTE).delete(synchronize_session=False)
+    db.session.commit()
+
+def count_queries(client, path):
+    """
+    Request `path` once and count the SQL statements it ran.
+
+    Returns:
+        tuple: (statements, milliseconds)
+    """
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', on_execute)
+    try:
+        start = time.perf_counter()
+        response = client.get(path)
+        elapsed = (time.perf_counter() - start) * 1000
+    finally:
+        event.remove(engine, 'before_cursor_execute', on_execute)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {path} returned {response.status_code}")
+    return len(statements), elapsed
+
+def run_check(sizes):
+    client = app.test_client()
+    results = {path: [] for path in PATHS}
+    try:
+        client.get(f"/verify_login?token={login_token()}")
+        created = 0
+        for size in sorted(sizes):
+            with app.app_context():
+                populate(size, created)
+            created = size
+            for path in PATHS:
+                # The first request also loads the user and settings caches
+                client.get(path)
+                queries, elapsed = count_queries(client, path)
+                results[path].append(queries)
+                print(f"{size:>6} contacts  {path:<14} {queries:>3} queries  {elapsed:>8.1f} ms")
+    finally:
+        with app.app_context():
+            remove_contacts()
+        remove_user()
+
+    growing = [path for path, counts in results.items() if len(set(counts)) > 1]
+    if growing:
+        print(f"Query count grows with the number of contacts: {', '.join(growing)}")
+        return False
+    print("Query count is constant")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check the contact directory query count.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000],
+                        help='Numbers of synthetic contacts to check')
+    args = parser.parse_args()
+    sys.exit(0 if run_check(args.sizes) else 1)
@@ -0,0 +1,45 @@
+"""
+Benchmark for email template rendering.
+Renders a batch of fee notifications through the shared email template
+environment and reports throughput.
+"""
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import email_templates
+
+def run_benchmark(count=10000):
+    """Render `count` fee notifications and print timing information."""
+    start = time.perf_counter()
+    loaded = email_templates.precompile()
+    compile_time = time.perf_counter() - start
+    print(f"Precompiled {loaded} templates in {compile_time * 1000:.1f} ms")
+
+    due_date = datetime.now() + timedelta(days=30)
+    start = time.perf_counter()
+    total_bytes = 0
+
+    for i in range(count):
+        text_content, html_content = email_templates.render(
+            'fee_notification',
+            contact_name=f"Owner {i}",
+            unit_number=str(i % 500 + 1),
+            amount=250.0 + i % 7,
+            fee_type="Billing Period",
+            description="Strata fee for Q3 2025",
+            due_date=due_date
+        )
+        total_bytes += len(text_content) + len(html_content)
+
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {count} messages in {elapsed:.3f} s "
+          f"({count / elapsed:,.0f} messages/s, {elapsed / count * 1e6:.1f} us/message, "
+          f"{total_bytes / count:.0f} bytes/message)")
+    return elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark email template rendering.')
+    parser.add_argument('--count', type=int, default=10000, help='Number of messages to render')
+    args = parser.parse_args()
+    run_benchmark(args.count)
@@ -0,0 +1,176 @@
+"""
+Load test for the production server configurations.
+Starts gunicorn with gunicorn.conf.py under each worker configuration (sync,
+gthread, gthread without preload), logs in as an admin and requests the
+dashboard and /api/properties from concurrent keep-alive clients, reporting
+requests per second and latency for each. Run it against a scratch database
+with some data in it, e.g. from seed_data.py; it adds a load test admin user
+and removes it again afterwards.
+"""
+import os
+import sys
+import time
+import socket
+import signal
+import argparse
+import statistics
+import threading
+import subprocess
+import http.client
+
+from app import app, db
+from models import User
+
+CONFIGURATIONS = {
+    'sync': {'GUNICORN_WORKER_CLASS': 'sync', 'GUNICORN_PRELOAD': '1'},
+    'gthread': {'GUNICORN_WORKER_CLASS': 'gthread', 'GUNICORN_PRELOAD': '1'},
+    'gthread-no-preload': {'GUNICORN_WORKER_CLASS': 'gthread', 'GUNICORN_PRELOAD': '0'},
+}
+PATHS = ['/', '/api/properties']
+LOAD_TEST_EMAIL = 'loadtest@example.com'
+STARTUP_TIMEOUT = 60
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def login_token():
+    """Issue a magic link token for the load test admin, creating the user if needed."""
+    with app.app_context():
+        user = User.query.filter_by(email=LOAD_TEST_EMAIL).first()
+        if user is None:
+            user = User(email=LOAD_TEST_EMAIL, role='admin')
+            db.session.add(user)
+        token = user.generate_login_token()
+        db.session.commit()
+        return token
+
+def remove_user():
+    with app.app_context():
+        User.query.filter_by(email=LOAD_TEST_EMAIL).delete()
+        db.session.commit()
+
+def start_server(port, overrides, workers, threads):
+    """Start gunicorn and wait until it accepts connections."""
+    env = dict(os.environ, GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_ACCESS_LOG='',
+               GUNICORN_WORKERS=str(workers), GUNICORN_THREADS=str(threads), **overrides)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    start = time.perf_counter()
+    while time.perf_counter() - start < STARTUP_TIMEOUT:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, time.perf_counter() - start
+        except OSError:
+            time.sleep(0.1)
+    stop_server(process)
+    raise RuntimeError("gunicorn didn't start in time")
+
+def stop_server(process):
+    """Shut gunicorn down gracefully."""
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=35)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def session_cookie(port):
+    """Log in through the magic link and return the session cookie."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('GET', f"/verify_login?token={login_token()}")
+        response = conn.getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie')
+    finally:
+        conn.close()
+    if not cookie:
+        raise RuntimeError("Logging in didn't set a session cookie")
+    return cookie.split(';')[0]
+
+def run_load(port, path, cookie, concurrency, duration):
+    """
+    Request `path` from `concurrency` clients for `duration` seconds.
+
+    Returns:
+        tuple: (successful requests, failed requests, latencies in seconds)
+    """
+    deadline = time.perf_counter() + duration
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        ok_times = []
+        failed = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Cookie': cookie})
+                response = conn.getresponse()
+                response.read()
+                if response.status == 200:
+                    ok_times.append(time.perf_counter() - start)
+                else:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.close()
+        with lock:
+            latencies.extend(ok_times)
+            failures.append(failed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies), sum(failures), latencies
+
+def run_benchmark(configurations, concurrency, duration, workers, threads):
+    print(f"{concurrency} concurrent clients, {duration} s per endpoint, "
+          f"{workers} workers ({threads} threads each for gthread)")
+    try:
+        for name in configurations:
+            port = _free_port()
+            process, startup = start_server(port, CONFIGURATIONS[name], workers, threads)
+            try:
+                cookie = session_cookie(port)
+                print(f"{name}: ready in {startup:.1f} s")
+                for path in PATHS:
+                    # Warm up every worker's pool and template cache first
+                    run_load(port, path, cookie, concurrency, 1)
+                    ok, failed, latencies = run_load(port, path, cookie, concurrency, duration)
+                    if not latencies:
+                        print(f"  {path:<16} no successful requests ({failed} failed)")
+                        continue
+                    latencies.sort()
+                    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+                    print(f"  {path:<16} {ok / duration:>8,.0f} req/s  "
+                          f"p50 {statistics.median(latencies) * 1000:>6.1f} ms  "
+                          f"p95 {p95 * 1000:>6.1f} ms  {failed} failed")
+            finally:
+                stop_server(process)
+    finally:
+        remove_user()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test the gunicorn configurations.')
+    parser.add_argument('--config', action='append', choices=sorted(CONFIGURATIONS),
+                        help='Configuration to test (repeatable; default: all)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per endpoint')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per gthread worker')
+    args = parser.parse_args()
+    run_benchmark(args.config or list(CONFIGURATIONS), args.concurrency, args.duration,
+                  args.workers, args.threads)
@@ -0,0 +1,94 @@
+"""
+Benchmark for owner-name matching.
+Builds the fuzzy owner-name index over synthetic owners (some with middle
+names) and matches a batch of transaction descriptions with typos and
+initials, and without the middle names, reporting throughput and accuracy.
+"""
+import time
+import random
+import argparse
+
+import fuzzy_match
+
+FIRST_NAMES = ['john', 'jane', 'michael', 'sarah', 'david', 'emma', 'peter', 'olivia', 'james', 'mia',
+               'robert', 'chloe', 'william', 'grace', 'thomas', 'ruby', 'daniel', 'zoe', 'matthew', 'lily']
+SURNAME_SUFFIXES = ['', 'son', 'ton', 'ley', 'er']
+MIDDLE_NAMES = ['anne', 'louise', 'paul', 'lee', 'marie', 'john']
+# Share of owners with a middle name, which transactions leave out
+MIDDLE_NAME_RATE = 0.2
+LAST_NAMES = ['smith', 'nguyen', 'williams', 'brown', 'jones', 'taylor', 'wilson', 'johnson', 'white',
+              'martin', 'anderson', 'thompson', 'walker', 'harris', 'lee', 'ryan', 'robinson', 'kelly',
+              'king', 'campbell', 'clarke', 'mitchell', 'young', 'wright', 'scott', 'morris', 'hughes']
+
+def _typo(word, rng):
+    """Swap two adjacent letters somewhere in the word."""
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+def build_data(owners, transactions, seed=1):
+    rng = random.Random(seed)
+    names = {}
+    used = set()
+    for property_id in range(1, owners + 1):
+        while True:
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}{rng.choice(SURNAME_SUFFIXES)}"
+            if name not in used:
+                used.add(name)
+                break
+        if rng.random() < MIDDLE_NAME_RATE:
+            first, last = name.split()
+            name = f"{first} {rng.choice(MIDDLE_NAMES)} {last}"
+        names[property_id] = name.title()
+
+    samples = []
+    for _ in range(transactions):
+        property_id = rng.randint(1, owners)
+        first, *_, last = names[property_id].lower().split()
+        style = rng.random()
+        if style < 0.3:
+            text = f"TFR {first} {last} strata levy"
+        elif style < 0.6:
+            text = f"{first[0]} {last} q3 levy"
+        else:
+            text = f"payment from {first} {_typo(last, rng)}"
+        samples.append((text.upper(), property_id))
+    return names, samples
+
+def run_benchmark(owners=2000, transactions=2000):
+    """Index `owners` names and match `transactions` descriptions against them."""
+    names, samples = build_data(owners, transactions)
+
+    start = time.perf_counter()
+    index = fuzzy_match.OwnerNameIndex(names)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    correct = wrong = unmatched = 0
+    for text, property_id in samples:
+        matched_id, confidence = index.best_match(text.lower())
+        if matched_id is None:
+            unmatched += 1
+        elif matched_id == property_id:
+            correct += 1
+        else:
+            wrong += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"Indexed {len(index.owners)} owners in {build_time * 1000:.1f} ms")
+    print(f"Matched {transactions} transactions in {elapsed:.3f} s "
+          f"({elapsed / transactions * 1e6:.0f} us/transaction)")
+    print(f"Correct {correct}, wrong {wrong}, left for review {unmatched}")
+    return elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark fuzzy owner-name matching.')
+    parser.add_argument('--owners', type=int, default=2000, help='Number of owners to index')
+    parser.add_argument('--transactions', type=int, default=2000, help='Number of transactions to match')
+    args = parser.parse_args()
+    # Leave headroom so drawing unique names stays quick
+    max_owners = len(FIRST_NAMES) * len(LAST_NAMES) * len(SURNAME_SUFFIXES) * 4 // 5
+    if args.owners > max_owners:
+        parser.error(f"--owners can be at most {max_owners} with the built-in name lists")
+    run_benchmark(args.owners, args.transactions)
@@ -0,0 +1,59 @@
+"""
+Benchmark for the response cache.
+Logs in as an admin and times the dashboard, a property page and the activity
+log when every request renders the page (cache cleared first) and when it is
+served from the cache. Run it against a scratch database with some data in
+it, e.g. from seed_data.py; it adds a benchmark admin user and removes it
+again afterwards.
+"""
+import time
+import argparse
+import statistics
+
+from app import app, db
+import main  # Registers the routes
+from models import Property
+import response_cache
+from benchmark_load import login_token, remove_user
+
+def timed_requests(client, path, requests, cold):
+    """Latencies in milliseconds of `requests` GETs of `path`."""
+    latencies = []
+    for _ in range(requests):
+        if cold:
+            response_cache.clear()
+        start = time.perf_counter()
+        response = client.get(path)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+    return latencies
+
+def run_benchmark(requests):
+    if not response_cache.RESPONSE_CACHE_SIZE:
+        raise SystemExit("RESPONSE_CACHE_SIZE is 0; the cache is turned off")
+    with app.app_context():
+        property_id = db.session.query(db.func.min(Property.id)).scalar()
+    paths = ['/', '/activity'] + ([f"/property/{property_id}"] if property_id else [])
+
+    client = app.test_client()
+    try:
+        client.get(f"/verify_login?token={login_token()}")
+        # Show the login flash message, so later pages can be cached
+        client.get('/')
+        print(f"{requests} requests per page")
+        for path in paths:
+            rendered = timed_requests(client, path, requests, cold=True)
+            cached = timed_requests(client, path, requests, cold=False)
+            print(f"  {path:<16} rendered {statistics.median(rendered):>8.1f} ms  "
+                  f"cached {statistics.median(cached):>6.2f} ms  "
+                  f"({statistics.median(rendered) / statistics.median(cached):,.0f}x)")
+        print(f"Cache: {response_cache.status()['counts']}")
+    finally:
+        remove_user()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the response cache.')
+    parser.add_argument('--requests', type=int, default=20, help='Requests per page and mode')
+    args = parser.parse_args()
+    run_benchmark(args.requests)
@@ -0,0 +1,72 @@
+"""
+Benchmark for session backends.
+Stores a reconciliation-sized list of transactions in the session and
+reports the Cookie header size and request latency for cookie, database and
+filesystem sessions.
+"""
+import time
+import argparse
+import tempfile
+from datetime import datetime
+
+from flask import session, jsonify
+from flask.sessions import SecureCookieSessionInterface
+
+from app import app
+import session_store
+
+@app.route('/_benchmark/session/fill/<int:rows>')
+def benchmark_session_fill(rows):
+    session['user_id'] = 1
+    session['user_role'] = 'admin'
+    session['pending_transactions'] = [
+        {
+            'date': datetime(2025, 1, 1 + i % 28).isoformat(),
+            'amount': 250.0 + i,
+            'description': f"DEPOSIT UNIT {i % 50 + 1} STRATA LEVY REF{i:06d}",
+            'reference': f"REF{i:06d}"
+        }
+        for i in range(rows)
+    ]
+    return jsonify(stored=rows)
+
+@app.route('/_benchmark/session/read')
+def benchmark_session_read():
+    return jsonify(rows=len(session.get('pending_transactions', [])))
+
+def run_backend(name, interface, rows, requests):
+    """Fill the session through one backend, then time `requests` reads."""
+    app.session_interface = interface
+    client = app.test_client()
+    client.get(f'/_benchmark/session/fill/{rows}')
+
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    header_bytes = len(cookie.value) if cookie else 0
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get('/_benchmark/session/read')
+    elapsed = time.perf_counter() - start
+
+    rows_read = response.get_json()['rows']
+    note = "" if rows_read == rows else f"  (session lost: read {rows_read} rows)"
+    over = "  (over the 4 KB cookie limit)" if header_bytes > 4093 else ""
+    print(f"{name:<12} cookie {header_bytes:>7,} bytes{over}  "
+          f"{elapsed / requests * 1000:.2f} ms/request{note}")
+
+def run_benchmark(rows=200, requests=500):
+    """Compare the session backends for a session holding `rows` transactions."""
+    print(f"Session with {rows} transactions, {requests} requests per backend")
+    run_backend('cookie', SecureCookieSessionInterface(), rows, requests)
+    with app.app_context():
+        run_backend('database', session_store.ServerSideSessionInterface(
+            session_store.DatabaseSessionStore()), rows, requests)
+    run_backend('filesystem', session_store.ServerSideSessionInterface(
+        session_store.FilesystemSessionStore(tempfile.mkdtemp(prefix='stratahub_sessions_'))), rows, requests)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark session backends.')
+    parser.add_argument('--rows', type=int, default=200, help='Transactions to store in the session')
+    parser.add_argument('--requests', type=int, default=500, help='Requests to time per backend')
+    args = parser.parse_args()
+    run_benchmark(args.rows, args.requests)
@@ -0,0 +1,83 @@
+"""
+Benchmark for application cold start.
+Imports main.py in fresh interpreters under `python -X importtime`, with and
+without AUTO_CREATE_SCHEMA, and reports the time to boot, the slowest
+imports and whether any heavy module (pandas, numpy) was loaded at startup.
+With --max-ms it exits non-zero when the fast startup mode takes longer than
+the budget or loads a heavy module, so it can run as a check in CI.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+# Modules only some requests need; importing them at startup is a regression
+HEAVY_MODULES = ('pandas', 'numpy', 'email_templates')
+
+def import_main(auto_create_schema):
+    """
+    Import main.py in a new interpreter.
+
+    Returns:
+        tuple: (wall-clock seconds, {main and its direct imports: cumulative
+                import microseconds}, set of every module imported)
+    """
+    env = dict(os.environ, AUTO_CREATE_SCHEMA='1' if auto_create_schema else '0')
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True
+    )
+    elapsed = time.perf_counter() - start
+
+    modules = {}
+    imported = set()
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imported.add(name.strip())
+        # Nesting is shown by two spaces per level; keep main and what it imports directly
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            modules[name.strip()] = modules.get(name.strip(), 0) + int(cumulative)
+    return elapsed, modules, imported
+
+def run_benchmark(runs, max_ms=None):
+    results = {}
+    for auto_create_schema in (True, False):
+        timings = []
+        for _ in range(runs):
+            elapsed, modules, imported = import_main(auto_create_schema)
+            timings.append(elapsed)
+        results[auto_create_schema] = (statistics.median(timings), modules, imported)
+
+    for auto_create_schema, (elapsed, _, _) in results.items():
+        print(f"AUTO_CREATE_SCHEMA={int(auto_create_schema)}: started in {elapsed * 1000:.0f} ms (median of {runs})")
+
+    elapsed, modules, imported = results[False]
+    print("Slowest imports with AUTO_CREATE_SCHEMA=0:")
+    for name, microseconds in sorted(modules.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {name:<30} {microseconds / 1000:>8.1f} ms")
+
+    heavy = sorted(name for name in imported if name in HEAVY_MODULES)
+    if heavy:
+        print(f"Heavy modules imported at startup: {', '.join(heavy)}")
+
+    if max_ms is not None and (elapsed * 1000 > max_ms or heavy):
+        print(f"Startup exceeds the budget of {max_ms:.0f} ms or loads heavy modules")
+        return False
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark application cold start.')
+    parser.add_argument('--runs', type=int, default=5, help='Interpreters started per mode')
+    parser.add_argument('--max-ms', type=float,
+                        help='Fail if the fast startup mode takes longer than this or imports heavy modules')
+    args = parser.parse_args()
+    if not run_benchmark(args.runs, args.max_ms):
+        sys.exit(1)
@@ -0,0 +1,111 @@
+"""
+Change tracking for StrataHub application.
+Every commit through the ORM session bumps a generation token for each table
+it wrote to. Caches remember the tokens they were filled under and drop
+entries once a token moves on, so they see writes made by other workers.
+
+    RESPONSE_CACHE_DIR    directory the tokens are kept in, so gunicorn
+                          workers see each other's writes (default: memory
+                          only; with more than one worker gunicorn.conf.py
+                          sets one on tmpfs)
+
+Writes made outside the ORM session (raw SQL, or processes without
+RESPONSE_CACHE_DIR) aren't seen, so caches built on these tokens also
+expire their entries after a while.
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+import itertools
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+TOKEN_DIR = os.environ.get('RESPONSE_CACHE_DIR') or None
+
+logger = logging.getLogger(__name__)
+
+_generations = {}
+_generations_lock = threading.Lock()
+
+def write_file(path, content):
+    """Replace a file atomically, so other processes never read half of it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+def _generation_path(table):
+    return os.path.join(TOKEN_DIR, 'generations', table)
+
+def bump(tables):
+    """
+    Record that these tables changed, invalidating whatever was cached from them.
+
+    Args:
+        tables (iterable): Names of the tables that changed
+    """
+    # Each token records when it was issued (see changed_at)
+    token = f"{time.time():.6f}-{uuid.uuid4().hex[:8]}"
+    with _generations_lock:
+        for table in tables:
+            _generations[table] = token
+    if TOKEN_DIR:
+        for table in tables:
+            try:
+                write_file(_generation_path(table), token)
+            except OSError as e:
+                logger.warning(f"Couldn't record a change to {table} in {TOKEN_DIR}: {e}")
+
+def generations(tables):
+    """
+    The current generation token of each table.
+
+    Returns:
+        dict: Table name -> token ('0' if it hasn't changed since startup)
+    """
+    if TOKEN_DIR:
+        current = {}
+        for table in tables:
+            try:
+                with open(_generation_path(table)) as f:
+                    current[table] = f.read()
+            except OSError:
+                current[table] = '0'
+        return current
+    with _generations_lock:
+        return {table: _generations.get(table, '0') for table in tables}
+
+def changed_at(token):
+    """When a generation token was issued, as a time.time() value (0 for '0')."""
+    return float(token.split('-')[0])
+
+def _changed_tables(db_session):
+    return db_session.info.setdefault('changed_tables', set())
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(db_session, flush_context):
+    tables = _changed_tables(db_session)
+    for obj in itertools.chain(db_session.new, db_session.dirty, db_session.deleted):
+        tables.update(table.name for table in inspect(obj).mapper.tables)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _on_orm_execute(orm_execute_state):
+    # Bulk query.update()/delete() and insert() statements skip the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            _changed_tables(orm_execute_state.session).add(table.name)
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(db_session):
+    tables = db_session.info.pop('changed_tables', None)
+    if tables:
+        bump(tables)
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(db_session):
+    db_session.info.pop('changed_tables', None)
@@ -32,13 +32,17 @@ def parse_db_url():
         print(f"Error parsing DATABASE_URL: {e}")
         return None
 
-def backup_database(backup_dir='db_backups', schema_only=False):
+def backup_database(backup_dir='db_backups', schema_only=False, jobs=1):
     """
     Create a PostgreSQL database backup using pg_dump.
     
+    With jobs above 1, pg_dump writes a directory-format backup and dumps
+    that many tables at once, all from one synchronized snapshot.
+    
     Args:
         backup_dir (str): Directory to store backups
         schema_only (bool): If True, only dump schema without data
+        jobs (int): Number of tables to dump in parallel
     
     Returns:
         str: Path to backup file or None if failed
@@ -56,6 +60,9 @@ def backup_database(backup_dir='db_backups', schema_only=False):
     timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
     backup_type = "schema" if schema_only else "full"
     backup_file = f"{backup_dir}/{backup_type}_backup_{timestamp}.sql"
+    if jobs > 1:
+        # Parallel dumps need the directory format
+        backup_file = f"{backup_dir}/{backup_type}_backup_{timestamp}.dir"
     
     # Build pg_dump command
     cmd = [
@@ -72,6 +79,9 @@ def backup_database(backup_dir='db_backups', schema_only=False):
     if schema_only:
         cmd.append('--schema-only')
     
+    if jobs > 1:
+        cmd.extend(['--format=directory', f'--jobs={jobs}'])
+    
     # Add sslmode if required
     if db_params.get('sslmode') == 'require':
         cmd.append('--sslmode=require')
@@ -90,8 +100,8 @@ def backup_database(backup_dir='db_backups', schema_only=False):
         print(f"Backup created successfully: {backup_file}")
         
         # Create a symbolic link to latest backup
-        latest_link = f"{backup_dir}/latest_{backup_type}_backup.sql"
-        if os.path.exists(latest_link):
+        latest_link = f"{backup_dir}/latest_{backup_type}_backup.{'dir' if jobs > 1 else 'sql'}"
+        if os.path.lexists(latest_link):
             os.remove(latest_link)
         try:
             # On systems that support symbolic links
@@ -99,7 +109,10 @@ def backup_database(backup_dir='db_backups', schema_only=False):
         except:
             # Fall back to copying the file if symlinks aren't supported
             import shutil
-            shutil.copy2(backup_file, latest_link)
+            if jobs > 1:
+                shutil.copytree(backup_file, latest_link)
+            else:
+                shutil.copy2(backup_file, latest_link)
             
         print(f"Latest backup link created: {latest_link}")
         return backup_file
@@ -107,13 +120,17 @@ def backup_database(backup_dir='db_backups', schema_only=False):
         print(f"Error creating backup: {e}")
         return None
 
-def restore_database(backup_file=None):
+def restore_database(backup_file=None, jobs=1):
     """
     Restore a PostgreSQL database from a backup file.
     
+    Directory-format backups (from backup --jobs) are restored with
+    pg_restore, loading `jobs` tables at once.
+    
     Args:
-        backup_file (str): Path to backup file to restore.
+        backup_file (str): Path to backup file or directory to restore.
                           If None, uses latest full backup.
+        jobs (int): Number of tables to restore in parallel (directory backups)
     
     Returns:
         bool: True if successful, False otherwise
@@ -146,9 +163,10 @@ def restore_database(backup_file=None):
     if not db_params:
         return False
     
-    # Build psql command
+    # Build psql command, or pg_restore for directory backups
+    is_directory = os.path.isdir(backup_file)
     cmd = [
-        'psql',
+        'pg_restore' if is_directory else 'psql',
         f'--host={db_params["host"]}',
         f'--port={db_params["port"]}',
         f'--username={db_params["user"]}',
@@ -159,8 +177,11 @@ def restore_database(backup_file=None):
     if db_params.get('sslmode') == 'require':
         cmd.append('--sslmode=require')
     
-    # Input from file
-    cmd.extend(['-f', backup_file])
+    if is_directory:
+        cmd.extend(['--no-owner', '--no-acl', f'--jobs={max(jobs, 1)}', backup_file])
+    else:
+        # Input from file
+        cmd.extend(['-f', backup_file])
     
     # Set PGPASSWORD environment variable
     env = os.environ.copy()
@@ -187,19 +208,23 @@ def main():
     backup_parser = subparsers.add_parser('backup', help='Create a database backup')
     backup_parser.add_argument('--schema-only', action='store_true', help='Backup schema only (no data)')
     backup_parser.add_argument('--dir', default='db_backups', help='Directory to store backups')
+    backup_parser.add_argument('--jobs', type=int, default=1,
+                               help='Dump this many tables in parallel (writes a directory-format backup)')
     
     # Restore command
     restore_parser = subparsers.add_parser('restore', help='Restore a database backup')
-    restore_parser.add_argument('--file', help='Path to backup file to restore')
+    restore_parser.add_argument('--file', help='Path to backup file or directory to restore')
+    restore_parser.add_argument('--jobs', type=int, default=1,
+                                help='Restore this many tables in parallel (directory backups)')
     
     # Parse arguments
     args = parser.parse_args()
     
     # Handle commands
     if args.command == 'backup':
-        backup_database(backup_dir=args.dir, schema_only=args.schema_only)
+        backup_database(backup_dir=args.dir, schema_only=args.schema_only, jobs=args.jobs)
     elif args.command == 'restore':
-        restore_database(backup_file=args.file)
+        restore_database(backup_file=args.file, jobs=args.jobs)
     else:
         parser.print_help()
 
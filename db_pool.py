@@ -0,0 +1,205 @@
+"""
+Database connection pool settings and instrumentation.
+
+Pool settings come from the environment:
+
+    DB_POOL_SIZE          connections kept open per process (default 5)
+    DB_MAX_OVERFLOW       extra connections allowed under load (default 10)
+    DB_POOL_TIMEOUT       seconds to wait for a free connection (default 30)
+    DB_POOL_RECYCLE       seconds before a connection is replaced (default 300)
+    DB_POOL_PRE_PING      "always" checks every connection with a round trip
+                          before handing it out (default); "idle" only checks
+                          ones unused for DB_POOL_PRE_PING_IDLE seconds
+                          (default 60); "never" relies on DB_POOL_RECYCLE
+
+Checkouts, waits for a free connection, overflow use, invalidations and
+pings are counted per process and reported by snapshot() (served to admins
+at /api/admin/pool-metrics), so the pool can be sized against the number of
+workers and threads. With gunicorn each worker reports its own figures.
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+PRE_PING_STRATEGIES = ('always', 'idle', 'never')
+# Upper bounds (seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.01, 0.1, 1.0)
+
+_settings = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+    'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 300)),
+    'pre_ping': os.environ.get('DB_POOL_PRE_PING', 'always'),
+    'pre_ping_idle': float(os.environ.get('DB_POOL_PRE_PING_IDLE', 60)),
+}
+if _settings['pre_ping'] not in PRE_PING_STRATEGIES:
+    raise ValueError(f"DB_POOL_PRE_PING must be one of {', '.join(PRE_PING_STRATEGIES)}")
+
+class PoolStats:
+    """Thread-safe counters for one process's connection pool."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.since = datetime.utcnow()
+            self.counts = dict.fromkeys((
+                'connects', 'checkouts', 'checkins', 'invalidations', 'soft_invalidations',
+                'overflow_checkouts', 'timeouts', 'pings', 'ping_failures'
+            ), 0)
+            self.peak_checked_out = 0
+            self.peak_overflow = 0
+            self.wait_count = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def add(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def record_wait(self, seconds, checked_out, overflow, size):
+        with self.lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            bucket = next((i for i, bound in enumerate(WAIT_BUCKETS) if seconds < bound), len(WAIT_BUCKETS))
+            self.wait_buckets[bucket] += 1
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+            self.peak_overflow = max(self.peak_overflow, overflow)
+            if checked_out > size:
+                self.counts['overflow_checkouts'] += 1
+
+stats = PoolStats()
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long each checkout waits for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            stats.add('timeouts')
+            raise
+        stats.record_wait(time.perf_counter() - start, self.checkedout(), max(self.overflow(), 0), self.size())
+        return connection
+
+# SQLAlchemy names a pool's logger after its class, which puts this one
+# outside the "sqlalchemy" loggers it keeps at WARNING; without this the app's
+# DEBUG logging reports every checkout
+logging.getLogger(f"{__name__}.InstrumentedQueuePool").setLevel(logging.WARNING)
+
+def _uses_queue_pool(database_url):
+    # In-memory SQLite databases live in a single connection per thread
+    return not (database_url.startswith('sqlite') and
+                (':memory:' in database_url or database_url.rstrip('/') == 'sqlite:'))
+
+def engine_options(database_url):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the configured pool.
+
+    Args:
+        database_url (str): The database the engine connects to
+
+    Returns:
+        dict: Keyword arguments for create_engine()
+    """
+    options = {
+        'pool_recycle': _settings['pool_recycle'],
+        'pool_pre_ping': _settings['pre_ping'] == 'always',
+    }
+    if _uses_queue_pool(database_url):
+        options.update({
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': _settings['pool_size'],
+            'max_overflow': _settings['max_overflow'],
+            'pool_timeout': _settings['pool_timeout'],
+        })
+    return options
+
+def _ping(dbapi_connection):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+    finally:
+        cursor.close()
+
+def install(engine):
+    """Count the engine's pool events, and ping idle connections if configured to."""
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        stats.add('connects')
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.add('checkouts')
+        if _settings['pre_ping'] != 'idle':
+            return
+        last_used = connection_record.info.get('last_checkin')
+        if last_used is None or time.monotonic() - last_used < _settings['pre_ping_idle']:
+            return
+        stats.add('pings')
+        try:
+            _ping(dbapi_connection)
+        except Exception:
+            stats.add('ping_failures')
+            # The pool discards this connection and retries with a fresh one
+            raise exc.DisconnectionError()
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        stats.add('checkins')
+        connection_record.info['last_checkin'] = time.monotonic()
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        stats.add('invalidations')
+
+    @event.listens_for(engine, 'soft_invalidate')
+    def on_soft_invalidate(dbapi_connection, connection_record, exception):
+        stats.add('soft_invalidations')
+
+def snapshot(engine):
+    """
+    The pool's configuration, current state and counters since the last reset.
+
+    Returns:
+        dict: JSON-serialisable metrics for this process
+    """
+    pool = engine.pool
+    state = {'class': type(pool).__name__, 'pre_ping': _settings['pre_ping']}
+    if isinstance(pool, QueuePool):
+        state.update({
+            'size': pool.size(),
+            'max_overflow': _settings['max_overflow'],
+            'timeout': _settings['pool_timeout'],
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+        })
+
+    with stats.lock:
+        wait_labels = [f"<{bound * 1000:g}ms" for bound in WAIT_BUCKETS] + [f">={WAIT_BUCKETS[-1] * 1000:g}ms"]
+        return {
+            'pid': os.getpid(),
+            'since': stats.since.isoformat(),
+            'pool': state,
+            'counts': dict(stats.counts),
+            'peak_checked_out': stats.peak_checked_out,
+            'peak_overflow': stats.peak_overflow,
+            'wait': {
+                'count': stats.wait_count,
+                'mean_ms': round(stats.wait_total / stats.wait_count * 1000, 3) if stats.wait_count else 0,
+                'max_ms': round(stats.wait_max * 1000, 3),
+                'histogram': dict(zip(wait_labels, stats.wait_buckets)),
+            },
+        }
@@ -0,0 +1,435 @@
+"""
+Outbound email queue for StrataHub application.
+Routes enqueue messages in the outbox table; a worker drains it with
+retry, exponential backoff, per-domain rate limiting and a dead-letter state.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+
+from app import app, db
+from models import OutboundEmail
+import email_service
+import mail_merge
+
+# Priority lanes (lower is sent first)
+PRIORITY_LOGIN = 0
+PRIORITY_DEFAULT = 5
+PRIORITY_BULK = 9
+
+# Worker lanes as (max_priority, min_priority). Run an 'other' worker
+# alongside a 'login' worker; 'all' is for a single worker on its own.
+LANES = {
+    'all': (None, None),
+    'login': (PRIORITY_LOGIN, None),
+    'other': (None, PRIORITY_LOGIN + 1),
+}
+
+# Retry and rate limit configuration
+BACKOFF_BASE_SECONDS = int(os.environ.get('EMAIL_QUEUE_BACKOFF_BASE', 30))
+BACKOFF_MAX_SECONDS = int(os.environ.get('EMAIL_QUEUE_BACKOFF_MAX', 3600))
+DOMAIN_RATE_LIMIT = int(os.environ.get('EMAIL_QUEUE_DOMAIN_RATE', 30))  # Messages per domain per window
+DOMAIN_RATE_WINDOW_SECONDS = int(os.environ.get('EMAIL_QUEUE_DOMAIN_WINDOW', 60))
+LOCK_TIMEOUT_SECONDS = int(os.environ.get('EMAIL_QUEUE_LOCK_TIMEOUT', 300))
+POLL_INTERVAL_SECONDS = float(os.environ.get('EMAIL_QUEUE_POLL_INTERVAL', 2))
+
+def _recipient_domain(to_email):
+    """Get the lowercase domain of the first recipient."""
+    first = to_email.split(',')[0].strip()
+    return first.rsplit('@', 1)[-1].lower() if '@' in first else ''
+
+def enqueue_email(to_email, subject, text_content, html_content=None, priority=PRIORITY_DEFAULT, commit=True):
+    """
+    Add an email to the outbox.
+
+    Args:
+        to_email (str or list): Recipient email address(es)
+        subject (str): Email subject
+        text_content (str): Plain text content
+        html_content (str, optional): HTML content
+        priority (int): Queue priority, PRIORITY_LOGIN for magic links
+        commit (bool): Commit the session after adding the message
+
+    Returns:
+        OutboundEmail: The queued message
+    """
+    if not isinstance(to_email, str):
+        to_email = ', '.join(to_email)
+
+    message = OutboundEmail(
+        to_email=to_email,
+        recipient_domain=_recipient_domain(to_email),
+        subject=subject,
+        text_content=text_content,
+        html_content=html_content,
+        priority=priority,
+        status='pending',
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(message)
+
+    if commit:
+        db.session.commit()
+
+    return message
+
+def enqueue_notification(template_type, item, contact, priority=PRIORITY_DEFAULT, commit=True):
+    """
+    Render a per-owner notification and add it to the outbox.
+
+    Args:
+        template_type (str): Key into mail_merge.RENDERERS
+        item: The fee or payment the notification is about
+        contact (Contact): The recipient
+        priority (int): Queue priority
+        commit (bool): Commit the session after adding the message
+
+    Returns:
+        OutboundEmail: The queued message, or None if the contact has no email
+    """
+    if not contact or not contact.email:
+        return None
+
+    subject, text_content, html_content = mail_merge.RENDERERS[template_type](item, contact)
+    return enqueue_email(contact.email, subject, text_content, html_content, priority, commit)
+
+def enqueue_batch(pairs, template_type='fee_notification', priority=PRIORITY_BULK):
+    """
+    Render a batch of per-owner notifications and add them to the outbox in one commit.
+
+    Args:
+        pairs (list): List of (item, contact) tuples
+        template_type (str): Key into mail_merge.RENDERERS
+        priority (int): Queue priority
+
+    Returns:
+        dict: Counts of queued and skipped messages
+    """
+    queued = 0
+    skipped = 0
+
+    for item, contact in pairs:
+        if enqueue_notification(template_type, item, contact, priority, commit=False):
+            queued += 1
+        else:
+            skipped += 1
+
+    db.session.commit()
+    return {'queued': queued, 'skipped': skipped}
+
+class DomainRateLimiter:
+    """Sliding-window limit on messages sent per recipient domain."""
+
+    def __init__(self, limit=DOMAIN_RATE_LIMIT, window_seconds=DOMAIN_RATE_WINDOW_SECONDS):
+        self.limit = limit
+        self.window = window_seconds
+        self.sent = defaultdict(deque)
+        self.lock = threading.Lock()
+
+    def _prune(self, domain, now):
+        timestamps = self.sent[domain]
+        while timestamps and now - timestamps[0] >= self.window:
+            timestamps.popleft()
+        return timestamps
+
+    def retry_after(self, domain):
+        """Seconds until the domain may be sent to again (0 if allowed now)."""
+        if not domain or self.limit <= 0:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            timestamps = self._prune(domain, now)
+            if len(timestamps) < self.limit:
+                return 0
+            return self.window - (now - timestamps[0])
+
+    def record(self, domain):
+        """Record a send to the domain."""
+        if not domain:
+            return
+        with self.lock:
+            self.sent[domain].append(time.monotonic())
+
+def backoff_delay(attempts):
+    """
+    Exponential backoff with jitter for the given number of failed attempts.
+
+    Returns:
+        timedelta: Delay before the next attempt
+    """
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+    delay = delay * random.uniform(0.8, 1.2)
+    return timedelta(seconds=delay)
+
+def release_stale_locks():
+    """Return messages stuck in 'sending' (e.g. after a worker crash) to the queue."""
+    cutoff = datetime.utcnow() - timedelta(seconds=LOCK_TIMEOUT_SECONDS)
+    released = OutboundEmail.query.filter(
+        OutboundEmail.status == 'sending',
+        OutboundEmail.locked_at < cutoff
+    ).update({'status': 'pending', 'locked_at': None}, synchronize_session=False)
+    db.session.commit()
+    return released
+
+def claim_batch(limit=50, max_priority=None, min_priority=None):
+    """
+    Claim a batch of due messages for this worker.
+
+    Candidates are picked with SELECT ... FOR UPDATE SKIP LOCKED where
+    supported, then claimed with a single UPDATE that only changes rows
+    still pending. Only the rows this worker actually changed are returned,
+    so workers racing for the same rows (SQLite ignores SKIP LOCKED) never
+    send a message twice.
+
+    Args:
+        limit (int): Maximum number of messages to claim
+        max_priority (int, optional): Only claim messages at or above this priority
+        min_priority (int, optional): Only claim messages at or below this priority
+
+    Returns:
+        list: Claimed OutboundEmail objects
+    """
+    now = datetime.utcnow()
+    query = db.session.query(OutboundEmail.id).filter(
+        OutboundEmail.status == 'pending',
+        OutboundEmail.next_attempt_at <= now
+    )
+    if max_priority is not None:
+        query = query.filter(OutboundEmail.priority <= max_priority)
+    if min_priority is not None:
+        query = query.filter(OutboundEmail.priority >= min_priority)
+
+    candidate_ids = [row.id for row in query.order_by(
+        OutboundEmail.priority.asc(),
+        OutboundEmail.next_attempt_at.asc()
+    ).limit(limit).with_for_update(skip_locked=True)]
+    if not candidate_ids:
+        db.session.commit()
+        return []
+
+    claim = db.update(OutboundEmail).where(
+        OutboundEmail.id.in_(candidate_ids),
+        OutboundEmail.status == 'pending'
+    ).values(status='sending', locked_at=now)
+
+    if db.engine.dialect.update_returning:
+        claimed_ids = db.session.execute(claim.returning(OutboundEmail.id)).scalars().all()
+    else:
+        # One row at a time, keeping those whose update changed a row
+        claimed_ids = [
+            message_id for message_id in candidate_ids
+            if db.session.execute(claim.where(OutboundEmail.id == message_id)).rowcount
+        ]
+    db.session.commit()
+
+    if not claimed_ids:
+        return []
+    messages = OutboundEmail.query.filter(OutboundEmail.id.in_(claimed_ids)).all()
+    messages.sort(key=lambda message: (message.priority, message.next_attempt_at))
+    return messages
+
+def _mark_failed(message, error):
+    """Record a failed attempt, scheduling a retry or dead-lettering the message."""
+    message.attempts += 1
+    message.last_error = str(error)[:2000]
+    message.locked_at = None
+
+    if message.attempts >= message.max_attempts:
+        message.status = 'dead'
+        print(f"Outbox: message {message.id} to {message.to_email} moved to dead letter after {message.attempts} attempts: {error}")
+    else:
+        message.status = 'pending'
+        message.next_attempt_at = datetime.utcnow() + backoff_delay(message.attempts)
+
+def process_outbox(batch_size=50, max_priority=None, rate_limiter=None, min_priority=None):
+    """
+    Send one batch of due messages from the outbox over a single SMTP connection.
+
+    Args:
+        batch_size (int): Maximum number of messages to process
+        max_priority (int, optional): Only process messages at or above this priority
+        rate_limiter (DomainRateLimiter, optional): Shared per-domain limiter
+        min_priority (int, optional): Only process messages at or below this priority
+
+    Returns:
+        dict: Counts of claimed, sent, deferred, retried and dead messages
+    """
+    if rate_limiter is None:
+        rate_limiter = DomainRateLimiter()
+
+    stats = {'claimed': 0, 'sent': 0, 'deferred': 0, 'retry': 0, 'dead': 0}
+    messages = claim_batch(batch_size, max_priority, min_priority)
+    stats['claimed'] = len(messages)
+    if not messages:
+        return stats
+
+    server = None
+    try:
+        for message in messages:
+            # Defer without counting an attempt if the domain is over its limit
+            wait = rate_limiter.retry_after(message.recipient_domain)
+            if wait > 0:
+                message.status = 'pending'
+                message.locked_at = None
+                message.next_attempt_at = datetime.utcnow() + timedelta(seconds=wait)
+                stats['deferred'] += 1
+                continue
+
+            try:
+                if not email_service.SMTP_USERNAME or not email_service.SMTP_PASSWORD:
+                    raise RuntimeError("SMTP credentials not configured")
+
+                if server is None:
+                    server = email_service.open_smtp_connection()
+
+                msg, recipients = email_service.build_message(
+                    message.recipients,
+                    message.subject,
+                    message.text_content,
+                    message.html_content
+                )
+                email_service.deliver_message(server, msg, recipients)
+
+                message.status = 'sent'
+                message.sent_at = datetime.utcnow()
+                message.locked_at = None
+                message.last_error = None
+                rate_limiter.record(message.recipient_domain)
+                stats['sent'] += 1
+            except Exception as e:
+                email_service.print_smtp_error_help(e)
+                _mark_failed(message, e)
+                stats['dead' if message.status == 'dead' else 'retry'] += 1
+
+                # Drop the connection so the next message starts fresh
+                if server is not None:
+                    try:
+                        server.close()
+                    except Exception:
+                        pass
+                    server = None
+
+            # Persist each outcome so a crash doesn't resend delivered mail
+            db.session.commit()
+    finally:
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
+        db.session.commit()
+
+    return stats
+
+def run_worker(max_priority=None, batch_size=50, poll_interval=POLL_INTERVAL_SECONDS, stop_event=None,
+               min_priority=None):
+    """
+    Drain the outbox continuously until stop_event is set.
+
+    Args:
+        max_priority (int, optional): Restrict the worker to a priority lane
+        min_priority (int, optional): Leave higher-priority lanes to other workers
+        batch_size (int): Messages claimed per batch
+        poll_interval (float): Seconds to sleep when the queue is empty
+        stop_event (threading.Event, optional): Set to stop the worker
+    """
+    rate_limiter = DomainRateLimiter()
+    last_lock_sweep = 0
+
+    while stop_event is None or not stop_event.is_set():
+        with app.app_context():
+            try:
+                if time.monotonic() - last_lock_sweep > LOCK_TIMEOUT_SECONDS:
+                    release_stale_locks()
+                    last_lock_sweep = time.monotonic()
+
+                stats = process_outbox(batch_size, max_priority, rate_limiter, min_priority)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Outbox worker error: {e}")
+                stats = {'claimed': 0}
+
+        if not stats['claimed']:
+            if stop_event is not None:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+
+def start_worker_threads():
+    """
+    Start in-process outbox workers: one dedicated to the login lane and one for everything else.
+
+    Returns:
+        threading.Event: Set it to stop the workers
+    """
+    stop_event = threading.Event()
+
+    for name, batch_size in (('login', 10), ('other', 50)):
+        max_priority, min_priority = LANES[name]
+        thread = threading.Thread(
+            target=run_worker,
+            kwargs={'max_priority': max_priority, 'min_priority': min_priority,
+                    'batch_size': batch_size, 'stop_event': stop_event},
+            name=f"outbox-worker-{name}",
+            daemon=True
+        )
+        thread.start()
+
+    return stop_event
+
+def queue_status():
+    """Get message counts by status."""
+    rows = db.session.query(OutboundEmail.status, db.func.count(OutboundEmail.id))\
+        .group_by(OutboundEmail.status).all()
+    return {status: count for status, count in rows}
+
+def requeue_dead(message_ids=None):
+    """Move dead-lettered messages back to the queue for another round of attempts."""
+    query = OutboundEmail.query.filter(OutboundEmail.status == 'dead')
+    if message_ids:
+        query = query.filter(OutboundEmail.id.in_(message_ids))
+
+    count = query.update({
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    return count
+
+def main():
+    """Parse arguments and run the outbox worker."""
+    parser = argparse.ArgumentParser(description='Drain the StrataHub outbound email queue.')
+    parser.add_argument('--once', action='store_true', help='Process a single batch and exit')
+    parser.add_argument('--lane', choices=sorted(LANES), default='all',
+                        help="Priority lane to serve ('other' leaves login mail to a 'login' worker)")
+    parser.add_argument('--batch-size', type=int, default=50, help='Messages claimed per batch')
+    parser.add_argument('--status', action='store_true', help='Print queue counts and exit')
+    parser.add_argument('--requeue-dead', action='store_true', help='Retry all dead-lettered messages')
+    args = parser.parse_args()
+
+    max_priority, min_priority = LANES[args.lane]
+
+    if args.status or args.requeue_dead or args.once:
+        with app.app_context():
+            if args.requeue_dead:
+                print(f"Requeued {requeue_dead()} dead messages")
+            if args.once:
+                print(process_outbox(args.batch_size, max_priority, min_priority=min_priority))
+            print(queue_status())
+        return
+
+    print(f"Starting outbox worker (lane: {args.lane})")
+    try:
+        run_worker(max_priority=max_priority, batch_size=args.batch_size, min_priority=min_priority)
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Email template module for StrataHub application.
+Provides a shared Jinja environment for email bodies with bytecode caching,
+startup precompilation and reusable header/footer fragments.
+"""
+
+import os
+import tempfile
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
+from markupsafe import Markup
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email')
+CACHE_DIR = os.environ.get(
+    'EMAIL_TEMPLATE_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'stratahub_email_templates')
+)
+
+# Static fragments shared by every message, rendered once per process
+FRAGMENT_TEMPLATES = {
+    'html_header': '_header.html',
+    'html_footer': '_footer.html',
+    'signature_html': '_signature.html',
+    'signature_text': '_signature.txt',
+}
+
+_environment = None
+_fragments = None
+
+def money(value):
+    """Format a number as a dollar amount."""
+    return f"${(value or 0):.2f}"
+
+def long_date(value):
+    """Format a date as e.g. '05 May 2025'."""
+    return value.strftime("%d %B %Y") if value else 'Unknown'
+
+def get_environment():
+    """Get the shared email template environment, creating it on first use."""
+    global _environment
+    if _environment is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _environment = Environment(
+            loader=FileSystemLoader(TEMPLATE_DIR),
+            bytecode_cache=FileSystemBytecodeCache(CACHE_DIR),
+            autoescape=select_autoescape(['html']),
+            trim_blocks=True,
+            lstrip_blocks=True,
+            keep_trailing_newline=True,
+            auto_reload=False
+        )
+        _environment.filters['money'] = money
+        _environment.filters['long_date'] = long_date
+    return _environment
+
+def precompile():
+    """
+    Compile every email template so the first send doesn't pay for it.
+
+    Compiled bytecode is written to CACHE_DIR and reused by other workers.
+
+    Returns:
+        int: Number of templates loaded
+    """
+    env = get_environment()
+    names = env.list_templates(extensions=['html', 'txt'])
+    for name in names:
+        env.get_template(name)
+    get_fragments()
+    return len(names)
+
+def get_fragments():
+    """
+    Get the static header, footer and signature fragments.
+
+    They don't depend on the message, so they are rendered once and reused
+    for every message in a batch.
+    """
+    global _fragments
+    if _fragments is None:
+        env = get_environment()
+        _fragments = {
+            key: Markup(env.get_template(name).render())
+            for key, name in FRAGMENT_TEMPLATES.items()
+        }
+    return _fragments
+
+def render(name, **context):
+    """
+    Render the text and HTML bodies of an email template.
+
+    Args:
+        name (str): Template name without extension, e.g. 'fee_notification'
+        **context: Template variables
+
+    Returns:
+        tuple: (text_content, html_content)
+    """
+    env = get_environment()
+    context['fragments'] = get_fragments()
+    text_content = env.get_template(f"{name}.txt").render(context)
+    html_content = env.get_template(f"{name}.html").render(context)
+    return text_content, html_content
@@ -0,0 +1,194 @@
+"""
+Fuzzy name matching module for StrataHub application.
+Matches owner names in bank transaction text despite misspellings, initials
+and word order, using a trigram blocking index so only a handful of likely
+owners are scored for each transaction.
+"""
+
+import re
+import math
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+from models import ContactProperty
+from payer_history import NOISE_WORDS
+
+# Words that appear in transaction text but never in names (single letters are kept as initials)
+IGNORED_WORDS = {word for word in NOISE_WORDS if len(word) > 1} | {
+    'unit', 'apt', 'apartment', 'lot', 'mr', 'mrs', 'ms', 'miss', 'dr'
+}
+# Owners scored per transaction after blocking: those sharing at least this
+# share of the best candidate's trigrams, up to MAX_CANDIDATES
+CANDIDATE_RATIO = 0.6
+MAX_CANDIDATES = 50
+# Blocking score added for each initial an owner shares with the text
+INITIAL_WEIGHT = 0.5
+# Minimum token-set similarity (0-1) for a match
+MIN_SIMILARITY = 0.75
+# Minimum similarity for each part of the name that has to appear
+MIN_TOKEN_SIMILARITY = 0.7
+# Minimum similarity of the surname
+MIN_SURNAME_SIMILARITY = 0.8
+# Weight of a middle name the text leaves out, so an owner whose full name
+# is given still scores above one whose middle name is missing
+MISSING_MIDDLE_WEIGHT = 0.5
+# Confidence (0-100) of an exact owner name match, as in the original substring check
+NAME_MATCH_CONFIDENCE = 70
+
+def name_tokens(text):
+    """Split text into lowercase alphabetic tokens, dropping words that are never names."""
+    return [token for token in re.findall(r'[a-z]+', text.lower()) if token not in IGNORED_WORDS]
+
+def trigrams(token):
+    """Character trigrams of a token, padded so short tokens still have some."""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+@lru_cache(maxsize=65536)
+def token_similarity(name_token, text_token):
+    """
+    Similarity (0-1) between a token of an owner's name and a token of transaction text.
+
+    A single letter matches as an initial; otherwise the difflib ratio is used.
+    """
+    if name_token == text_token:
+        return 1.0
+    if len(text_token) == 1 or len(name_token) == 1:
+        return 0.8 if name_token[0] == text_token[0] else 0.0
+    if abs(len(name_token) - len(text_token)) > max(2, len(name_token) // 3):
+        return 0.0
+    return SequenceMatcher(None, name_token, text_token).ratio()
+
+def _best_token_similarity(name_token, text_tokens):
+    return max(token_similarity(name_token, text_token) for text_token in text_tokens)
+
+def name_similarity(owner_tokens, text_tokens):
+    """
+    Token-set similarity (0-1) between an owner's name and transaction text.
+
+    Each name token is matched to its most similar text token, weighted by
+    length so surnames count more than initials. The first name (or its
+    initial) and the surname must be found, and the surname must match
+    well, so a shared first or last name alone never matches; middle names
+    count when present but may be left out, as in "M JONES" for Mary Anne Jones.
+    """
+    if not owner_tokens or not text_tokens:
+        return 0.0
+
+    # The surname rules out most candidates, so check it first
+    surname = owner_tokens[-1]
+    best = _best_token_similarity(surname, text_tokens)
+    if best < MIN_SURNAME_SIMILARITY:
+        return 0.0
+    total = best * len(surname)
+    weight = len(surname)
+
+    if len(owner_tokens) > 1:
+        first = owner_tokens[0]
+        best = _best_token_similarity(first, text_tokens)
+        if best < MIN_TOKEN_SIMILARITY:
+            return 0.0
+        total += best * len(first)
+        weight += len(first)
+
+    for middle in owner_tokens[1:-1]:
+        best = _best_token_similarity(middle, text_tokens)
+        if best >= MIN_TOKEN_SIMILARITY:
+            total += best * len(middle)
+            weight += len(middle)
+        else:
+            weight += MISSING_MIDDLE_WEIGHT
+    return total / weight
+
+class OwnerNameIndex:
+    """Blocking index from name trigrams to the owners that contain them."""
+
+    def __init__(self, owners):
+        """
+        Args:
+            owners (dict): {property_id: owner name}
+        """
+        self.owners = {}
+        self.initials = {}
+        self.postings = {}
+        for property_id, name in owners.items():
+            tokens = name_tokens(name or '')
+            # Names too short to match safely are left out, as before
+            if not tokens or all(len(token) <= 2 for token in tokens):
+                continue
+            self.owners[property_id] = tokens
+            self.initials[property_id] = {token[0] for token in tokens}
+            for gram in set().union(*(trigrams(token) for token in tokens if len(token) > 2)):
+                self.postings.setdefault(gram, []).append(property_id)
+        
+        # Rare trigrams (mostly from surnames) say more about who paid than
+        # common ones, so weight each by its inverse document frequency
+        owner_count = len(self.owners)
+        self.weights = {
+            gram: math.log(1 + owner_count / len(posting))
+            for gram, posting in self.postings.items()
+        }
+        # Trigrams shared by this many owners say little about who paid
+        self.common_posting_size = max(50, owner_count // 20)
+
+    def candidates(self, text_tokens):
+        """Owners sharing the most (weighted) trigrams with the text, best first."""
+        grams = set().union(*(trigrams(token) for token in text_tokens if len(token) > 2))
+        shared = [gram for gram in grams if gram in self.postings]
+        # Skip very common trigrams unless nothing rarer is shared
+        selective = [gram for gram in shared if len(self.postings[gram]) <= self.common_posting_size]
+        
+        counts = {}
+        for gram in (selective or shared):
+            weight = self.weights[gram]
+            for property_id in self.postings[gram]:
+                counts[property_id] = counts.get(property_id, 0) + weight
+        if not counts:
+            return []
+        
+        # Break ties between owners sharing a surname using their initials
+        text_initials = {token[0] for token in text_tokens}
+        for property_id in counts:
+            counts[property_id] += INITIAL_WEIGHT * len(self.initials[property_id] & text_initials)
+        
+        # Keep every close candidate rather than an arbitrary top N, so owners
+        # with the same surname are all scored
+        cutoff = max(counts.values()) * CANDIDATE_RATIO
+        candidates = [property_id for property_id, count in counts.items() if count >= cutoff]
+        return sorted(candidates, key=counts.get, reverse=True)[:MAX_CANDIDATES]
+
+    def best_match(self, text):
+        """
+        Find the property whose owner's name best matches the text.
+
+        Returns:
+            tuple: (property_id, confidence 0-100), or (None, 0) if there is
+                   no match or two different owners match equally well
+        """
+        text_tokens = name_tokens(text)
+        if not text_tokens:
+            return None, 0
+
+        scored = []
+        for property_id in self.candidates(text_tokens):
+            similarity = name_similarity(self.owners[property_id], text_tokens)
+            if similarity >= MIN_SIMILARITY:
+                scored.append((similarity, property_id))
+
+        if not scored:
+            return None, 0
+
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        best_similarity, best_property_id = scored[0]
+        # Don't guess between owners whose names match equally well
+        for similarity, property_id in scored[1:]:
+            if best_similarity - similarity >= 0.05:
+                break
+            if self.owners[property_id] != self.owners[best_property_id]:
+                return None, 0
+
+        return best_property_id, round(NAME_MATCH_CONFIDENCE * best_similarity)
+
+def load_owner_names():
+    """Get {property_id: owner name} for every property with an owner in one query."""
+    return {property_id: owner.name for property_id, owner in ContactProperty.owners_by_property().items()}
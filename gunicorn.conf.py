@@ -0,0 +1,114 @@
+"""
+Gunicorn configuration for production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment:
+
+    GUNICORN_WORKER_CLASS  gthread (default) or sync
+    GUNICORN_WORKERS       worker processes (default: 2 per CPU + 1 for sync,
+                           1 per CPU for gthread)
+    GUNICORN_THREADS       request threads per gthread worker (default 4)
+    GUNICORN_PRELOAD       1 (default) to import the app once in the master
+                           and fork workers from it, sharing its memory
+    GUNICORN_BIND          address to listen on (default 0.0.0.0:$PORT or :5000)
+
+Each worker gets its own database connection pool, sized to the number of
+requests it serves at once (DB_POOL_SIZE, DB_MAX_OVERFLOW), so the database
+sees at most workers x (pool size + overflow) connections. Check the sizing
+against /api/admin/pool-metrics under real load (see db_pool.py).
+
+With more than one worker, RESPONSE_CACHE_DIR defaults to a directory on
+tmpfs so the workers share cached pages and see each other's writes (see
+response_cache.py); pages cached by the previous deploy are cleared when
+the server starts.
+
+Each worker also runs the outbox workers that send queued email and the
+scheduler thread (see main.start_background_workers); set
+EMAIL_QUEUE_INLINE_WORKER=0 or SCHEDULER_INLINE=0 if those run as separate
+processes instead.
+
+Graceful reload: `kill -HUP <master pid>` starts new workers and lets the
+old ones finish their requests. With preload the new workers fork from the
+code already loaded in the master, so to deploy new code send USR2 (a new
+master starts alongside the old one) and then TERM to the old master.
+"""
+import os
+import re
+import shutil
+import tempfile
+import multiprocessing
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+
+# gthread serves several requests per process while others wait on the
+# database; sync runs one request per process and needs more workers
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class == 'gthread':
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+    workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+else:
+    threads = 1
+    workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# One pooled connection per request thread, and a little headroom for
+# requests that briefly need a second one
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+os.environ.setdefault('DB_MAX_OVERFLOW', str(max(2, threads // 2)))
+
+# Workers each keep their own in-memory page cache and wouldn't see changes
+# made through the others, so share one on tmpfs (one per server address)
+if workers > 1:
+    _shared_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    os.environ.setdefault('RESPONSE_CACHE_DIR', os.path.join(
+        _shared_dir, f"stratahub-response-cache-{re.sub(r'[^A-Za-z0-9]+', '_', bind)}"
+    ))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Replace each worker after a while so slow leaks can't build up; the jitter
+# stops them all restarting at once
+max_requests = 2000
+max_requests_jitter = 200
+
+# Heartbeat files on tmpfs, so a slow disk can't get workers killed
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+
+def on_starting(server):
+    """Drop pages cached by the previous deploy, which may use old templates."""
+    cache_dir = os.environ.get('RESPONSE_CACHE_DIR')
+    if cache_dir:
+        shutil.rmtree(os.path.join(cache_dir, 'pages'), ignore_errors=True)
+
+def post_fork(server, worker):
+    """Give each worker its own database connections."""
+    if not preload_app:
+        return
+    from app import app, db
+    import db_pool
+    with app.app_context():
+        # Connections the master opened while importing the app (e.g. for
+        # db.create_all()) are left to it rather than shared with the worker
+        db.engine.dispose(close=False)
+    # Pool metrics start from zero in each worker
+    db_pool.stats.reset()
+
+def post_worker_init(worker):
+    """Start the outbox workers and scheduler in each worker (see main.start_background_workers)."""
+    import main
+    main.start_background_workers()
+
+def when_ready(server):
+    server.log.info(
+        f"Serving with {workers} {worker_class} workers x {threads} threads, "
+        f"preload {'on' if preload_app else 'off'}, DB pool {os.environ['DB_POOL_SIZE']}"
+        f"+{os.environ['DB_MAX_OVERFLOW']} per worker, "
+        f"response cache in {os.environ.get('RESPONSE_CACHE_DIR') or 'worker memory'}"
+    )
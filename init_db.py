@@ -0,0 +1,38 @@
+"""
+Script to set up the database and caches as a deploy step.
+With AUTO_CREATE_SCHEMA=0 web workers no longer create missing tables or the
+search index when they start; run this once per deploy instead. It creates
+any missing tables, applies outstanding migrations, builds the search index
+on first run and compiles the email templates into the shared bytecode cache.
+"""
+import sys
+
+from app import app, db
+import email_templates
+import migrations
+import search
+
+def init_db():
+    """
+    Create the schema and warm the caches the web workers share.
+
+    Returns:
+        bool: True if successful
+    """
+    with app.app_context():
+        db.create_all()
+        print("Database tables are in place.")
+
+    if not migrations.migrate():
+        return False
+
+    with app.app_context():
+        if search.ensure_schema():
+            print(f"Search index created with {search.rebuild_index()} documents")
+
+    print(f"Compiled {email_templates.precompile()} email templates.")
+    return True
+
+if __name__ == "__main__":
+    if not init_db():
+        sys.exit(1)
@@ -0,0 +1,242 @@
+"""
+Mail merge module for StrataHub application.
+Sends per-owner notifications in bulk over a small pool of persistent SMTP connections.
+"""
+
+import os
+import queue
+import re
+import smtplib
+import threading
+from datetime import datetime
+
+import email_service
+
+# Renderers for each supported notification type.
+# Each takes (item, contact) and returns (subject, text_content, html_content).
+RENDERERS = {
+    'fee_notification': email_service.render_fee_notification,
+    'payment_receipt': email_service.render_payment_receipt,
+    'overdue_reminder': email_service.render_overdue_reminder,
+}
+
+# Defaults for the connection pool
+DEFAULT_MAX_CONNECTIONS = int(os.environ.get('MAIL_MERGE_CONNECTIONS', 3))
+DEFAULT_MESSAGES_PER_CONNECTION = int(os.environ.get('MAIL_MERGE_MESSAGES_PER_CONNECTION', 50))
+
+def render_batch(pairs, template_type='fee_notification'):
+    """
+    Render every message in a batch up front.
+
+    Rendering touches ORM relationships, so it runs in the calling thread
+    (inside the app context) before any SMTP work starts.
+
+    Args:
+        pairs (list): List of (item, contact) tuples, e.g. (Fee, Contact)
+        template_type (str): Key into RENDERERS
+
+    Returns:
+        tuple: (list of rendered message dicts, list of result dicts for skipped pairs)
+    """
+    if template_type not in RENDERERS:
+        raise ValueError(f"Unknown template type: {template_type}")
+
+    renderer = RENDERERS[template_type]
+    rendered = []
+    skipped = []
+
+    for index, (item, contact) in enumerate(pairs):
+        result = {
+            'index': index,
+            'item_id': getattr(item, 'id', None),
+            'contact_id': getattr(contact, 'id', None),
+            'email': getattr(contact, 'email', None),
+            'success': False,
+            'error': None
+        }
+
+        if not contact or not contact.email:
+            result['error'] = 'Contact has no email address'
+            skipped.append(result)
+            continue
+
+        try:
+            subject, text_content, html_content = renderer(item, contact)
+            msg, recipients = email_service.build_message(contact.email, subject, text_content, html_content)
+        except Exception as e:
+            result['error'] = f'Render failed: {e}'
+            skipped.append(result)
+            continue
+
+        result['subject'] = subject
+        rendered.append({'result': result, 'message': msg, 'recipients': recipients})
+
+    return rendered, skipped
+
+def write_dry_run(rendered, output_dir):
+    """
+    Write rendered messages to a directory as .eml files instead of sending them.
+
+    Args:
+        rendered (list): Rendered message dicts from render_batch()
+        output_dir (str): Directory to write the files to
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    for entry in rendered:
+        result = entry['result']
+        safe_email = re.sub(r'[^A-Za-z0-9@._-]', '_', result['email'])
+        filename = os.path.join(output_dir, f"{result['index']:05d}_{safe_email}.eml")
+
+        with open(filename, 'w') as f:
+            f.write(entry['message'].as_string())
+
+        result['success'] = True
+        result['path'] = filename
+
+def _connection_worker(work_queue, messages_per_connection):
+    """
+    Drain the work queue over a single persistent SMTP connection.
+
+    The connection is recycled after messages_per_connection sends and
+    reopened once if the server drops it mid-batch.
+    """
+    server = None
+    sent_on_connection = 0
+
+    try:
+        while True:
+            try:
+                entry = work_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            result = entry['result']
+
+            for attempt in range(2):
+                try:
+                    if server is None or sent_on_connection >= messages_per_connection:
+                        if server is not None:
+                            _close_quietly(server)
+                        server = email_service.open_smtp_connection()
+                        sent_on_connection = 0
+
+                    email_service.deliver_message(server, entry['message'], entry['recipients'])
+                    sent_on_connection += 1
+                    result['success'] = True
+                    result['error'] = None
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    # Reconnect and retry once on a dropped connection
+                    server = None
+                    result['error'] = str(e)
+                except smtplib.SMTPRecipientsRefused as e:
+                    # Permanent failure for this recipient, keep the connection
+                    result['error'] = f'Recipient refused: {e}'
+                    break
+                except Exception as e:
+                    result['error'] = str(e)
+                    email_service.print_smtp_error_help(e)
+                    if server is not None:
+                        _close_quietly(server)
+                    server = None
+                    break
+
+            work_queue.task_done()
+    finally:
+        if server is not None:
+            _close_quietly(server)
+
+def _close_quietly(server):
+    """Close an SMTP connection, ignoring errors from an already-dead socket."""
+    try:
+        server.quit()
+    except Exception:
+        try:
+            server.close()
+        except Exception:
+            pass
+
+def send_rendered(rendered, max_connections=DEFAULT_MAX_CONNECTIONS,
+                  messages_per_connection=DEFAULT_MESSAGES_PER_CONNECTION):
+    """
+    Send pre-rendered messages over a pool of persistent SMTP connections.
+
+    Args:
+        rendered (list): Rendered message dicts from render_batch()
+        max_connections (int): Maximum number of concurrent SMTP connections
+        messages_per_connection (int): Messages sent before a connection is recycled
+    """
+    if not rendered:
+        return
+
+    if not email_service.SMTP_USERNAME or not email_service.SMTP_PASSWORD:
+        print("SMTP credentials not configured. Emails not sent.")
+        for entry in rendered:
+            entry['result']['error'] = 'SMTP credentials not configured'
+        return
+
+    work_queue = queue.Queue()
+    for entry in rendered:
+        work_queue.put(entry)
+
+    num_workers = max(1, min(max_connections, len(rendered)))
+    workers = [
+        threading.Thread(target=_connection_worker, args=(work_queue, messages_per_connection), daemon=True)
+        for _ in range(num_workers)
+    ]
+
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+def send_bulk_notifications(pairs, template_type='fee_notification', dry_run_dir=None,
+                            max_connections=DEFAULT_MAX_CONNECTIONS,
+                            messages_per_connection=DEFAULT_MESSAGES_PER_CONNECTION):
+    """
+    Render and send a batch of per-owner notifications.
+
+    Args:
+        pairs (list): List of (item, contact) tuples, e.g. [(fee, owner), ...]
+        template_type (str): 'fee_notification', 'payment_receipt' or 'overdue_reminder'
+        dry_run_dir (str, optional): If set, write .eml files here instead of sending
+        max_connections (int): Maximum number of concurrent SMTP connections
+        messages_per_connection (int): Messages sent before a connection is recycled
+
+    Returns:
+        list: One result dict per input pair, in input order, with keys
+              index, item_id, contact_id, email, success and error
+    """
+    started = datetime.now()
+    rendered, skipped = render_batch(pairs, template_type)
+
+    if dry_run_dir:
+        write_dry_run(rendered, dry_run_dir)
+    else:
+        send_rendered(rendered, max_connections, messages_per_connection)
+
+    results = skipped + [entry['result'] for entry in rendered]
+    results.sort(key=lambda r: r['index'])
+
+    sent = sum(1 for r in results if r['success'])
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"Mail merge ({template_type}): {sent}/{len(results)} messages "
+          f"{'written' if dry_run_dir else 'sent'} in {elapsed:.2f}s")
+
+    return results
+
+def summarize_results(results):
+    """
+    Summarize a list of per-recipient results.
+
+    Returns:
+        dict: Counts of total, sent and failed messages plus the failed results
+    """
+    failed = [r for r in results if not r['success']]
+    return {
+        'total': len(results),
+        'sent': len(results) - len(failed),
+        'failed': len(failed),
+        'failures': failed
+    }
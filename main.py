@@ -1,6 +1,68 @@
-from app import app
+import os
+
+from app import app, AUTO_CREATE_SCHEMA
 from routes import *
 from auth import *  # Import authentication routes and functions
+import email_queue
+import migrations
+import session_store
+import search
+
+# Keep session data server-side; the cookie only carries the session ID
+session_store.install(app)
+
+# With AUTO_CREATE_SCHEMA=0 all of these are done by `python init_db.py` at
+# deploy time; the search index is otherwise created on first use, and email
+# templates compile on first send from the bytecode cache init_db.py leaves.
+if AUTO_CREATE_SCHEMA:
+    # db.create_all() only adds missing tables; bring the columns and indexes
+    # of existing ones up to date before anything queries them. Workers
+    # starting together wait for whichever of them migrates first.
+    if not migrations.migrate(wait=True):
+        raise RuntimeError("Schema migration failed; fix the error above and restart, "
+                           "or run `python migrations.py` by hand")
+
+    # Create the search index on first run and fill it from existing data
+    with app.app_context():
+        if search.ensure_schema():
+            print(f"Search index created with {search.rebuild_index()} documents")
+
+    # Compile email templates up front so the first send doesn't pay for it
+    import email_templates
+    email_templates.precompile()
+else:
+    # Code that needs a new column (e.g. user.token_hash for magic links)
+    # would otherwise fail on every request that touches it
+    pending = migrations.pending_migrations()
+    if pending:
+        raise RuntimeError(
+            "The database is missing migrations "
+            + "; ".join(f"{version} ({description})" for version, description in pending)
+            + ". Run `python init_db.py` before starting the app."
+        )
+
+def start_background_workers():
+    """
+    Start the in-process outbox workers and scheduler, unless they run elsewhere.
+
+    Called once per serving process: by gunicorn.conf.py in each worker and by
+    the development server below. Both are on by default, since nothing else
+    sends the queued mail (magic links included) or runs scheduled jobs; the
+    outbox claim and the scheduler's run claim are safe with several workers.
+    Set EMAIL_QUEUE_INLINE_WORKER=0 when `python email_queue.py` runs as its
+    own process, and SCHEDULER_INLINE=0 when cron runs `python scheduler.py --once`.
+    """
+    if os.environ.get('EMAIL_QUEUE_INLINE_WORKER', '1') == '1':
+        email_queue.start_worker_threads()
+
+    if os.environ.get('SCHEDULER_INLINE', '1') == '1':
+        import scheduler
+        scheduler.start_scheduler_thread()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Development server only; production runs `gunicorn -c gunicorn.conf.py wsgi:app`
+    debug = os.environ.get("FLASK_DEBUG", "1") == "1"
+    # The reloader runs the app in a child process; start the threads there only
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_workers()
+    app.run(host="0.0.0.0", port=5000, debug=debug)
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations, applied in place.
+
+Each migration has a version number and is recorded in the schema_version
+table once it has been applied, so running this script only applies the
+ones a database hasn't had yet:
+
+    python migrations.py            # apply everything outstanding
+    python migrations.py --list     # show which migrations are applied
+    python migrations.py --target 3 # apply up to and including version 3
+
+Migrations only make additive changes (new columns, indexes and
+constraints), so the application keeps running while they are applied.
+Existing rows are backfilled in primary key ranges of --batch-size rows,
+each range committed on its own, so no statement holds locks on a large
+share of a table and progress is reported as it goes. Every step checks
+whether it has already been done, so an interrupted migration can simply
+be run again; databases created by db.create_all() already have the latest
+schema, and migrating them only records the versions.
+
+On PostgreSQL, DDL waits at most MIGRATION_LOCK_TIMEOUT for its lock
+instead of queueing the application's queries behind it, indexes are built
+with CREATE INDEX CONCURRENTLY, and an advisory lock stops two runners
+migrating at once.
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+from contextlib import contextmanager
+
+from sqlalchemy import inspect, text, MetaData, Table, Column, Integer, String, DateTime
+
+from app import app, db
+
+VERSION_TABLE = 'schema_version'
+# Rows updated per transaction by backfills
+BACKFILL_BATCH_SIZE = int(os.environ.get('MIGRATION_BATCH_SIZE', 5000))
+# Longest a DDL statement may wait for its table lock on PostgreSQL
+MIGRATION_LOCK_TIMEOUT = os.environ.get('MIGRATION_LOCK_TIMEOUT', '5s')
+# Seconds between backfill progress reports
+PROGRESS_INTERVAL = 2.0
+# pg_advisory_lock key held while migrating
+ADVISORY_LOCK_ID = 7245019
+
+# (version, description, function), in version order
+MIGRATIONS = []
+
+version_table = Table(
+    VERSION_TABLE, MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+def migration(version, description):
+    """Register a function(engine, batch_size) as the migration to `version`."""
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return register
+
+def _quote(engine, name):
+    return engine.dialect.identifier_preparer.quote_identifier(name)
+
+@contextmanager
+def _ddl_transaction(engine):
+    """Transaction for a DDL statement that gives up rather than queue behind long locks."""
+    with engine.begin() as conn:
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text(f"SET LOCAL lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'"))
+        yield conn
+
+def add_column(engine, table_name, column_name, definition):
+    """
+    Add a column if the table doesn't have it yet.
+
+    Args:
+        engine: SQLAlchemy engine
+        table_name (str): Table to add the column to
+        column_name (str): New column
+        definition (str): Column type and options, e.g. "BOOLEAN DEFAULT FALSE".
+                          Only constant defaults, so PostgreSQL doesn't rewrite the table.
+
+    Returns:
+        bool: True if the column was added
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(table_name):
+        print(f"  Table {table_name} doesn't exist, skipping {column_name}.")
+        return False
+    if column_name in {column['name'] for column in inspector.get_columns(table_name)}:
+        return False
+
+    with _ddl_transaction(engine) as conn:
+        conn.execute(text(f"ALTER TABLE {_quote(engine, table_name)} ADD COLUMN {column_name} {definition}"))
+    print(f"  Added column {table_name}.{column_name}")
+    return True
+
+def create_index(engine, index_name, table_name, columns, unique=False):
+    """
+    Create an index if it doesn't exist, without blocking writes on PostgreSQL.
+
+    Returns:
+        bool: True if the index was created
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(table_name):
+        return False
+    if index_name in {index['name'] for index in inspector.get_indexes(table_name)}:
+        return False
+
+    column_list = ', '.join(columns)
+    unique_sql = 'UNIQUE ' if unique else ''
+    if engine.dialect.name == 'postgresql':
+        # CONCURRENTLY can't run inside a transaction block
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(
+                f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {index_name} "
+                f"ON {_quote(engine, table_name)} ({column_list})"
+            ))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE {unique_sql}INDEX IF NOT EXISTS {index_name} ON {_quote(engine, table_name)} ({column_list})"
+            ))
+    print(f"  Created index {index_name}")
+    return True
+
+def backfill(engine, table_name, assignments, condition, params=None,
+             batch_size=BACKFILL_BATCH_SIZE, key='id'):
+    """
+    UPDATE the rows of a table matching `condition`, one key range at a time.
+
+    Each range of `batch_size` key values is updated and committed in its own
+    transaction, so locks are only held on a few rows at once, and progress
+    is printed every few seconds.
+
+    Args:
+        engine: SQLAlchemy engine
+        table_name (str): Table to update
+        assignments (str): SQL SET clause, e.g. "paid_amount = 0"
+        condition (str): SQL condition selecting the rows still to backfill,
+                         so the backfill can be resumed if interrupted
+        params (dict, optional): Bind parameters used in the SQL
+        batch_size (int): Key values per batch
+        key (str): Integer column to split the table into ranges by
+
+    Returns:
+        int: Number of rows updated
+    """
+    table = _quote(engine, table_name)
+    with engine.connect() as conn:
+        low, high = conn.execute(text(f"SELECT MIN({key}), MAX({key}) FROM {table}")).one()
+    if low is None:
+        return 0
+
+    statement = text(
+        f"UPDATE {table} SET {assignments} "
+        f"WHERE {key} >= :batch_start AND {key} < :batch_end AND ({condition})"
+    )
+    updated = 0
+    start = last_report = time.perf_counter()
+    for batch_start in range(low, high + 1, batch_size):
+        with engine.begin() as conn:
+            result = conn.execute(statement, {**(params or {}), 'batch_start': batch_start,
+                                              'batch_end': batch_start + batch_size})
+        updated += max(result.rowcount, 0)
+
+        now = time.perf_counter()
+        if now - last_report >= PROGRESS_INTERVAL:
+            done = (min(batch_start + batch_size, high + 1) - low) / (high + 1 - low)
+            print(f"  {table_name}: {done:.0%} scanned, {updated:,} rows updated "
+                  f"({updated / (now - start):,.0f} rows/s)")
+            last_report = now
+
+    if updated:
+        print(f"  Backfilled {updated:,} rows of {table_name} in {time.perf_counter() - start:.1f} s")
+    return updated
+
+def set_not_null(engine, table_name, column_name):
+    """
+    Make a column NOT NULL once every row has a value.
+
+    On PostgreSQL the column is first covered by a CHECK constraint that is
+    validated without blocking writes, which lets SET NOT NULL skip its own
+    full-table scan under an exclusive lock. SQLite can't change an existing
+    column, so there the constraint is left to the model.
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+    columns = {column['name']: column for column in inspect(engine).get_columns(table_name)}
+    if column_name not in columns or not columns[column_name]['nullable']:
+        return
+
+    table = _quote(engine, table_name)
+    constraint = f"{table_name}_{column_name}_not_null"
+    with _ddl_transaction(engine) as conn:
+        conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {constraint}"))
+        conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {constraint} CHECK ({column_name} IS NOT NULL) NOT VALID"))
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}"))
+    with _ddl_transaction(engine) as conn:
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column_name} SET NOT NULL"))
+        conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {constraint}"))
+    print(f"  Made {table_name}.{column_name} NOT NULL")
+
+# Migrations. Never change one that has been released; add a new version instead.
+
+@migration(1, "Add contact.emergency_contact")
+def _add_emergency_contact(engine, batch_size):
+    add_column(engine, 'contact', 'emergency_contact', 'BOOLEAN DEFAULT FALSE')
+
+@migration(2, "Add fee.fee_type")
+def _add_fee_type(engine, batch_size):
+    add_column(engine, 'fee', 'fee_type', "VARCHAR(50) DEFAULT 'billing_period'")
+
+@migration(3, "Add fee.due_date and fee.paid_amount")
+def _add_fee_due_date(engine, batch_size):
+    add_column(engine, 'fee', 'due_date', 'TIMESTAMP')
+    # Added without a default so rows still to be backfilled stay NULL
+    add_column(engine, 'fee', 'paid_amount', 'FLOAT')
+
+    # Due 30 days after the fee date by default
+    if engine.dialect.name == 'postgresql':
+        due_date = "date + interval '30 days'"
+    else:
+        due_date = "datetime(date, '+30 days')"
+    backfill(engine, 'fee', f"due_date = {due_date}", "due_date IS NULL", batch_size=batch_size)
+    backfill(engine, 'fee',
+             "paid_amount = (SELECT COALESCE(SUM(payment.amount), 0) FROM payment WHERE payment.fee_id = fee.id)",
+             "paid_amount IS NULL", batch_size=batch_size)
+
+    if engine.dialect.name == 'postgresql':
+        with _ddl_transaction(engine) as conn:
+            conn.execute(text("ALTER TABLE fee ALTER COLUMN paid_amount SET DEFAULT 0.0"))
+    set_not_null(engine, 'fee', 'due_date')
+
+@migration(4, "Add the (paid, due_date) index used by the overdue reminder sweep")
+def _add_fee_due_date_index(engine, batch_size):
+    create_index(engine, 'ix_fee_paid_due_date', 'fee', ['paid', 'due_date'])
+
+@migration(5, "Store magic link tokens hashed in user.token_hash")
+def _add_user_token_hash(engine, batch_size):
+    add_column(engine, 'user', 'token_hash', 'VARCHAR(64)')
+    create_index(engine, 'ix_user_token_hash', 'user', ['token_hash'], unique=True)
+
+    # Plaintext tokens from before are cleared, so those login links stop working
+    if 'token' in {column['name'] for column in inspect(engine).get_columns('user')}:
+        cleared = backfill(engine, 'user', "token = NULL, token_expiry = NULL", "token IS NOT NULL",
+                           batch_size=batch_size)
+        print(f"  Cleared {cleared} plaintext tokens")
+
+# Table -> column holding each row's creation time, used to backfill updated_at
+UPDATED_AT_TABLES = {
+    'contact': 'created_at',
+    'property': 'created_at',
+    'contact_property': 'created_at',
+    'payment': 'created_at',
+    'fee': 'created_at',
+    'billing_period': 'created_at',
+    'activity_log': 'timestamp',
+    'expense': 'created_at',
+    'strata_settings': 'created_at',
+    'user': 'created_at',
+    'outbound_email': 'created_at',
+    'fee_reminder': 'sent_at',
+    'payer_fingerprint': 'last_confirmed_at',
+}
+
+@migration(6, "Add updated_at for incremental backups")
+def _add_updated_at(engine, batch_size):
+    # Existing rows get the time they were created (or logged), so the first
+    # incremental backup after a full one only picks up rows changed since
+    now = datetime.utcnow()
+    inspector = inspect(engine)
+    for table_name, created_column in UPDATED_AT_TABLES.items():
+        if not inspector.has_table(table_name):
+            continue
+        add_column(engine, table_name, 'updated_at', 'TIMESTAMP')
+        # contact_property has no id; its rows are split up by contact instead
+        key = 'contact_id' if table_name == 'contact_property' else 'id'
+        backfill(engine, table_name, f"updated_at = COALESCE({created_column}, :now)", "updated_at IS NULL",
+                 params={'now': now}, batch_size=batch_size, key=key)
+        create_index(engine, f"ix_{table_name}_updated_at", table_name, ['updated_at'])
+
+def applied_versions(engine):
+    """{version: applied_at} of the migrations recorded in the version table."""
+    version_table.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return dict(conn.execute(version_table.select().with_only_columns(
+            version_table.c.version, version_table.c.applied_at
+        )).all())
+
+def pending_migrations():
+    """
+    The migrations this database hasn't had yet.
+
+    Returns:
+        list: (version, description) of each, in version order
+    """
+    with app.app_context():
+        # Only reads, so a web worker checking this never creates the table
+        applied = applied_versions(db.engine) if inspect(db.engine).has_table(VERSION_TABLE) else {}
+    return [(version, description) for version, description, _ in MIGRATIONS if version not in applied]
+
+@contextmanager
+def _migration_lock(engine, wait=False):
+    """Hold a PostgreSQL advisory lock so only one runner migrates at a time."""
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if wait:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {'id': ADVISORY_LOCK_ID})
+        elif not conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {'id': ADVISORY_LOCK_ID}).scalar():
+            raise RuntimeError("Another migration is already running")
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {'id': ADVISORY_LOCK_ID})
+
+def migrate(target=None, batch_size=BACKFILL_BATCH_SIZE, wait=False):
+    """
+    Apply the migrations the database hasn't had yet, in version order.
+
+    Args:
+        target (int, optional): Stop after this version (default: the latest)
+        batch_size (int): Rows per backfill transaction
+        wait (bool): Wait for another runner to finish instead of failing
+
+    Returns:
+        bool: True if the database is now at the target version
+    """
+    with app.app_context():
+        engine = db.engine
+        try:
+            with _migration_lock(engine, wait):
+                applied = applied_versions(engine)
+                pending = [
+                    (version, description, func) for version, description, func in MIGRATIONS
+                    if version not in applied and (target is None or version <= target)
+                ]
+                if not pending:
+                    print("Database schema is up to date.")
+                    return True
+
+                for version, description, func in pending:
+                    print(f"Applying migration {version}: {description}")
+                    start = time.perf_counter()
+                    func(engine, batch_size)
+                    with engine.begin() as conn:
+                        conn.execute(version_table.insert().values(
+                            version=version, description=description, applied_at=datetime.utcnow()
+                        ))
+                    print(f"Migration {version} applied in {time.perf_counter() - start:.1f} s")
+            return True
+        except Exception as e:
+            print(f"Migration failed: {e}")
+            print("Completed steps are kept; run the migrations again to resume.")
+            return False
+
+def list_migrations():
+    """Print every migration and when it was applied."""
+    with app.app_context():
+        applied = applied_versions(db.engine)
+    for version, description, _ in MIGRATIONS:
+        status = f"applied {applied[version]:%Y-%m-%d %H:%M}" if version in applied else "pending"
+        print(f"{version:>4}  {status:<24} {description}")
+
+def main():
+    """Parse arguments and migrate the database."""
+    parser = argparse.ArgumentParser(description='Apply outstanding schema migrations.')
+    parser.add_argument('--list', action='store_true', help='Show which migrations have been applied')
+    parser.add_argument('--target', type=int, help='Only migrate up to this version')
+    parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE,
+                        help='Rows updated per transaction when backfilling')
+    args = parser.parse_args()
+
+    if args.list:
+        list_migrations()
+        return
+    if not migrate(args.target, args.batch_size):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
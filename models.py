@@ -1,4 +1,6 @@
 from datetime import datetime, timedelta
+import hashlib
+import hmac
 import secrets
 from app import db
 
@@ -12,6 +14,7 @@ class Contact(db.Model):
     notes = db.Column(db.Text)
     emergency_contact = db.Column(db.Boolean, default=False)  # Visible to all residents if True
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationships with properties through association model
     property_associations = db.relationship("ContactProperty", back_populates="contact", cascade="all, delete-orphan")
@@ -39,6 +42,7 @@ class Property(db.Model):
     balance = db.Column(db.Float, default=0.0)
     entitlement = db.Column(db.Float, default=1.0)  # All properties now have fixed entitlement of 1.0
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationship with payments
     payments = db.relationship('Payment', backref='property', lazy=True)
@@ -89,6 +93,7 @@ class ContactProperty(db.Model):
     property_id = db.Column(db.Integer, db.ForeignKey('property.id'), primary_key=True)
     relationship_type = db.Column(db.String(50), nullable=False)  # e.g., 'owner', 'manager', 'tenant'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationships
     contact = db.relationship("Contact", back_populates="property_associations")
@@ -96,6 +101,34 @@ class ContactProperty(db.Model):
     
     def __repr__(self):
         return f"<ContactProperty {self.relationship_type}>"
+    
+    @classmethod
+    def owners_by_property(cls, property_ids=None):
+        """
+        Get the owner contact of each property in one query.
+        Keeps the first owner of each property, matching Property.get_owner().
+        
+        Args:
+            property_ids (iterable, optional): Only look up these properties
+        
+        Returns:
+            dict: {property_id: Contact}
+        """
+        query = db.session.query(cls.property_id, Contact)\
+            .join(Contact, Contact.id == cls.contact_id)\
+            .filter(cls.relationship_type == 'owner')\
+            .order_by(cls.property_id, cls.created_at)
+        
+        if property_ids is not None:
+            property_ids = list(property_ids)
+            if not property_ids:
+                return {}
+            query = query.filter(cls.property_id.in_(property_ids))
+        
+        owners = {}
+        for property_id, contact in query:
+            owners.setdefault(property_id, contact)
+        return owners
 
 class Payment(db.Model):
     """Model for payments made by property owners."""
@@ -111,6 +144,7 @@ class Payment(db.Model):
     confirmed = db.Column(db.Boolean, default=False)  # Whether the match has been confirmed by user
     transaction_id = db.Column(db.String(100), nullable=True)  # Unique identifier for the transaction (for duplicate detection)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Add relationship to fee
     fee = db.relationship('Fee', backref='payments', lazy=True, foreign_keys=[fee_id])
@@ -131,6 +165,11 @@ class Fee(db.Model):
     fee_type = db.Column(db.String(50), default="billing_period")  # Options: billing_period, opening_balance, ad_hoc
     paid_amount = db.Column(db.Float, default=0.0)  # Track partial payments
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_fee_paid_due_date', 'paid', 'due_date'),  # Used by the overdue reminder sweep
+    )
     
     def is_overdue(self, reference_date=None):
         """
@@ -169,6 +208,7 @@ class BillingPeriod(db.Model):
     total_amount = db.Column(db.Float, nullable=False)
     description = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f"<BillingPeriod {self.name}>"
@@ -181,6 +221,7 @@ class ActivityLog(db.Model):
     description = db.Column(db.String(250), nullable=False)  # Human-readable description
     related_object_type = db.Column(db.String(50), nullable=True)  # e.g., 'Property', 'Fee', 'Payment'
     related_object_id = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f"<ActivityLog {self.event_type}: {self.description[:30]}...>"
@@ -216,6 +257,7 @@ class Expense(db.Model):
     invoice_filename = db.Column(db.String(255))  # Store the uploaded invoice file name
     matched_transaction_id = db.Column(db.String(100))  # Link to a bank transaction if matched
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f"<Expense {self.name}: ${self.amount}>"
@@ -247,6 +289,7 @@ class StrataSettings(db.Model):
     bank_bsb = db.Column(db.String(10))
     bank_account_number = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f"<StrataSettings {self.strata_name}>"
@@ -267,11 +310,12 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     role = db.Column(db.String(20), default='owner')  # 'owner', 'committee', 'admin'
-    token = db.Column(db.String(100))
+    token_hash = db.Column(db.String(64), unique=True, index=True)  # SHA-256 of the magic link token
     token_expiry = db.Column(db.DateTime)
     property_id = db.Column(db.Integer, db.ForeignKey('property.id'))
     last_login = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Define relationship to property
     property = db.relationship('Property', backref='users')
@@ -279,18 +323,62 @@ class User(db.Model):
     def __repr__(self):
         return f"<User {self.email}>"
     
+    @staticmethod
+    def hash_token(token):
+        """Hash a login token for storage; only the hash is kept in the database."""
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def find_by_token(cls, token):
+        """Find the user a login token was issued to with a single index lookup."""
+        if not token:
+            return None
+        return cls.query.filter_by(token_hash=cls.hash_token(token)).first()
+    
+    @classmethod
+    def purge_expired_tokens(cls, now=None, batch_size=500):
+        """
+        Clear expired login tokens in batches.
+        
+        Args:
+            now (datetime, optional): Reference time (defaults to utcnow)
+            batch_size (int): Number of users to update per commit
+            
+        Returns:
+            int: Number of tokens cleared
+        """
+        if now is None:
+            now = datetime.utcnow()
+        
+        purged = 0
+        while True:
+            ids = [user_id for user_id, in db.session.query(cls.id)
+                   .filter(cls.token_hash.isnot(None), cls.token_expiry < now)
+                   .limit(batch_size)]
+            if not ids:
+                break
+            
+            cls.query.filter(cls.id.in_(ids)).update(
+                {'token_hash': None, 'token_expiry': None},
+                synchronize_session=False
+            )
+            db.session.commit()
+            purged += len(ids)
+        return purged
+    
     def generate_login_token(self, expiry_minutes=30):
         """Generate a secure token for magic link login."""
-        self.token = secrets.token_urlsafe(32)
+        token = secrets.token_urlsafe(32)
+        self.token_hash = self.hash_token(token)
         self.token_expiry = datetime.utcnow() + timedelta(minutes=expiry_minutes)
-        return self.token
+        return token
     
     def is_token_valid(self, token):
         """Check if the provided token is valid and not expired."""
-        if not self.token or not self.token_expiry:
+        if not self.token_hash or not self.token_expiry or not token:
             return False
         
-        if self.token != token:
+        if not hmac.compare_digest(self.token_hash, self.hash_token(token)):
             return False
             
         if datetime.utcnow() > self.token_expiry:
@@ -300,9 +388,106 @@ class User(db.Model):
     
     def invalidate_token(self):
         """Invalidate the current token after use."""
-        self.token = None
+        self.token_hash = None
         self.token_expiry = None
     
     def update_last_login(self):
         """Update the last login timestamp."""
         self.last_login = datetime.utcnow()
+
+
+class OutboundEmail(db.Model):
+    """Model for the durable outbound email queue (outbox)."""
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(255), nullable=False)  # Comma-separated recipient list
+    recipient_domain = db.Column(db.String(120), index=True)  # Domain of the first recipient, used for rate limiting
+    subject = db.Column(db.String(255), nullable=False)
+    text_content = db.Column(db.Text, nullable=False)
+    html_content = db.Column(db.Text)
+    priority = db.Column(db.Integer, default=5, nullable=False)  # Lower is sent first; 0 is the login lane
+    status = db.Column(db.String(20), default='pending', nullable=False)  # 'pending', 'sending', 'sent', 'dead'
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=6, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime)  # When a worker claimed the message
+    last_error = db.Column(db.Text)
+    sent_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_outbound_email_queue', 'status', 'priority', 'next_attempt_at'),
+    )
+    
+    def __repr__(self):
+        return f"<OutboundEmail {self.id} to {self.to_email} ({self.status})>"
+    
+    @property
+    def recipients(self):
+        """Get the recipient list."""
+        return [address.strip() for address in self.to_email.split(',') if address.strip()]
+
+
+class FeeReminder(db.Model):
+    """Model for overdue reminders sent for a fee, used to enforce a reminder cooldown."""
+    id = db.Column(db.Integer, primary_key=True)
+    fee_id = db.Column(db.Integer, db.ForeignKey('fee.id'), nullable=False)
+    contact_id = db.Column(db.Integer, db.ForeignKey('contact.id'))
+    email = db.Column(db.String(120))
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_fee_reminder_fee_sent', 'fee_id', 'sent_at'),
+    )
+    
+    def __repr__(self):
+        return f"<FeeReminder fee={self.fee_id} at {self.sent_at}>"
+
+
+class SchedulerState(db.Model):
+    """Model for the last run time of each scheduled job."""
+    job_name = db.Column(db.String(100), primary_key=True)
+    last_run_at = db.Column(db.DateTime)
+    last_result = db.Column(db.Text)  # JSON-encoded metrics from the last run
+    
+    def __repr__(self):
+        return f"<SchedulerState {self.job_name} at {self.last_run_at}>"
+
+
+class RateLimitBucket(db.Model):
+    """Model for token buckets shared between workers by the rate limiter."""
+    key = db.Column(db.String(255), primary_key=True)  # e.g. 'login_email:owner@example.com'
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False, index=True)  # Unix time of the last refill
+    
+    def __repr__(self):
+        return f"<RateLimitBucket {self.key}: {self.tokens:.1f}>"
+
+
+class ServerSession(db.Model):
+    """Model for server-side session data; the cookie only carries the session ID."""
+    id = db.Column(db.String(64), primary_key=True)  # SHA-256 of the session ID in the cookie
+    data = db.Column(db.Text, nullable=False)  # Serialised with Flask's session serializer
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<ServerSession expires {self.expires_at}>"
+
+
+class PayerFingerprint(db.Model):
+    """Model for payer fingerprints learned from confirmed payments, used to match repeat payers."""
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 of the normalised tokens
+    property_id = db.Column(db.Integer, db.ForeignKey('property.id'), nullable=False)
+    tokens = db.Column(db.String(300))  # Normalised tokens, kept for troubleshooting
+    times_confirmed = db.Column(db.Integer, default=1, nullable=False)
+    last_confirmed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        db.UniqueConstraint('fingerprint', 'property_id', name='uq_payer_fingerprint_property'),
+    )
+    
+    def __repr__(self):
+        return f"<PayerFingerprint {self.tokens} -> Property {self.property_id}>"
@@ -0,0 +1,197 @@
+"""
+Overdue reminder sweep for StrataHub application.
+Finds fees that have become overdue since the last sweep, resolves their
+owners in bulk and hands reminders to the batched email sender.
+
+Each overdue fee gets one reminder. Repeat reminders for fees still unpaid
+are opt-in: set REMINDER_MAX_REPEATS to send up to that many more, each
+REMINDER_COOLDOWN_DAYS after the last.
+
+The sweeps run from the scheduler, which the web workers start by default
+(see main.start_background_workers). With SCHEDULER_INLINE=0, run it from
+cron instead, e.g. every 15 minutes:
+
+    */15 * * * * cd /path/to/app && python scheduler.py --once
+"""
+
+import os
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+
+from app import app, db
+from models import Fee, ContactProperty, FeeReminder
+import email_queue
+import mail_merge
+import scheduler
+
+REMINDER_COOLDOWN_DAYS = int(os.environ.get('REMINDER_COOLDOWN_DAYS', 7))
+SWEEP_INTERVAL_SECONDS = int(os.environ.get('REMINDER_SWEEP_INTERVAL', 6 * 3600))
+# Reminders sent after the first while a fee stays unpaid (0 turns them off)
+REMINDER_MAX_REPEATS = int(os.environ.get('REMINDER_MAX_REPEATS', 0))
+REPEAT_SWEEP_INTERVAL_SECONDS = 24 * 3600
+
+def _start_of_day(value):
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def find_overdue_fees(now, since=None):
+    """
+    Find unpaid fees that are overdue as of `now`.
+
+    Uses a single indexed query. If `since` is given, only fees that became
+    overdue after that time are returned, along with overdue fees added or
+    changed since then (e.g. entered with a due date already past).
+
+    Args:
+        now (datetime): Reference time
+        since (datetime, optional): Time of the previous sweep
+
+    Returns:
+        list: Fee objects with their property loaded
+    """
+    # A fee is overdue once its due date (ignoring time) is on or before today
+    query = Fee.query.options(joinedload(Fee.property)).filter(
+        Fee.paid == False,
+        Fee.due_date < _start_of_day(now) + timedelta(days=1)
+    )
+
+    if since is not None:
+        # Sweeps run on local time; updated_at is stored in UTC
+        since_utc = since + (datetime.utcnow() - datetime.now())
+        query = query.filter(or_(
+            # Fees due on or before the previous sweep's date were already overdue then
+            Fee.due_date >= _start_of_day(since) + timedelta(days=1),
+            Fee.updated_at >= since_utc
+        ))
+
+    return query.order_by(Fee.due_date.asc()).all()
+
+def reminder_history(fee_ids):
+    """
+    Get how many reminders each fee has had, and when the last one was sent.
+
+    Returns:
+        dict: Fee ID -> (count, last sent_at), for fees with any reminders
+    """
+    if not fee_ids:
+        return {}
+
+    rows = db.session.query(FeeReminder.fee_id, db.func.count(FeeReminder.id), db.func.max(FeeReminder.sent_at))\
+        .filter(FeeReminder.fee_id.in_(fee_ids))\
+        .group_by(FeeReminder.fee_id)\
+        .all()
+    return {fee_id: (count, last_sent) for fee_id, count, last_sent in rows}
+
+def sweep_overdue_fees(since=None, now=None, cooldown_days=REMINDER_COOLDOWN_DAYS, max_reminders=1,
+                       dry_run_dir=None):
+    """
+    Send reminders for fees that have become overdue.
+
+    Args:
+        since (datetime, optional): Previous sweep time; None scans every overdue fee
+        now (datetime, optional): Reference time (defaults to now)
+        cooldown_days (int): Skip fees reminded within this many days
+        max_reminders (int, optional): Skip fees that have had this many reminders (None for no limit)
+        dry_run_dir (str, optional): Write .eml files here instead of queueing mail
+
+    Returns:
+        dict: Metrics for the sweep (scanned, eligible, sent and skip counts)
+    """
+    if now is None:
+        now = datetime.now()
+
+    fees = find_overdue_fees(now, since)
+    metrics = {
+        'scanned': len(fees),
+        'skipped_cooldown': 0,
+        'skipped_limit': 0,
+        'skipped_no_owner': 0,
+        'eligible': 0,
+        'sent': 0
+    }
+    if not fees:
+        return metrics
+
+    history = reminder_history([fee.id for fee in fees])
+    cooldown_cutoff = datetime.utcnow() - timedelta(days=cooldown_days)
+    owners = ContactProperty.owners_by_property({fee.property_id for fee in fees})
+
+    pairs = []
+    for fee in fees:
+        count, last_sent = history.get(fee.id, (0, None))
+        if max_reminders is not None and count >= max_reminders:
+            metrics['skipped_limit'] += 1
+            continue
+        if last_sent is not None and last_sent >= cooldown_cutoff:
+            metrics['skipped_cooldown'] += 1
+            continue
+
+        owner = owners.get(fee.property_id)
+        if not owner or not owner.email:
+            metrics['skipped_no_owner'] += 1
+            continue
+
+        pairs.append((fee, owner))
+
+    metrics['eligible'] = len(pairs)
+    if not pairs:
+        return metrics
+
+    if dry_run_dir:
+        results = mail_merge.send_bulk_notifications(pairs, 'overdue_reminder', dry_run_dir=dry_run_dir)
+        metrics['sent'] = mail_merge.summarize_results(results)['sent']
+        return metrics
+
+    # Record the reminders in the same commit as the queued emails
+    for fee, owner in pairs:
+        db.session.add(FeeReminder(fee_id=fee.id, contact_id=owner.id, email=owner.email))
+
+    queued = email_queue.enqueue_batch(pairs, 'overdue_reminder', priority=email_queue.PRIORITY_BULK)
+    metrics['sent'] = queued['queued']
+    return metrics
+
+def sweep_repeat_reminders(now=None, cooldown_days=REMINDER_COOLDOWN_DAYS, dry_run_dir=None):
+    """Remind every overdue fee again once its cooldown has passed, up to REMINDER_MAX_REPEATS times."""
+    return sweep_overdue_fees(now=now, cooldown_days=cooldown_days,
+                              max_reminders=1 + REMINDER_MAX_REPEATS, dry_run_dir=dry_run_dir)
+
+def _scheduled_sweep(last_run):
+    """Scheduler entry point: remind fees that became overdue since the last run."""
+    return sweep_overdue_fees(since=last_run)
+
+def _scheduled_repeat_sweep(last_run):
+    """Scheduler entry point: send repeat reminders for fees still unpaid."""
+    return sweep_repeat_reminders()
+
+scheduler.register_job('overdue_reminders', SWEEP_INTERVAL_SECONDS, _scheduled_sweep)
+if REMINDER_MAX_REPEATS > 0:
+    scheduler.register_job('overdue_repeat_reminders', REPEAT_SWEEP_INTERVAL_SECONDS, _scheduled_repeat_sweep)
+
+def main():
+    """Parse arguments and run a reminder sweep."""
+    parser = argparse.ArgumentParser(description='Send reminders for overdue fees.')
+    parser.add_argument('--all', action='store_true',
+                        help='Consider every overdue fee, not just those overdue since the last sweep')
+    parser.add_argument('--repeat', action='store_true',
+                        help='Send repeat reminders (needs REMINDER_MAX_REPEATS) instead of first reminders')
+    parser.add_argument('--cooldown-days', type=int, default=REMINDER_COOLDOWN_DAYS,
+                        help='Skip fees reminded within this many days')
+    parser.add_argument('--dry-run-dir', help='Write reminders to this directory instead of sending')
+    args = parser.parse_args()
+
+    if args.repeat and REMINDER_MAX_REPEATS <= 0:
+        parser.error("set REMINDER_MAX_REPEATS to send repeat reminders")
+
+    with app.app_context():
+        if args.repeat:
+            metrics = sweep_repeat_reminders(cooldown_days=args.cooldown_days, dry_run_dir=args.dry_run_dir)
+        else:
+            since = None if args.all else scheduler.get_last_run('overdue_reminders')
+            metrics = sweep_overdue_fees(since=since, cooldown_days=args.cooldown_days,
+                                         dry_run_dir=args.dry_run_dir)
+        print(metrics)
+
+if __name__ == "__main__":
+    main()
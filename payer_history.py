@@ -0,0 +1,207 @@
+"""
+Payer history module for StrataHub application.
+Learns which property each recurring payer pays for from confirmed payments,
+so reconciliation can match repeat statements with one indexed lookup
+before falling back to heuristics.
+"""
+
+import re
+import hashlib
+import argparse
+from datetime import datetime
+
+from app import app, db
+from models import Payment, PayerFingerprint
+
+# Words that say nothing about who paid
+NOISE_WORDS = {
+    'a', 'and', 'the', 'to', 'from', 'for', 'of', 'by', 'ref', 'reference',
+    'payment', 'pmt', 'pay', 'paid', 'transfer', 'trf', 'tfr', 'xfer', 'txn', 'trn',
+    'deposit', 'dep', 'credit', 'cr', 'internet', 'online', 'mobile', 'banking', 'netbank',
+    'bpay', 'eft', 'direct', 'osko', 'fast',
+    'strata', 'fee', 'fees', 'levy', 'levies', 'quarterly', 'quarter', 'admin', 'fund',
+    'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
+    'january', 'february', 'march', 'april', 'june', 'july', 'august', 'september',
+    'october', 'november', 'december', 'q1', 'q2', 'q3', 'q4',
+}
+
+def normalize_tokens(reference, description):
+    """
+    Reduce a transaction's text to the tokens that identify the payer.
+
+    Lowercases, drops noise words and anything with four or more digits
+    (dates, years, receipt and account numbers), and sorts the unique
+    tokens so word order doesn't matter.
+
+    Returns:
+        list: Sorted tokens
+    """
+    text = f"{reference or ''} {description or ''}".lower()
+    tokens = set()
+    for token in re.findall(r'[a-z0-9]+', text):
+        if token in NOISE_WORDS or sum(ch.isdigit() for ch in token) >= 4:
+            continue
+        tokens.add(token)
+    return sorted(tokens)
+
+def fingerprint(reference, description):
+    """
+    Get the payer fingerprint of a transaction.
+
+    Returns:
+        tuple: (SHA-256 hex digest, normalised token string), or (None, '')
+               if nothing identifying is left
+    """
+    tokens = normalize_tokens(reference, description)
+    if not tokens:
+        return None, ''
+    joined = ' '.join(tokens)
+    return hashlib.sha256(joined.encode('utf-8')).hexdigest(), joined
+
+def _confidence(times_confirmed, total_confirmations):
+    """
+    Confidence (0-100) for a learned match.
+
+    Grows with the number of confirmations and shrinks when the same
+    fingerprint has also been confirmed against other properties.
+    """
+    if times_confirmed >= 3:
+        base = 98
+    elif times_confirmed == 2:
+        base = 95
+    else:
+        base = 90
+    return round(base * times_confirmed / total_confirmations)
+
+def lookup_payments(payments):
+    """
+    Look up learned properties for a batch of transactions in one query.
+
+    Args:
+        payments (list): Payment dictionaries with reference and description
+
+    Returns:
+        dict: {index in payments: {'property_id', 'confidence', 'times_confirmed'}}
+    """
+    fingerprints = {}
+    for index, payment in enumerate(payments):
+        if payment['amount'] <= 0:
+            continue
+        digest, _ = fingerprint(payment.get('reference'), payment.get('description'))
+        if digest:
+            fingerprints[index] = digest
+
+    if not fingerprints:
+        return {}
+
+    candidates = {}
+    rows = db.session.query(
+        PayerFingerprint.fingerprint, PayerFingerprint.property_id, PayerFingerprint.times_confirmed
+    ).filter(PayerFingerprint.fingerprint.in_(set(fingerprints.values())))
+    for digest, property_id, times_confirmed in rows:
+        candidates.setdefault(digest, []).append((times_confirmed, property_id))
+
+    matches = {}
+    for index, digest in fingerprints.items():
+        if digest not in candidates:
+            continue
+        times_confirmed, property_id = max(candidates[digest])
+        total = sum(count for count, _ in candidates[digest])
+        matches[index] = {
+            'property_id': property_id,
+            'confidence': _confidence(times_confirmed, total),
+            'times_confirmed': times_confirmed
+        }
+    return matches
+
+def record_confirmed_payment(reference, description, property_id, confirmed_at=None):
+    """
+    Learn from a payment confirmed against a property.
+
+    Adds to the current session; the caller commits.
+    """
+    digest, tokens = fingerprint(reference, description)
+    if not digest or not property_id:
+        return None
+
+    entry = PayerFingerprint.query.filter_by(fingerprint=digest, property_id=property_id).first()
+    if entry:
+        entry.times_confirmed += 1
+        entry.last_confirmed_at = confirmed_at or datetime.utcnow()
+    else:
+        entry = PayerFingerprint(
+            fingerprint=digest,
+            property_id=property_id,
+            tokens=tokens[:300],
+            times_confirmed=1,
+            last_confirmed_at=confirmed_at or datetime.utcnow()
+        )
+        db.session.add(entry)
+        # Flush so a second payment from the same payer in this batch finds it
+        db.session.flush()
+    return entry
+
+def rebuild_from_payments():
+    """
+    Rebuild the fingerprint table from every confirmed incoming payment.
+
+    Returns:
+        int: Number of fingerprints stored
+    """
+    PayerFingerprint.query.delete()
+
+    counts = {}
+    rows = db.session.query(Payment.reference, Payment.description, Payment.property_id, Payment.date)\
+        .filter(Payment.confirmed == True, Payment.property_id.isnot(None), Payment.amount > 0)
+    for reference, description, property_id, date in rows:
+        digest, tokens = fingerprint(reference, description)
+        if not digest:
+            continue
+        key = (digest, int(property_id))
+        times, last, _ = counts.get(key, (0, None, tokens))
+        counts[key] = (times + 1, max(last, date) if last else date, tokens)
+
+    for (digest, property_id), (times, last, tokens) in counts.items():
+        db.session.add(PayerFingerprint(
+            fingerprint=digest,
+            property_id=property_id,
+            tokens=tokens[:300],
+            times_confirmed=times,
+            last_confirmed_at=last
+        ))
+    db.session.commit()
+    return len(counts)
+
+def report_hit_rate(payments, matches):
+    """
+    Print how many incoming transactions were matched from payer history.
+
+    Returns:
+        dict: incoming, hits, hit_rate and average confidence
+    """
+    incoming = sum(1 for payment in payments if payment['amount'] > 0)
+    hits = len(matches)
+    stats = {
+        'incoming': incoming,
+        'hits': hits,
+        'hit_rate': round(100.0 * hits / incoming, 1) if incoming else 0.0,
+        'average_confidence': round(sum(m['confidence'] for m in matches.values()) / hits, 1) if hits else 0.0
+    }
+    print(f"Payer history: matched {hits} of {incoming} incoming transactions "
+          f"({stats['hit_rate']}%), average confidence {stats['average_confidence']}")
+    return stats
+
+def main():
+    """Parse arguments and rebuild the payer history."""
+    parser = argparse.ArgumentParser(description='Manage learned payer-to-property matches.')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild from all confirmed payments')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        with app.app_context():
+            print(f"Stored {rebuild_from_payments()} payer fingerprints.")
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
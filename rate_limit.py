@@ -0,0 +1,214 @@
+"""
+Rate limiting module for StrataHub application.
+Token-bucket limits keyed by client IP, email or property, checked before a
+view runs so abusive requests are turned away without touching SMTP.
+
+Buckets live in process memory by default. Set RATE_LIMIT_STORE=database to
+share them between workers through the rate_limit_bucket table.
+"""
+
+import os
+import time
+import threading
+from functools import wraps
+
+from flask import request, Response
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import RateLimitBucket
+import scheduler
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')
+# Only trust X-Forwarded-For when running behind a proxy that sets it
+TRUST_PROXY = os.environ.get('RATE_LIMIT_TRUST_PROXY') == '1'
+# Memory store size at which idle, full buckets are pruned
+MAX_MEMORY_BUCKETS = 10000
+# Shared buckets idle for longer than this are deleted by the sweeper
+BUCKET_RETENTION_SECONDS = 24 * 3600
+
+def parse_rate(value):
+    """
+    Parse a rate written as "<requests>/<seconds>", e.g. "5/900".
+
+    Returns:
+        tuple: (capacity, period_seconds)
+    """
+    capacity, period = value.split('/', 1)
+    return int(capacity), int(period)
+
+class Limit:
+    """A token bucket rule: `capacity` requests per `period` seconds for each key."""
+
+    def __init__(self, name, rate, key_func, when=None):
+        """
+        Args:
+            name (str): Bucket prefix, e.g. 'login_ip'
+            rate (str): Rate as "<requests>/<seconds>"
+            key_func (callable): Returns the key for the current request, or None to skip
+            when (callable, optional): Returns whether the limit applies to the current request
+        """
+        self.name = name
+        self.capacity, self.period = parse_rate(rate)
+        self.refill_rate = self.capacity / self.period
+        self.key_func = key_func
+        self.when = when
+
+class MemoryBucketStore:
+    """Token buckets held in this process."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, limit, now):
+        """
+        Take one token from a bucket.
+
+        Returns:
+            float: 0 if allowed, otherwise seconds until a token is available
+        """
+        with self.lock:
+            tokens, updated_at = self.buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated_at) * limit.refill_rate)
+
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                retry_after = 0
+            else:
+                self.buckets[key] = (tokens, now)
+                retry_after = (1 - tokens) / limit.refill_rate
+
+            if len(self.buckets) > MAX_MEMORY_BUCKETS:
+                self._prune(now)
+            return retry_after
+
+    def _prune(self, now):
+        """Drop buckets that have been idle long enough to be full again."""
+        cutoff = now - BUCKET_RETENTION_SECONDS
+        for key in [key for key, (_, updated_at) in self.buckets.items() if updated_at < cutoff]:
+            del self.buckets[key]
+        # Still too many: drop the least recently used half
+        if len(self.buckets) > MAX_MEMORY_BUCKETS:
+            by_age = sorted(self.buckets, key=lambda key: self.buckets[key][1])
+            for key in by_age[:len(by_age) // 2]:
+                del self.buckets[key]
+
+class DatabaseBucketStore:
+    """Token buckets in the rate_limit_bucket table, shared by every worker."""
+
+    def take(self, key, limit, now, retry=True):
+        """
+        Take one token from a bucket, locking its row for the update.
+
+        Returns:
+            float: 0 if allowed, otherwise seconds until a token is available
+        """
+        table = RateLimitBucket.__table__
+        try:
+            # Own short transaction, separate from the request's session
+            with db.engine.begin() as connection:
+                row = connection.execute(
+                    select(table.c.tokens, table.c.updated_at)
+                    .where(table.c.key == key)
+                    .with_for_update()
+                ).first()
+
+                if row is None:
+                    connection.execute(insert(table).values(key=key, tokens=limit.capacity - 1, updated_at=now))
+                    return 0
+
+                tokens = min(limit.capacity, row.tokens + (now - row.updated_at) * limit.refill_rate)
+                retry_after = 0 if tokens >= 1 else (1 - tokens) / limit.refill_rate
+                if tokens >= 1:
+                    tokens -= 1
+
+                connection.execute(update(table).where(table.c.key == key).values(tokens=tokens, updated_at=now))
+                return retry_after
+        except IntegrityError:
+            # Another worker created the bucket first
+            if retry:
+                return self.take(key, limit, now, retry=False)
+            return 0
+
+def purge_idle_buckets(now=None):
+    """
+    Delete shared buckets that have been idle for BUCKET_RETENTION_SECONDS.
+
+    Returns:
+        int: Number of buckets deleted
+    """
+    if now is None:
+        now = time.time()
+    result = db.session.execute(
+        delete(RateLimitBucket).where(RateLimitBucket.updated_at < now - BUCKET_RETENTION_SECONDS)
+    )
+    db.session.commit()
+    return result.rowcount
+
+_store = DatabaseBucketStore() if RATE_LIMIT_STORE == 'database' else MemoryBucketStore()
+
+def client_ip():
+    """Get the client IP address of the current request."""
+    if TRUST_PROXY and request.headers.get('X-Forwarded-For'):
+        return request.headers['X-Forwarded-For'].split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+def form_email():
+    """Get the normalised email address posted with the request, if any."""
+    email = (request.form.get('email') or '').strip().lower()
+    return email or None
+
+def form_property():
+    """Get the property ID posted with the request, if any."""
+    return request.form.get('property_id') or None
+
+def check_limits(limits):
+    """
+    Take a token from every bucket that applies to the current request.
+
+    Returns:
+        float: 0 if the request is allowed, otherwise the longest wait in seconds
+    """
+    now = time.time()
+    retry_after = 0
+    for limit in limits:
+        if limit.when is not None and not limit.when():
+            continue
+        key = limit.key_func()
+        if key is None:
+            continue
+        retry_after = max(retry_after, _store.take(f"{limit.name}:{key}", limit, now))
+    return retry_after
+
+def rate_limit(*limits, methods=None):
+    """
+    Decorator to apply token-bucket limits to a view.
+    Usage: @rate_limit(Limit('login_ip', '10/600', client_ip), methods=['POST'])
+
+    Requests over the limit get a plain 429 response before the view runs.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if RATE_LIMIT_ENABLED and (methods is None or request.method in methods):
+                retry_after = check_limits(limits)
+                if retry_after:
+                    print(f"Rate limit exceeded for {request.path} from {client_ip()}")
+                    return Response(
+                        "Too many requests. Please wait a few minutes and try again.\n",
+                        status=429,
+                        mimetype='text/plain',
+                        headers={'Retry-After': str(int(retry_after) + 1)}
+                    )
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _scheduled_purge(last_run):
+    """Scheduler entry point: delete idle shared buckets."""
+    return {'purged': purge_idle_buckets()}
+
+scheduler.register_job('rate_limit_buckets', 3600, _scheduled_purge)
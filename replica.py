@@ -0,0 +1,197 @@
+"""
+Read replica routing.
+
+Views marked with @read_only send their queries to the database in
+DATABASE_REPLICA_URL, leaving the primary to the requests that write. The
+primary is used instead when:
+
+- no replica is configured, or the request isn't a GET/HEAD
+- the replica is unreachable or more than REPLICA_MAX_LAG_SECONDS behind
+  (checked at most every REPLICA_CHECK_INTERVAL seconds per process)
+- the user wrote something in the last REPLICA_STICKY_SECONDS, so they
+  always see their own changes
+- the request has already written something itself
+
+If a query on the replica fails, the view is run again on the primary.
+Locally, point DATABASE_REPLICA_URL at a copy of the SQLite database (or a
+second PostgreSQL database) to try it out; only PostgreSQL reports lag.
+"""
+import os
+import time
+import logging
+import threading
+from functools import wraps
+
+from flask import g, request, session, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, exc, text
+
+import db_pool
+
+REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 10))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
+# How long a user's reads stay on the primary after they write
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 30))
+STICKY_SESSION_KEY = '_primary_reads_until'
+
+logger = logging.getLogger(__name__)
+
+_engine = None
+_engine_lock = threading.Lock()
+_check_lock = threading.Lock()
+_health = {'checked_at': 0.0, 'usable': False, 'lag': None, 'error': None}
+_counts = {'replica_requests': 0, 'primary_requests': 0, 'sticky_requests': 0, 'fallbacks': 0}
+_counts_lock = threading.Lock()
+
+# Replication lag in seconds; zero when the replica has replayed everything it received
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+def _count(name):
+    with _counts_lock:
+        _counts[name] += 1
+
+def get_engine():
+    """The replica engine, created on first use in each process."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                options = db_pool.engine_options(REPLICA_URL)
+                # The pool metrics are for the primary's pool
+                options.pop('poolclass', None)
+                if REPLICA_URL.startswith('postgresql'):
+                    # A replica that is down shouldn't hold up the request for long
+                    options['connect_args'] = {'connect_timeout': 2}
+                _engine = create_engine(REPLICA_URL, **options)
+                event.listen(_engine, 'handle_error', _on_replica_error)
+    return _engine
+
+def _on_replica_error(context):
+    if has_request_context():
+        g.replica_failed = True
+
+def replica_lag(conn):
+    """Seconds the replica is behind the primary (always 0 where it can't tell)."""
+    if conn.dialect.name == 'postgresql':
+        return float(conn.execute(text(POSTGRES_LAG_SQL)).scalar())
+    conn.execute(text("SELECT 1"))
+    return 0.0
+
+def replica_available():
+    """Whether the replica is reachable and close enough to the primary to read from."""
+    if not REPLICA_URL:
+        return False
+    if time.monotonic() - _health['checked_at'] < REPLICA_CHECK_INTERVAL:
+        return _health['usable']
+    # One request re-checks; the others go on with the last result
+    if not _check_lock.acquire(blocking=False):
+        return _health['usable']
+    try:
+        with get_engine().connect() as conn:
+            lag = replica_lag(conn)
+        _health.update(usable=lag <= REPLICA_MAX_LAG_SECONDS, lag=lag, error=None)
+        if lag > REPLICA_MAX_LAG_SECONDS:
+            logger.warning(f"Read replica is {lag:.1f} s behind; reading from the primary")
+    except exc.DBAPIError as e:
+        mark_unavailable(e)
+        if has_request_context():
+            g.pop('replica_failed', None)
+    finally:
+        _health['checked_at'] = time.monotonic()
+        _check_lock.release()
+    return _health['usable']
+
+def mark_unavailable(error):
+    """Stop reading from the replica until the next health check."""
+    logger.warning(f"Read replica unavailable, reading from the primary: {error}")
+    _health.update(usable=False, error=str(error).splitlines()[0], checked_at=time.monotonic())
+
+def _sticky():
+    return session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+def read_only(f):
+    """
+    Decorator for views that only read: their GET and HEAD requests query the
+    replica when it is safe to. Put it below the auth decorators, so the
+    current user is still looked up on the primary.
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not REPLICA_URL or request.method not in ('GET', 'HEAD'):
+            return f(*args, **kwargs)
+        if _sticky():
+            _count('sticky_requests')
+            return f(*args, **kwargs)
+        if not replica_available():
+            _count('primary_requests')
+            return f(*args, **kwargs)
+
+        _count('replica_requests')
+        g.replica_failed = False
+        g.read_replica = True
+        # Lets the response cache tell that this page may be behind the primary
+        g.replica_used = True
+        try:
+            return f(*args, **kwargs)
+        except exc.DBAPIError as e:
+            if not g.pop('replica_failed', False):
+                raise
+            # The replica failed mid-request: run the view again on the primary
+            mark_unavailable(e)
+            _count('fallbacks')
+            g.read_replica = False
+            g.replica_used = False
+            from app import db
+            db.session.rollback()
+            return f(*args, **kwargs)
+        finally:
+            g.read_replica = False
+    return wrapper
+
+class RoutingSession(Session):
+    """Session that sends reads made in @read_only views to the replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and has_request_context()
+                and g.get('read_replica') and not g.get('wrote')
+                and not getattr(clause, 'is_dml', False)):
+            return get_engine()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(db_session, flush_context):
+    db_session.info['wrote'] = True
+    if has_request_context():
+        # Anything else this request reads comes from the primary
+        g.wrote = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(db_session):
+    if db_session.info.pop('wrote', False) and REPLICA_URL and has_request_context():
+        # Read your own writes: stay on the primary until the replica catches up
+        session[STICKY_SESSION_KEY] = time.time() + REPLICA_STICKY_SECONDS
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _after_rollback(db_session):
+    db_session.info.pop('wrote', None)
+
+def status():
+    """Replica configuration, health and routing counts for this process."""
+    with _counts_lock:
+        counts = dict(_counts)
+    return {
+        'configured': bool(REPLICA_URL),
+        'usable': _health['usable'],
+        'lag_seconds': _health['lag'],
+        'error': _health['error'],
+        'max_lag_seconds': REPLICA_MAX_LAG_SECONDS,
+        'sticky_seconds': REPLICA_STICKY_SECONDS,
+        'counts': counts,
+    }
@@ -0,0 +1,149 @@
+"""
+Reporting module for StrataHub application.
+Builds strata-wide financial reports from grouped SQL aggregates so the
+same result can feed emails, downloads and on-screen pages.
+"""
+
+import csv
+from io import StringIO, BytesIO
+from datetime import datetime, timedelta
+
+from app import db
+from models import Property, Fee, Payment, ContactProperty
+
+# Column order shared by the CSV and XLSX exports
+SUMMARY_COLUMNS = [
+    ('unit_number', 'Unit'),
+    ('owner_name', 'Owner'),
+    ('total_fees', 'Total Fees'),
+    ('total_paid', 'Paid'),
+    ('overdue_amount', 'Overdue'),
+    ('balance', 'Balance'),
+    ('status', 'Status'),
+]
+
+class FinancialSummary:
+    """Strata-wide financial totals plus one row per property."""
+
+    def __init__(self, rows, generated_on, period=None):
+        self.rows = rows
+        self.generated_on = generated_on
+        self.period = period
+        self.total_fees = sum(row['total_fees'] for row in rows)
+        self.total_paid = sum(row['total_paid'] for row in rows)
+        self.overdue_amount = sum(row['overdue_amount'] for row in rows)
+
+    @property
+    def net_position(self):
+        """Total payments less total fees."""
+        return self.total_paid - self.total_fees
+
+    def to_csv(self):
+        """
+        Export the per-property rows as CSV.
+
+        Returns:
+            str: CSV content
+        """
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow([label for _, label in SUMMARY_COLUMNS])
+        for row in self.rows:
+            writer.writerow([row[key] for key, _ in SUMMARY_COLUMNS])
+        return output.getvalue()
+
+    def to_xlsx(self):
+        """
+        Export the per-property rows as an Excel workbook.
+
+        Requires openpyxl to be installed.
+
+        Returns:
+            bytes: XLSX file content
+        """
+        import pandas as pd
+
+        df = pd.DataFrame(
+            [[row[key] for key, _ in SUMMARY_COLUMNS] for row in self.rows],
+            columns=[label for _, label in SUMMARY_COLUMNS]
+        )
+        totals = pd.DataFrame([{
+            'Total Fees': self.total_fees,
+            'Total Payments': self.total_paid,
+            'Overdue Amount': self.overdue_amount,
+            'Net Position': self.net_position,
+            'Generated On': self.generated_on.strftime('%Y-%m-%d %H:%M'),
+        }])
+
+        output = BytesIO()
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            df.to_excel(writer, sheet_name='Properties', index=False)
+            totals.to_excel(writer, sheet_name='Summary', index=False)
+        return output.getvalue()
+
+def build_financial_summary(property_ids=None, reference_date=None, period=None):
+    """
+    Build the financial summary with grouped aggregates.
+
+    Runs a fixed number of queries regardless of the number of units:
+    properties, fee totals, payment totals and owner names.
+
+    Args:
+        property_ids (list, optional): Restrict the report to these properties
+        reference_date (datetime, optional): Date used to decide what is overdue
+        period (str, optional): Period description (e.g., "April 2025")
+
+    Returns:
+        FinancialSummary: Totals and per-property rows
+    """
+    if reference_date is None:
+        reference_date = datetime.now()
+    # Match Fee.is_overdue(), which compares dates without the time component
+    tomorrow = reference_date.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    properties_query = db.session.query(Property.id, Property.unit_number).order_by(Property.id)
+    if property_ids is not None:
+        properties_query = properties_query.filter(Property.id.in_(property_ids))
+    properties = properties_query.all()
+
+    overdue_expr = db.case(
+        (db.and_(Fee.paid == False, Fee.due_date < tomorrow), Fee.amount - db.func.coalesce(Fee.paid_amount, 0)),
+        else_=0
+    )
+    fee_query = db.session.query(
+        Fee.property_id,
+        db.func.coalesce(db.func.sum(Fee.amount), 0),
+        db.func.coalesce(db.func.sum(overdue_expr), 0)
+    ).group_by(Fee.property_id)
+
+    payment_query = db.session.query(
+        Payment.property_id,
+        db.func.coalesce(db.func.sum(Payment.amount), 0)
+    ).filter(Payment.amount > 0, Payment.property_id.isnot(None)).group_by(Payment.property_id)
+
+    if property_ids is not None:
+        fee_query = fee_query.filter(Fee.property_id.in_(property_ids))
+        payment_query = payment_query.filter(Payment.property_id.in_(property_ids))
+
+    fee_totals = {property_id: (total, overdue) for property_id, total, overdue in fee_query}
+    payment_totals = dict(payment_query.all())
+    owners = ContactProperty.owners_by_property(property_ids)
+
+    rows = []
+    for property_id, unit_number in properties:
+        total_fees, overdue_amount = fee_totals.get(property_id, (0.0, 0.0))
+        total_paid = payment_totals.get(property_id, 0.0)
+        balance = total_paid - total_fees
+
+        rows.append({
+            'id': property_id,
+            'unit_number': unit_number,
+            'owner_name': owners[property_id].name if property_id in owners else "No owner assigned",
+            'total_fees': float(total_fees),
+            'total_paid': float(total_paid),
+            'overdue_amount': float(overdue_amount),
+            'balance': float(balance),
+            'status': "Paid" if balance >= 0 else "Outstanding"
+        })
+
+    return FinancialSummary(rows, datetime.now(), period)
@@ -0,0 +1,249 @@
+"""
+Response cache for expensive pages.
+
+Views marked with @cached_page(Model, ...) keep their rendered HTML and serve
+it again until one of the listed models (or the strata settings, which every
+page shows) changes. Pages are keyed by route and query string, the user's
+role and property scope (their own property for owners, everything for
+admins and committee members) and today's date, so users who would see the
+same page share it. The navbar's email address and unit are filled in for
+each user when the page is served.
+
+Every commit bumps a generation token for each table it wrote to (see
+change_tracking.py); a cached page is only served while the tokens it was
+rendered under are current. Writes made outside the ORM session (raw SQL,
+other processes without RESPONSE_CACHE_DIR) aren't seen, so pages also
+expire after RESPONSE_CACHE_TTL seconds.
+
+    RESPONSE_CACHE_SIZE   pages kept in memory per process (default 256;
+                          0 turns the cache off)
+    RESPONSE_CACHE_TTL    seconds a page is served for at most (default 300)
+    RESPONSE_CACHE_DIR    directory to also keep pages and generation tokens
+                          in, so gunicorn workers share them and see each
+                          other's writes (default: memory only; with more
+                          than one worker gunicorn.conf.py sets one on tmpfs)
+
+Pages aren't cached while flash messages are waiting to be shown, and a page
+read from the read replica isn't stored if its data changed within the
+replica's allowed lag.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+
+from flask import g, request, session, make_response
+from markupsafe import escape
+from sqlalchemy import inspect
+
+from app import app
+from models import StrataSettings
+from auth import get_current_user
+import change_tracking
+import replica
+
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 300))
+RESPONSE_CACHE_DIR = os.environ.get('RESPONSE_CACHE_DIR') or None
+# Expired page files are removed after every this many stores
+PRUNE_EVERY = 100
+
+# Stand-ins for the per-user navbar values in cached pages
+PLACEHOLDERS = {
+    'user_email': '@@response-cache:user_email@@',
+    'user_property': '@@response-cache:user_property@@',
+}
+
+logger = logging.getLogger(__name__)
+
+_pages = OrderedDict()
+_pages_lock = threading.Lock()
+_counts = {'hits': 0, 'misses': 0, 'stores': 0, 'bypassed': 0}
+_counts_lock = threading.Lock()
+
+def _count(name):
+    with _counts_lock:
+        _counts[name] += 1
+
+def _page_path(key):
+    return os.path.join(RESPONSE_CACHE_DIR, 'pages', hashlib.sha256(key.encode()).hexdigest() + '.json')
+
+def _recently_changed(current):
+    """Whether any of these tables changed within the read replica's allowed lag."""
+    now = time.time()
+    return any(now - change_tracking.changed_at(token) < replica.REPLICA_MAX_LAG_SECONDS
+               for token in current.values())
+
+# Pages
+
+def _lookup(key, current):
+    with _pages_lock:
+        entry = _pages.get(key)
+        if entry is not None:
+            _pages.move_to_end(key)
+    if not _valid(entry, current) and RESPONSE_CACHE_DIR:
+        # Another worker may have rendered it since
+        try:
+            with open(_page_path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if _valid(entry, current):
+            _remember(key, entry)
+    return entry if _valid(entry, current) else None
+
+def _valid(entry, current):
+    return (entry is not None and entry['generations'] == current
+            and time.time() - entry['stored_at'] < RESPONSE_CACHE_TTL)
+
+def _remember(key, entry):
+    with _pages_lock:
+        _pages[key] = entry
+        _pages.move_to_end(key)
+        while len(_pages) > RESPONSE_CACHE_SIZE:
+            _pages.popitem(last=False)
+
+def _store(key, entry):
+    _remember(key, entry)
+    _count('stores')
+    if not RESPONSE_CACHE_DIR:
+        return
+    try:
+        change_tracking.write_file(_page_path(key), json.dumps(entry))
+    except OSError as e:
+        logger.warning(f"Couldn't write a cached page to {RESPONSE_CACHE_DIR}: {e}")
+    if _counts['stores'] % PRUNE_EVERY == 0:
+        prune()
+
+def prune():
+    """
+    Delete page files that have expired.
+
+    Returns:
+        int: Number of files deleted
+    """
+    if not RESPONSE_CACHE_DIR:
+        return 0
+    directory = os.path.join(RESPONSE_CACHE_DIR, 'pages')
+    cutoff = time.time() - RESPONSE_CACHE_TTL
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+def clear():
+    """Drop every cached page held in memory by this process."""
+    with _pages_lock:
+        _pages.clear()
+
+def _cache_key(user):
+    scope = user.property_id if user.role == 'owner' else 'all'
+    # The navbar is drawn from the session: its role, and whether it shows
+    # a unit or the email address
+    navbar = (session.get('user_role'), bool(session.get('user_property')))
+    return '|'.join(str(part) for part in (
+        request.full_path, user.role, scope, *navbar, date.today().isoformat()
+    ))
+
+def _personalise(body):
+    """Fill the current user's details into a cached page."""
+    for name, placeholder in PLACEHOLDERS.items():
+        body = body.replace(placeholder, str(escape(session.get(name) or '')))
+    return body
+
+@app.context_processor
+def inject_user_placeholders():
+    """While a page is rendered for the cache, leave the user's details out of it."""
+    if not g.get('response_cache_rendering'):
+        return {}
+    return {
+        'user': {
+            'user_id': session.get('user_id'),
+            'user_email': PLACEHOLDERS['user_email'],
+            'user_role': session.get('user_role'),
+            'user_property': PLACEHOLDERS['user_property'] if session.get('user_property') else None,
+        }
+    }
+
+def cached_page(*models):
+    """
+    Decorator for GET views whose HTML only changes when the given models do.
+    Put it below the auth decorators, so access is still checked on every
+    request, and above @read_only, so cache hits don't touch the database.
+
+    Args:
+        *models: Models the page is rendered from
+    """
+    tables = sorted({table.name for model in models + (StrataSettings,)
+                     for table in inspect(model).tables})
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if (not RESPONSE_CACHE_SIZE or request.method not in ('GET', 'HEAD')
+                    or session.get('_flashes')):
+                _count('bypassed')
+                return f(*args, **kwargs)
+
+            key = _cache_key(get_current_user())
+            # Taken before the view runs, so a page is never stored under a
+            # generation newer than the data it was rendered from
+            current = change_tracking.generations(tables)
+            entry = _lookup(key, current)
+            if entry is not None:
+                _count('hits')
+                return make_response(_personalise(entry['body']), 200, {'Content-Type': entry['content_type']})
+
+            _count('misses')
+            g.response_cache_rendering = True
+            g.replica_used = False
+            try:
+                response = make_response(f(*args, **kwargs))
+            finally:
+                g.response_cache_rendering = False
+            if response.direct_passthrough or response.mimetype != 'text/html':
+                return response
+
+            body = response.get_data(as_text=True)
+            if (response.status_code == 200 and not session.get('_flashes')
+                    and not (g.replica_used and _recently_changed(current))):
+                _store(key, {
+                    'body': body,
+                    'content_type': response.content_type,
+                    'generations': current,
+                    'stored_at': time.time(),
+                })
+            response.set_data(_personalise(body))
+            return response
+        return wrapper
+    return decorator
+
+def status():
+    """Cache settings, size and hit counts for this process."""
+    with _counts_lock:
+        counts = dict(_counts)
+    with _pages_lock:
+        entries = len(_pages)
+    return {
+        'enabled': bool(RESPONSE_CACHE_SIZE),
+        'size': RESPONSE_CACHE_SIZE,
+        'entries': entries,
+        'ttl_seconds': RESPONSE_CACHE_TTL,
+        'directory': RESPONSE_CACHE_DIR,
+        'counts': counts,
+    }
@@ -26,7 +26,7 @@ if [ "$1" != "" ]; then
 else
     # Use latest backups
     SCHEMA_FILE="db_backups/latest_schema.sql"
-    DATA_FILE="db_backups/latest_data_backup.sql"
+    DATA_FILE="db_backups/latest_data_backup.sql.gz"
     
     if [ ! -f "$SCHEMA_FILE" ]; then
         echo "Error: Latest schema backup $SCHEMA_FILE not found."
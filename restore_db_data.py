@@ -2,73 +2,711 @@
 """
 Script to restore database data from a SQL backup file.
 This script assumes the database schema already exists.
+
+Reads compressed COPY backups from backup_db_data.py as well as older plain
+files of INSERT statements, streaming the file rather than loading it into
+memory. COPY blocks are loaded with COPY FROM STDIN on PostgreSQL and with
+batched executemany() inserts elsewhere. Secondary indexes and foreign keys
+are dropped for the load and rebuilt once at the end, all in one transaction.
+
+Directory backups (backup_db_data.py --jobs N) can be loaded with several
+tables at once using --jobs; each table then commits on its own, and
+--verify compares the restored tables with the backup's manifest.
+Given an incremental backup (backup_db_data.py --incremental), the full
+backup it builds on is restored first and each increment is then applied in
+turn, deleting the rows that were deleted and upserting the ones that changed.
 """
+import io
 import os
+import re
 import sys
+import gzip
+import time
 import datetime
 import argparse
-from sqlalchemy import create_engine, text
+from decimal import Decimal
+from sqlalchemy import create_engine, insert, select, text, and_, bindparam, MetaData
+
+from backup_db_data import include_table, copy_statement, read_manifest, backup_chain, run_jobs, verify_backup
+
+# Rows per executemany() call when COPY FROM STDIN isn't available
+RESTORE_BATCH_SIZE = 5000
+# Legacy INSERT statements sent to PostgreSQL per round trip
+STATEMENT_BATCH_SIZE = 500
+# Tables loaded at once from a directory backup
+RESTORE_JOBS = int(os.environ.get('RESTORE_JOBS', 1))
+
+# Foreign keys are handled by the restore itself, and changing the
+# replication role needs superuser rights most hosted databases don't grant
+_SKIPPED_STATEMENT = re.compile(r"^SET\s+session_replication_role\b", re.IGNORECASE)
+_COPY_STATEMENT = re.compile(
+    r'^COPY\s+("(?:[^"]|"")+"|[\w.]+)\s*\((.*)\)\s*FROM\s+stdin\s*;$', re.IGNORECASE | re.DOTALL
+)
+# Characters that can change how the rest of a statement is read
+_SPECIAL = re.compile(r"""[;'"]|--|/\*|\$[A-Za-z_]*\$""")
+_COPY_ESCAPE = re.compile(r'\\(x[0-9a-fA-F]{1,2}|[0-7]{1,3}|.)')
+_COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+
+def open_backup(path):
+    """Open a backup file for reading as text, decompressing .gz files."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r')
+
+def _closing_quote(line, position, quote, backslash_escapes):
+    """
+    Find the end of a quoted string, identifier, comment or dollar-quoted body.
+
+    Returns:
+        int: Position just after the closing delimiter, or -1 if it is on a later line
+    """
+    while True:
+        end = line.find(quote, position)
+        if end < 0:
+            return -1
+        if backslash_escapes:
+            backslashes = len(line[position:end]) - len(line[position:end].rstrip('\\'))
+            if backslashes % 2:
+                position = end + 1
+                continue
+        # A doubled quote ('' or "") is an escaped quote, not the end
+        if quote in ("'", '"') and line.startswith(quote, end + 1):
+            position = end + 2
+            continue
+        return end + len(quote)
+
+def iter_statements(lines):
+    """
+    Split SQL into statements without reading it all into memory.
+
+    Semicolons inside string literals, quoted identifiers, comments and
+    dollar-quoted bodies don't end a statement. Lines are taken from the
+    iterator as they are needed, so after a COPY ... FROM stdin statement is
+    yielded the caller can read its data rows from the same iterator.
+
+    Args:
+        lines: Iterator over the lines of the file
+
+    Yields:
+        str: Each statement, including its closing semicolon
+    """
+    buffer = []
+    quote = None
+    backslash_escapes = False
+    for line in lines:
+        if not buffer and quote is None:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('--'):
+                continue
+
+        start = 0
+        position = 0
+        while position < len(line):
+            if quote is not None:
+                position = _closing_quote(line, position, quote, backslash_escapes)
+                if position < 0:
+                    break
+                quote = None
+                continue
+
+            match = _SPECIAL.search(line, position)
+            if not match:
+                break
+            token = match.group()
+            position = match.end()
+
+            if token == ';':
+                buffer.append(line[start:position])
+                start = position
+                statement = ''.join(buffer).strip()
+                buffer = []
+                if statement != ';':
+                    yield statement
+            elif token == '--':
+                position = len(line)
+                # Drop a comment that would otherwise start the next statement
+                if not buffer and not line[start:match.start()].strip():
+                    start = position
+            elif token == '/*':
+                quote = '*/'
+                backslash_escapes = False
+            else:
+                quote = token
+                # E'...' strings use backslash escapes
+                before = line[max(0, match.start() - 2):match.start()]
+                backslash_escapes = token == "'" and before[-1:] in ('e', 'E') and not before[:-1].isalnum()
+
+        rest = line[start:]
+        if buffer or rest.strip():
+            buffer.append(rest)
+
+    statement = ''.join(buffer).strip()
+    if statement and not statement.startswith('--'):
+        yield statement
+
+def _unquote_identifier(name):
+    name = name.strip()
+    if name.startswith('"') and name.endswith('"'):
+        return name[1:-1].replace('""', '"')
+    return name
+
+def parse_copy_statement(statement):
+    """
+    Get the table and columns of a COPY ... FROM stdin statement.
+
+    Returns:
+        tuple: (table name, [column names]), or None for other statements
+    """
+    match = _COPY_STATEMENT.match(statement)
+    if not match:
+        return None
+    columns = [_unquote_identifier(column) for column in match.group(2).split(',') if column.strip()]
+    return _unquote_identifier(match.group(1)), columns
+
+def _unescape(match):
+    escape = match.group(1)
+    if escape[0] == 'x' and len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    if escape[0].isdigit():
+        return chr(int(escape, 8))
+    return _COPY_ESCAPES.get(escape, escape)
+
+def decode_copy_value(field):
+    """Decode one field of a COPY text row; \\N becomes None."""
+    if field == '\\N':
+        return None
+    if '\\' not in field:
+        return field
+    return _COPY_ESCAPE.sub(_unescape, field)
+
+def _parse_bool(value):
+    return value.lower() in ('t', 'true', '1', 'y', 'yes', 'on')
+
+def _parse_bytes(value):
+    return bytes.fromhex(value[2:]) if value.startswith('\\x') else value.encode('utf-8')
+
+_CONVERTERS = {
+    bool: _parse_bool,
+    int: int,
+    float: float,
+    Decimal: Decimal,
+    datetime.datetime: datetime.datetime.fromisoformat,
+    datetime.date: datetime.date.fromisoformat,
+    datetime.time: datetime.time.fromisoformat,
+    bytes: _parse_bytes,
+}
+
+def _column_converter(column):
+    """Function turning a COPY text field into the column's Python type."""
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return None
+    return _CONVERTERS.get(python_type)
+
+class _CopyBlockReader(io.TextIOBase):
+    """Reads the rows of one COPY block from a backup, stopping at its \\. line."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.done = False
+        self.rows = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        chunk = []
+        length = 0
+        while not self.done and (size is None or size < 0 or length < size):
+            line = next(self.lines, '\\.\n')
+            if line.rstrip('\r\n') == '\\.':
+                self.done = True
+                break
+            chunk.append(line)
+            length += len(line)
+            self.rows += 1
+        return ''.join(chunk)
+
+    def __iter__(self):
+        for line in self.lines:
+            if line.rstrip('\r\n') == '\\.':
+                break
+            self.rows += 1
+            yield line
+        self.done = True
+
+def load_copy_block(conn, statement, table, columns, lines):
+    """
+    Load the data rows following a COPY statement.
+
+    Args:
+        conn: Connection inside the restore transaction
+        statement (str): The COPY ... FROM stdin statement
+        table (Table): Reflected target table (used when COPY isn't available)
+        columns (list): Column names in the order of the rows
+        lines: Line iterator positioned at the first data row
+
+    Returns:
+        int: Number of rows loaded
+    """
+    reader = _CopyBlockReader(lines)
+
+    if conn.dialect.name == 'postgresql':
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(statement.rstrip(';'), reader)
+        finally:
+            cursor.close()
+        return reader.rows
+
+    statement = insert(table)
+    for batch in iter_row_batches(reader, table, columns):
+        conn.execute(statement, batch)
+    return reader.rows
+
+def iter_row_batches(lines, table, columns):
+    """Decode COPY data rows into lists of up to RESTORE_BATCH_SIZE {column: value} dicts."""
+    converters = [_column_converter(table.c[column]) for column in columns]
+    batch = []
+    for line in lines:
+        row = {}
+        for column, converter, field in zip(columns, converters, line.rstrip('\r\n').split('\t')):
+            value = decode_copy_value(field)
+            row[column] = converter(value) if converter and value is not None else value
+        batch.append(row)
+        if len(batch) >= RESTORE_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _upsert_statement(conn, table, columns):
+    """INSERT ... ON CONFLICT on the primary key that overwrites the existing row, or None if unsupported."""
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif conn.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+
+    key_columns = [column.name for column in table.primary_key.columns]
+    statement = dialect_insert(table)
+    updates = {column: statement.excluded[column] for column in columns if column not in key_columns}
+    if not updates:
+        return statement.on_conflict_do_nothing(index_elements=key_columns)
+    return statement.on_conflict_do_update(index_elements=key_columns, set_=updates)
+
+def _key_condition(table):
+    """WHERE clause matching one row by primary key, with the key columns as bind parameters."""
+    return and_(*(column == bindparam(f"key_{column.name}") for column in table.primary_key.columns))
+
+def upsert_copy_block(conn, table, columns, lines):
+    """
+    Insert the data rows of a COPY block, replacing rows with the same primary key.
+
+    Returns:
+        int: Number of rows written
+    """
+    reader = _CopyBlockReader(lines)
+    statement = _upsert_statement(conn, table, columns)
+    for batch in iter_row_batches(reader, table, columns):
+        if statement is None:
+            # No upsert on this database: replace the rows instead
+            conn.execute(table.delete().where(_key_condition(table)), [
+                {f"key_{column.name}": row[column.name] for column in table.primary_key.columns}
+                for row in batch
+            ])
+            conn.execute(insert(table), batch)
+        else:
+            conn.execute(statement, batch)
+    return reader.rows
+
+def _read_keys(path, table, key_columns, columns=None):
+    """
+    Yield primary key tuples from a keys file, or, given `columns`, from the
+    key columns of a table file.
+    """
+    columns = columns or key_columns
+    positions = [columns.index(column) for column in key_columns]
+    converters = [_column_converter(table.c[column]) for column in key_columns]
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\r\n').split('\t')
+            key = []
+            for position, converter in zip(positions, converters):
+                value = decode_copy_value(fields[position])
+                key.append(converter(value) if converter and value is not None else value)
+            yield tuple(key)
+
+def delete_missing_rows(conn, table, path, key_format, columns=None):
+    """
+    Delete the rows whose primary key isn't listed in `path`, i.e. the rows
+    deleted from the backed up database since the previous backup.
+
+    Args:
+        conn: Connection inside the increment's transaction
+        table (Table): Reflected table
+        path (str): Keys file (or, with `columns`, a full table file)
+        key_format (str): 'ranges' of integer ids or one 'keys' tuple per line
+        columns (list, optional): Columns of a table file to read the keys from
+    """
+    key_columns = [column.name for column in table.primary_key.columns]
 
-def restore_data(backup_file=None):
+    if key_format == 'ranges':
+        key = table.primary_key.columns[key_columns[0]]
+        gap = table.delete().where(key.between(bindparam('low'), bindparam('high')))
+        gaps = []
+        previous = None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                first, last = (int(value) for value in line.split('\t'))
+                if previous is None:
+                    conn.execute(table.delete().where(key < first))
+                elif first > previous + 1:
+                    gaps.append({'low': previous + 1, 'high': first - 1})
+                    if len(gaps) >= RESTORE_BATCH_SIZE:
+                        conn.execute(gap, gaps)
+                        gaps = []
+                previous = last
+        if gaps:
+            conn.execute(gap, gaps)
+        conn.execute(table.delete() if previous is None else table.delete().where(key > previous))
+        return
+
+    kept = set(_read_keys(path, table, key_columns, columns))
+    primary_key = list(table.primary_key.columns)
+    missing = [
+        {f"key_{column}": value for column, value in zip(key_columns, key)}
+        for key in conn.execute(select(*primary_key)).all()
+        if tuple(key) not in kept
+    ]
+    for offset in range(0, len(missing), RESTORE_BATCH_SIZE):
+        conn.execute(table.delete().where(_key_condition(table)), missing[offset:offset + RESTORE_BATCH_SIZE])
+
+def _execute_statements(conn, statements):
+    """Run plain SQL statements as they are, without bind parameter parsing."""
+    if not statements:
+        return
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        if conn.dialect.name == 'postgresql':
+            # One round trip for the whole batch
+            cursor.execute(';\n'.join(statements))
+        else:
+            for statement in statements:
+                cursor.execute(statement)
+    finally:
+        cursor.close()
+
+def defer_indexes_and_constraints(conn, table_names):
+    """
+    Drop secondary indexes (and, on PostgreSQL, foreign keys) before a bulk load.
+
+    Primary keys and unique constraints stay in place. On SQLite, foreign
+    key checks are deferred to the commit instead.
+
+    Returns:
+        list: SQL statements that rebuild what was dropped, in order
+    """
+    preparer = conn.dialect.identifier_preparer
+    rebuild = []
+
+    if conn.dialect.name == 'postgresql':
+        foreign_keys = conn.execute(text("""
+            SELECT t.relname AS table_name, c.conname, pg_get_constraintdef(c.oid) AS definition
+            FROM pg_constraint c
+            JOIN pg_class t ON t.oid = c.conrelid
+            JOIN pg_namespace n ON n.oid = t.relnamespace
+            WHERE c.contype = 'f' AND n.nspname = current_schema() AND t.relname = ANY(:tables)
+        """), {'tables': list(table_names)}).all()
+        indexes = conn.execute(text("""
+            SELECT t.relname AS table_name, i.relname AS index_name, pg_get_indexdef(i.oid) AS definition
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            JOIN pg_class t ON t.oid = x.indrelid
+            JOIN pg_namespace n ON n.oid = t.relnamespace
+            WHERE n.nspname = current_schema() AND t.relname = ANY(:tables)
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+        """), {'tables': list(table_names)}).all()
+
+        for table_name, name, definition in foreign_keys:
+            conn.exec_driver_sql(f"ALTER TABLE {preparer.quote_identifier(table_name)} "
+                                 f"DROP CONSTRAINT {preparer.quote_identifier(name)}")
+        for table_name, name, definition in indexes:
+            conn.exec_driver_sql(f"DROP INDEX {preparer.quote_identifier(name)}")
+
+        rebuild += [definition for _, _, definition in indexes]
+        rebuild += [
+            f"ALTER TABLE {preparer.quote_identifier(table_name)} "
+            f"ADD CONSTRAINT {preparer.quote_identifier(name)} {definition}"
+            for table_name, name, definition in foreign_keys
+        ]
+
+    elif conn.dialect.name == 'sqlite':
+        conn.exec_driver_sql("PRAGMA defer_foreign_keys = ON")
+        placeholders = ', '.join('?' for _ in table_names)
+        indexes = conn.exec_driver_sql(
+            f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+            f"AND tbl_name IN ({placeholders})", tuple(table_names)
+        ).all()
+        for name, definition in indexes:
+            conn.exec_driver_sql(f"DROP INDEX {preparer.quote_identifier(name)}")
+        rebuild += [definition for _, definition in indexes]
+
+    return rebuild
+
+def reset_sequences(conn, tables):
+    """Move PostgreSQL id sequences past the restored ids."""
+    if conn.dialect.name != 'postgresql':
+        return
+    preparer = conn.dialect.identifier_preparer
+    for table in tables:
+        if 'id' not in table.c:
+            continue
+        quoted = preparer.quote_identifier(table.name)
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence(:table, 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) "
+            f"FROM {quoted}"
+        ), {'table': quoted})
+
+def restore_stream(conn, f):
+    """
+    Load a backup into the database on `conn`.
+
+    Args:
+        conn: Connection inside the restore transaction
+        f: Open text stream of the backup
+
+    Returns:
+        dict: {table name: (rows, seconds)}
+    """
+    metadata = MetaData()
+    metadata.reflect(bind=conn, only=lambda table_name, _: include_table(table_name))
+
+    rebuild = defer_indexes_and_constraints(conn, list(metadata.tables))
+
+    results = {}
+    pending = []
+    lines = iter(f)
+    for statement in iter_statements(lines):
+        if _SKIPPED_STATEMENT.match(statement):
+            continue
+
+        copy = parse_copy_statement(statement)
+        if copy is None:
+            pending.append(statement)
+            if len(pending) >= STATEMENT_BATCH_SIZE:
+                _execute_statements(conn, pending)
+                pending = []
+            continue
+
+        _execute_statements(conn, pending)
+        pending = []
+
+        table_name, columns = copy
+        if table_name not in metadata.tables:
+            raise ValueError(f"Backup contains table {table_name}, which doesn't exist in the database")
+        start = time.perf_counter()
+        rows = load_copy_block(conn, statement, metadata.tables[table_name], columns, lines)
+        results[table_name] = (rows, time.perf_counter() - start)
+        print(f"Restored {rows} rows into {table_name}")
+
+    _execute_statements(conn, pending)
+
+    start = time.perf_counter()
+    for statement in rebuild:
+        conn.exec_driver_sql(statement)
+    reset_sequences(conn, metadata.sorted_tables)
+    if rebuild:
+        print(f"Rebuilt {len(rebuild)} indexes and constraints in {time.perf_counter() - start:.1f} s")
+
+    return results
+
+def restore_directory(engine, directory, jobs=RESTORE_JOBS):
+    """
+    Load a directory backup, `jobs` tables at a time.
+
+    Indexes and foreign keys are dropped and committed first, each table is
+    then loaded in its own transaction, and what was dropped is rebuilt at the
+    end even if a table fails to load. SQLite allows only one writer, so it
+    always loads one table at a time.
+
+    Returns:
+        dict: {table name: (rows, seconds)}
+    """
+    manifest = read_manifest(directory)
+    if engine.dialect.name == 'sqlite':
+        jobs = 1
+
+    metadata = MetaData()
+    with engine.begin() as conn:
+        metadata.reflect(bind=conn, only=lambda table_name, _: include_table(table_name))
+        rebuild = defer_indexes_and_constraints(conn, list(metadata.tables))
+
+    def load(entry):
+        if entry['table'] not in metadata.tables:
+            raise ValueError(f"Backup contains table {entry['table']}, which doesn't exist in the database")
+        statement = copy_statement(entry['table'], entry['columns'], engine.dialect.identifier_preparer).strip()
+        start = time.perf_counter()
+        with engine.begin() as conn, gzip.open(os.path.join(directory, entry['file']), 'rt', encoding='utf-8') as f:
+            rows = load_copy_block(conn, statement, metadata.tables[entry['table']], entry['columns'], iter(f))
+        print(f"Restored {rows} rows into {entry['table']}")
+        return entry['table'], (rows, time.perf_counter() - start)
+
+    try:
+        results = dict(run_jobs(load, manifest['tables'], jobs))
+    finally:
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            for statement in rebuild:
+                conn.exec_driver_sql(statement)
+            reset_sequences(conn, metadata.sorted_tables)
+        if rebuild:
+            print(f"Rebuilt {len(rebuild)} indexes and constraints in {time.perf_counter() - start:.1f} s")
+
+    return results
+
+def apply_increment(engine, directory):
+    """
+    Apply an incremental directory backup on top of the backup it was taken after.
+
+    In one transaction, deletes the rows that are gone (tables that depend on
+    others first), then writes the changed rows over the existing ones (the
+    tables they depend on first). Tables without an updated_at column are in
+    the increment in full and are brought in line the same way.
+
+    Returns:
+        dict: {table name: (rows, seconds)}
+    """
+    manifest = read_manifest(directory)
+    metadata = MetaData()
+    results = {}
+
+    with engine.begin() as conn:
+        metadata.reflect(bind=conn, only=lambda table_name, _: include_table(table_name))
+        for entry in manifest['tables']:
+            if entry['table'] not in metadata.tables:
+                raise ValueError(f"Backup contains table {entry['table']}, which doesn't exist in the database")
+
+        for entry in reversed(manifest['tables']):
+            table = metadata.tables[entry['table']]
+            if entry.get('mode') == 'changes':
+                delete_missing_rows(conn, table, os.path.join(directory, entry['keys_file']), entry['key_format'])
+            elif table.primary_key:
+                delete_missing_rows(conn, table, os.path.join(directory, entry['file']), 'keys', entry['columns'])
+            else:
+                conn.execute(table.delete())
+
+        for entry in manifest['tables']:
+            table = metadata.tables[entry['table']]
+            start = time.perf_counter()
+            with gzip.open(os.path.join(directory, entry['file']), 'rt', encoding='utf-8') as f:
+                if table.primary_key:
+                    rows = upsert_copy_block(conn, table, entry['columns'], iter(f))
+                else:
+                    statement = copy_statement(entry['table'], entry['columns'], engine.dialect.identifier_preparer)
+                    rows = load_copy_block(conn, statement.strip(), table, entry['columns'], iter(f))
+            results[entry['table']] = (rows, time.perf_counter() - start)
+            if rows:
+                print(f"Applied {rows} changed rows to {entry['table']}")
+
+        reset_sequences(conn, metadata.sorted_tables)
+
+    return results
+
+def restore_data(backup_file=None, database_url=None, jobs=RESTORE_JOBS, verify=False):
     """
     Restore database data from a SQL backup file.
-    
+
     Args:
         backup_file: Path to the backup file to restore from.
                     If None, uses latest data backup.
-    
+        database_url: Database to restore into (defaults to DATABASE_URL)
+        jobs: Tables to load at once from a directory backup
+        verify: After restoring a directory backup, compare the tables with its manifest
+
     Returns:
         bool: True if successful, False otherwise
     """
     # Get database connection from environment
-    database_url = os.environ.get('DATABASE_URL')
+    database_url = database_url or os.environ.get('DATABASE_URL')
     if not database_url:
         print("Error: DATABASE_URL environment variable not set")
         sys.exit(1)
-    
+
     # Determine which backup file to use
     backup_dir = 'db_backups'
     if not backup_file:
-        backup_file = f"{backup_dir}/latest_data_backup.sql"
+        backup_file = f"{backup_dir}/latest_data_backup.sql.gz"
+        if not os.path.exists(backup_file):
+            # Backups taken before compression was added
+            backup_file = f"{backup_dir}/latest_data_backup.sql"
         if not os.path.exists(backup_file):
             print(f"Error: Latest backup file {backup_file} not found")
             return False
-    
+
     if not os.path.exists(backup_file):
         print(f"Error: Backup file {backup_file} not found")
         return False
-    
+
     print(f"Restoring data from {backup_file}")
-    
+
     # Connect to database
-    engine = create_engine(database_url)
-    
-    # Read the SQL file
-    with open(backup_file, 'r') as f:
-        sql_script = f.read()
-    
-    # Execute the SQL script
+    engine = create_engine(database_url, pool_size=max(jobs, 1) + 1)
+
     try:
-        with engine.begin() as conn:
-            # Execute each statement separately
-            for statement in sql_script.split(';'):
-                if statement.strip() and not statement.strip().startswith('--'):
-                    conn.execute(text(statement))
-        
-        print(f"Database data restored successfully from {backup_file}")
+        start = time.perf_counter()
+        if os.path.isdir(backup_file):
+            # An incremental backup is restored by loading the full backup it
+            # builds on, then every increment after it in order
+            chain = backup_chain(backup_file)
+            results = restore_directory(engine, chain[0][0], jobs)
+            for directory, manifest in chain[1:]:
+                print(f"Applying incremental backup {directory} (changes since {manifest['since']})")
+                for table_name, (rows, seconds) in apply_increment(engine, directory).items():
+                    total, total_seconds = results.get(table_name, (0, 0))
+                    results[table_name] = (total + rows, total_seconds + seconds)
+        else:
+            # Everything happens in one transaction, so a failed restore leaves the database as it was
+            with engine.begin() as conn, open_backup(backup_file) as f:
+                results = restore_stream(conn, f)
+        elapsed = time.perf_counter() - start
+
+        total_rows = sum(rows for rows, _ in results.values())
+        for table_name, (rows, seconds) in results.items():
+            if rows:
+                print(f"  {table_name:<25} {rows:>10,} rows  {rows / max(seconds, 1e-6):>12,.0f} rows/s")
+        print(f"Database data restored successfully from {backup_file}: "
+              f"{total_rows:,} rows in {elapsed:.1f} s ({total_rows / max(elapsed, 1e-6):,.0f} rows/s)")
+
+        if verify and os.path.isdir(backup_file):
+            problems = verify_backup(backup_file, engine)
+            for problem in problems:
+                print(f"Verification failed: {problem}")
+            if problems:
+                return False
+            print("Verified row counts and checksums against the backup")
         return True
-    
+
     except Exception as e:
         print(f"Error restoring database: {e}")
         return False
+    finally:
+        engine.dispose()
 
 def main():
     """Parse arguments and restore data."""
     parser = argparse.ArgumentParser(description='Restore database data from a backup.')
-    parser.add_argument('--file', help='Path to the backup file to restore from')
+    parser.add_argument('--file', help='Path to the backup file or directory to restore from')
+    parser.add_argument('--jobs', type=int, default=RESTORE_JOBS,
+                        help='Load this many tables at once from a directory backup')
+    parser.add_argument('--verify', action='store_true',
+                        help='Compare the restored tables with the directory backup\'s manifest')
     args = parser.parse_args()
-    
-    restore_data(args.file)
+
+    if not restore_data(args.file, jobs=args.jobs, verify=args.verify):
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
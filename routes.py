@@ -1,29 +1,40 @@
 import os
-import pandas as pd
 from datetime import datetime, timedelta
-from flask import render_template, redirect, url_for, request, flash, jsonify, session, abort, send_from_directory
+from flask import render_template, redirect, url_for, request, flash, jsonify, session, abort, send_from_directory, Response
 from werkzeug.utils import secure_filename
 from io import StringIO
 
 from app import app, db
-from models import Property, Payment, Fee, BillingPeriod, Contact, ContactProperty, ActivityLog, Expense, StrataSettings, User
+from models import Property, Payment, Fee, BillingPeriod, Contact, ContactProperty, ActivityLog, Expense, StrataSettings
 from utils import process_csv, analyze_payments, log_activity, reconcile_expenses
 import email_service
-from auth import login_required, require_role
+import email_queue
+import reports
+import search
+import payer_history
+import allocation
+import db_pool
+import replica
+import response_cache
+from replica import read_only
+from response_cache import cached_page
+from auth import login_required, require_role, get_current_user
 
 @app.route('/')
 @login_required
+@cached_page(Property, Fee, Payment, Expense, Contact, ContactProperty)
+@read_only
 def index():
     """Main dashboard showing financial status of all properties."""
     today = datetime.now()
     
-    # Get user role from session
-    user_role = session.get('user_role')
+    # Resolved once per request by login_required
+    user = get_current_user()
+    user_role = user.role
     user_property_id = None
     
     # If user is an owner, restrict view to their property only
     if user_role == 'owner':
-        user = User.query.get(session.get('user_id'))
         if user and user.property_id:
             user_property_id = user.property_id
             properties = Property.query.filter_by(id=user_property_id).all()
@@ -146,6 +157,7 @@ def index():
                            user_role=user_role)
 
 @app.route('/api/properties')
+@read_only
 def get_properties():
     """API endpoint to get all properties data."""
     properties = Property.query.all()
@@ -236,8 +248,10 @@ def reconciliation():
                     
                     # Count suggested matches
                     suggested_matches = sum(1 for p in analyzed_payments if p.get('suggested_property') is not None)
+                    history_matches = sum(1 for p in analyzed_payments
+                                          if (p.get('suggested_property') or {}).get('source') == 'history')
                     
-                    flash(f'Successfully processed {len(analyzed_payments)} transactions. Found {duplicate_count} potential duplicates and suggested matches for {suggested_matches} transactions.', 'success')
+                    flash(f'Successfully processed {len(analyzed_payments)} transactions. Found {duplicate_count} potential duplicates and suggested matches for {suggested_matches} transactions ({history_matches} from previous payments).', 'success')
                     
                     return render_template('reconciliation.html', 
                                           transactions=analyzed_payments,
@@ -515,6 +529,10 @@ def reconciliation():
                         confirmed=True
                     )
                     db.session.add(new_payment)
+                    
+                    # Remember this payer for future statements
+                    if property_id:
+                        payer_history.record_confirmed_payment(reference, description, int(property_id))
                 
                 # Update property balance - only for income transactions 
                 if not is_expense and property_id:
@@ -522,13 +540,14 @@ def reconciliation():
                     if property:
                         property.balance += amount
                     
-                    # Log the payment activity
+                    # Apply the payment to the chosen fee, following the suggested
+                    # split of lump sums, with any remainder paying the oldest fees
                     fee_info = ""
                     if fee_id:
-                        fee = Fee.query.get(fee_id)
-                        if fee:
-                            fee.paid = True
-                            fee_info = f" for {fee.description}"
+                        planned = allocation.parse_allocations(request.form.get(f'fee_allocations_{transaction_id}'))
+                        applied = allocation.apply_payment(int(property_id), amount, int(fee_id), planned)
+                        if applied:
+                            fee_info = f" for {', '.join(str(fee.description) for fee, _ in applied)}"
                     
                     # Log the activity
                     log_activity(
@@ -633,9 +652,11 @@ def fees():
             fee_date = datetime.now()
         
         # Create fees for target properties
+        notification_pairs = []
         for prop in target_properties:
             # Skip properties without owners
-            if not prop.get_owner():
+            owner = prop.get_owner()
+            if not owner:
                 continue
                 
             new_fee = Fee(
@@ -651,6 +672,8 @@ def fees():
             )
             db.session.add(new_fee)
             
+            notification_pairs.append((new_fee, owner))
+            
             # Update property balance
             prop.balance -= fee_per_unit
             
@@ -664,6 +687,11 @@ def fees():
         
         db.session.commit()
         
+        # Queue fee notifications for the owners in a single batch if requested
+        if request.form.get('notify_owners') == 'on' and notification_pairs:
+            queued = email_queue.enqueue_batch(notification_pairs, 'fee_notification')
+            flash(f"Fee notifications queued for {queued['queued']} owners", 'info')
+        
         if fee_type == 'billing_period':
             flash(f'Successfully created {period_name} fees for all properties', 'success')
         elif fee_type == 'opening_balance':
@@ -676,6 +704,7 @@ def fees():
     return render_template('fees.html', properties=properties, periods=periods)
 
 @app.route('/api/billing_periods/<int:period_id>/fees')
+@read_only
 def get_period_fees(period_id):
     """API endpoint to get fees for a specific billing period."""
     period = BillingPeriod.query.get_or_404(period_id)
@@ -872,66 +901,100 @@ def setup():
     
     return render_template('setup.html', properties=properties)
 
+def load_contact_directory(contact_filter=None):
+    """
+    Load contacts together with their property relationships.
+    
+    Uses a single Contact ⨝ ContactProperty ⨝ Property query (outer joins, so
+    contacts without properties are included) and groups the rows in Python,
+    so the number of queries doesn't grow with the number of contacts.
+    
+    Args:
+        contact_filter: Optional SQLAlchemy condition on Contact
+        
+    Returns:
+        tuple: (contacts, property_contacts, contact_units) where
+            contacts is a list of Contact objects,
+            property_contacts maps property ID to a list of contact dicts and
+            contact_units maps contact ID to {'owner': [...], 'manager': [...]} unit numbers
+    """
+    query = db.session.query(
+        Contact,
+        ContactProperty.property_id,
+        ContactProperty.relationship_type,
+        Property.unit_number
+    ).outerjoin(ContactProperty, ContactProperty.contact_id == Contact.id)\
+     .outerjoin(Property, Property.id == ContactProperty.property_id)\
+     .order_by(Contact.id, ContactProperty.created_at)
+    
+    if contact_filter is not None:
+        query = query.filter(contact_filter)
+    
+    contacts = []
+    property_contacts = {}
+    contact_units = {}
+    
+    for contact, property_id, relationship_type, unit_number in query:
+        if contact.id not in contact_units:
+            contacts.append(contact)
+            contact_units[contact.id] = {'owner': [], 'manager': []}
+        
+        if property_id is None:
+            continue
+        
+        property_contacts.setdefault(property_id, []).append({
+            'contact_id': contact.id,
+            'name': contact.name,
+            'relationship_type': relationship_type,
+            'email': contact.email,
+            'phone': contact.phone
+        })
+        if relationship_type in contact_units[contact.id]:
+            contact_units[contact.id][relationship_type].append(unit_number)
+    
+    return contacts, property_contacts, contact_units
+
+def _property_contact_filter(property_id):
+    """Condition for the contacts an owner may see: their property's contacts plus emergency contacts."""
+    return db.or_(
+        Contact.emergency_contact == True,
+        Contact.id.in_(
+            db.select(ContactProperty.contact_id).where(ContactProperty.property_id == property_id)
+        )
+    )
+
 @app.route('/contacts', methods=['GET', 'POST'])
 @login_required
+@read_only
 def contacts():
     """Page for managing contacts and owners."""
-    user_role = session.get('user_role')
+    user = get_current_user()
+    user_role = user.role
     is_admin_or_committee = user_role in ['admin', 'committee']
     
     # If user is an owner, restrict what they can see
     if user_role == 'owner':
-        user = User.query.get(session.get('user_id'))
         if user and user.property_id:
             # Get contacts that are either emergency contacts or related to this property
-            property = Property.query.get(user.property_id)
+            property = user.property
             if not property:
                 flash('Your account is not properly linked to a property. Please contact the administrator.', 'warning')
                 return redirect(url_for('index'))
             
             # Get all emergency contacts + contacts for this property
-            property_contacts_ids = [assoc.contact_id for assoc in property.contact_associations]
-            contacts = Contact.query.filter(
-                db.or_(
-                    Contact.emergency_contact == True,
-                    Contact.id.in_(property_contacts_ids)
-                )
-            ).all()
+            contacts, directory, _ = load_contact_directory(_property_contact_filter(property.id))
             
             # Only show this property
             properties = [property]
-            
-            # Pre-fetch property contacts
-            property_contacts = {property.id: []}
-            for assoc in property.contact_associations:
-                property_contacts[property.id].append({
-                    'contact_id': assoc.contact_id,
-                    'name': assoc.contact.name,
-                    'relationship_type': assoc.relationship_type,
-                    'email': assoc.contact.email,
-                    'phone': assoc.contact.phone
-                })
+            property_contacts = {property.id: directory.get(property.id, [])}
         else:
             flash('Your account is not properly linked to a property. Please contact the administrator.', 'warning')
             return redirect(url_for('index'))
     else:
         # Admin and committee users can see all contacts and properties
-        contacts = Contact.query.all()
-        properties = Property.query.all()
-        
         # Pre-fetch all property contacts to avoid the need for AJAX
-        property_contacts = {}
-        for property in properties:
-            contacts_data = []
-            for assoc in property.contact_associations:
-                contacts_data.append({
-                    'contact_id': assoc.contact_id,
-                    'name': assoc.contact.name,
-                    'relationship_type': assoc.relationship_type,
-                    'email': assoc.contact.email,
-                    'phone': assoc.contact.phone
-                })
-            property_contacts[property.id] = contacts_data
+        contacts, property_contacts, _ = load_contact_directory()
+        properties = Property.query.all()
     
     if request.method == 'POST':
         action = request.form.get('action')
@@ -973,10 +1036,10 @@ def contacts():
             contact = Contact.query.get_or_404(contact_id)
             
             # Check permission for owners - they can only edit their own contacts
-            if session.get('user_role') == 'owner':
-                user = User.query.get(session.get('user_id'))
-                if user and user.property_id:
-                    property = Property.query.get(user.property_id)
+            user = get_current_user()
+            if user and user.role == 'owner':
+                if user.property_id:
+                    property = user.property
                     if property:
                         property_contact_ids = [assoc.contact_id for assoc in property.contact_associations]
                         if int(contact_id) not in property_contact_ids:
@@ -1103,36 +1166,21 @@ def contacts():
     return render_template('contacts.html', contacts=contacts, properties=properties, property_contacts=property_contacts)
 
 @app.route('/api/contacts')
+@read_only
 def get_contacts():
     """API endpoint to get all contacts data."""
     # Check if user is owner - restrict to only their contacts and emergency contacts
-    if session.get('user_role') == 'owner':
-        user = User.query.get(session.get('user_id'))
-        if user and user.property_id:
-            property = Property.query.get(user.property_id)
-            if property:
-                # Get contact IDs related to this property
-                property_contact_ids = [assoc.contact_id for assoc in property.contact_associations]
-                # Filter contacts to only include those related to this property or emergency contacts
-                contacts = Contact.query.filter(
-                    db.or_(
-                        Contact.id.in_(property_contact_ids),
-                        Contact.emergency_contact == True
-                    )
-                ).all()
-            else:
-                return jsonify([])
-        else:
+    user = get_current_user()
+    if user and user.role == 'owner':
+        if not user.property_id:
             return jsonify([])
+        contacts, _, contact_units = load_contact_directory(_property_contact_filter(user.property_id))
     else:
-        contacts = Contact.query.all()
+        contacts, _, contact_units = load_contact_directory()
     
     contacts_data = []
     
     for contact in contacts:
-        owned_properties = [p.unit_number for p in contact.owned_properties]
-        managed_properties = [p.unit_number for p in contact.managed_properties]
-        
         contacts_data.append({
             'id': contact.id,
             'name': contact.name,
@@ -1140,24 +1188,25 @@ def get_contacts():
             'phone': contact.phone,
             'is_owner': contact.is_owner,
             'emergency_contact': contact.emergency_contact,
-            'owned_properties': owned_properties,
-            'managed_properties': managed_properties,
+            'owned_properties': contact_units[contact.id]['owner'],
+            'managed_properties': contact_units[contact.id]['manager'],
             'notes': contact.notes
         })
     
     return jsonify(contacts_data)
 
 @app.route('/api/contacts/<int:contact_id>')
+@read_only
 def get_contact(contact_id):
     """API endpoint to get a specific contact by ID."""
     contact = Contact.query.get_or_404(contact_id)
     
     # Check permissions for owners - they can only view their own contacts
     # or emergency contacts
-    if session.get('user_role') == 'owner':
-        user = User.query.get(session.get('user_id'))
-        if user and user.property_id:
-            property = Property.query.get(user.property_id)
+    user = get_current_user()
+    if user and user.role == 'owner':
+        if user.property_id:
+            property = user.property
             if property:
                 # Get contact IDs related to this property
                 property_contact_ids = [assoc.contact_id for assoc in property.contact_associations]
@@ -1180,14 +1229,15 @@ def get_contact(contact_id):
     })
 
 @app.route('/api/properties/<int:property_id>/contacts')
+@read_only
 def get_property_contacts(property_id):
     """API endpoint to get contacts for a specific property."""
     property = Property.query.get_or_404(property_id)
     
     # Check permissions for owners - they can only view their own property contacts
-    if session.get('user_role') == 'owner':
-        user = User.query.get(session.get('user_id'))
-        if user and user.property_id and user.property_id != property_id:
+    user = get_current_user()
+    if user and user.role == 'owner':
+        if user.property_id and user.property_id != property_id:
             return jsonify({"error": "Access denied"}), 403
     
     contacts_data = []
@@ -1206,18 +1256,19 @@ def get_property_contacts(property_id):
 # Property detail page
 @app.route('/property/<int:property_id>')
 @login_required
+@cached_page(Property, Fee, Payment, BillingPeriod, Contact, ContactProperty)
+@read_only
 def property_detail(property_id):
     """Detailed view of a specific property with financial history."""
     today = datetime.now()
     property = Property.query.get_or_404(property_id)
     
     # Check permissions - owner can only see their own property
-    user_role = session.get('user_role')
-    user_id = session.get('user_id')
+    user = get_current_user()
+    user_role = user.role
     
     if user_role == 'owner':
-        user = User.query.get(user_id)
-        if user and user.property_id != property_id:
+        if user.property_id != property_id:
             flash('You do not have permission to view this property.', 'danger')
             return redirect(url_for('index'))
     
@@ -1241,7 +1292,7 @@ def property_detail(property_id):
     owner = property.get_owner()
     
     # If user is owner, only show emergency contacts and their own property contacts
-    if session.get('user_role') == 'owner':
+    if user_role == 'owner':
         contacts = [assoc.contact for assoc in property.contact_associations if
                    assoc.contact.emergency_contact or assoc.contact_id == owner.id]
     else:
@@ -1291,6 +1342,8 @@ def property_detail(property_id):
 @app.route('/activity')
 @login_required
 @require_role('admin', 'committee')
+@cached_page(ActivityLog, Property, Contact, Fee, Payment, Expense)
+@read_only
 def activity():
     """Page showing system activity logs with filtering."""
     # Get filter parameters
@@ -1328,6 +1381,69 @@ def activity():
                           filter_id=filter_id,
                           date_range=date_range)
 
+# Search
+@app.route('/api/search')
+@require_role('admin', 'committee')
+def search_api():
+    """API endpoint for ranked full-text search over contacts, properties, payments and expenses."""
+    query = request.args.get('q', '').strip()
+    entity_types = request.args.getlist('type') or None
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    
+    results = search.search(query, entity_types, limit)
+    
+    # Link each result to the page it is managed on
+    property_ids = {
+        payment_id: property_id for payment_id, property_id in db.session.query(Payment.id, Payment.property_id)
+        .filter(Payment.id.in_([r['entity_id'] for r in results if r['entity_type'] == 'payment']))
+    }
+    for result in results:
+        if result['entity_type'] == 'contact':
+            result['url'] = url_for('contacts')
+        elif result['entity_type'] == 'property':
+            result['url'] = url_for('property_detail', property_id=result['entity_id'])
+        elif result['entity_type'] == 'payment' and property_ids.get(result['entity_id']):
+            result['url'] = url_for('property_detail', property_id=property_ids[result['entity_id']])
+        elif result['entity_type'] == 'payment':
+            result['url'] = url_for('reconciliation')
+        else:
+            result['url'] = url_for('expenses')
+    
+    return jsonify({'query': query, 'results': results})
+
+# Reports
+@app.route('/reports/financial-summary')
+@login_required
+@require_role('admin', 'committee')
+@read_only
+def financial_summary_report():
+    """Financial summary report with CSV and Excel downloads."""
+    summary = reports.build_financial_summary(period=request.args.get('period'))
+    export_format = request.args.get('format')
+    filename = f"financial_summary_{summary.generated_on.strftime('%Y%m%d')}"
+    
+    if export_format == 'csv':
+        return Response(
+            summary.to_csv(),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename={filename}.csv'}
+        )
+    
+    if export_format == 'xlsx':
+        try:
+            content = summary.to_xlsx()
+        except ImportError:
+            flash('Excel export requires the openpyxl package. Please download the CSV instead.', 'warning')
+            return redirect(url_for('financial_summary_report'))
+        
+        return Response(
+            content,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            headers={'Content-Disposition': f'attachment; filename={filename}.xlsx'}
+        )
+    
+    return render_template('financial_report.html', summary=summary)
+
 # Error handlers
 @app.errorhandler(404)
 def not_found_error(error):
@@ -1507,23 +1623,10 @@ def test_email():
         test_email = request.form.get('test_email')
         
         if test_email:
-            # Try to send a test email
-            success = email_service.send_email(
-                test_email,
-                "StrataHub Test Email",
-                "This is a test email from StrataHub to verify the email configuration is working correctly.",
-                html_content="""
-                <html>
-                <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                    <h2>StrataHub Test Email</h2>
-                    <p>This is a test email from StrataHub to verify the email configuration is working correctly.</p>
-                    <p>If you received this email, the email system is working properly!</p>
-                    <hr>
-                    <p><em>This is an automated test message.</em></p>
-                </body>
-                </html>
-                """
-            )
+            # Send directly rather than through the outbox, so the page
+            # reports what the SMTP server actually said
+            subject, text_content, html_content = email_service.render_test_message()
+            success = email_service.send_email(test_email, subject, text_content, html_content)
             
             if success:
                 flash(f"Test email successfully sent to {test_email}!", "success")
@@ -1551,7 +1654,7 @@ def test_email():
 
 @app.route('/email/template/test', methods=['POST'])
 def test_template():
-    """Test sending an email using a specific template."""
+    """Test sending an email using a specific template, bypassing the outbox."""
     template_type = request.form.get('template_type')
     recipient_email = request.form.get('recipient_email')
     
@@ -1560,6 +1663,7 @@ def test_template():
         return redirect(url_for('test_email'))
     
     # Find a sample item for the template
+    found = False
     success = False
     
     if template_type == 'fee_notification':
@@ -1568,6 +1672,7 @@ def test_template():
         if fee and fee.property:
             # Create a temporary contact for testing
             temp_contact = Contact(name="Test Recipient", email=recipient_email)
+            found = True
             success = email_service.send_fee_notification(fee, temp_contact)
             
     elif template_type == 'payment_receipt':
@@ -1576,6 +1681,7 @@ def test_template():
         if payment and payment.property:
             # Create a temporary contact for testing
             temp_contact = Contact(name="Test Recipient", email=recipient_email)
+            found = True
             success = email_service.send_payment_receipt(payment, temp_contact)
             
     elif template_type == 'overdue_reminder':
@@ -1588,19 +1694,23 @@ def test_template():
         if fee and fee.property:
             # Create a temporary contact for testing
             temp_contact = Contact(name="Test Recipient", email=recipient_email)
+            found = True
             success = email_service.send_overdue_reminder(fee, temp_contact)
             
     elif template_type == 'expense_notification':
         # Get a sample expense
         expense = Expense.query.first()
         if expense:
+            found = True
             success = email_service.send_expense_paid_notification(expense, [recipient_email])
             
     elif template_type == 'financial_summary':
-        # Get properties for summary
-        properties = Property.query.all()
-        if properties:
-            success = email_service.send_financial_summary(properties, [recipient_email], "Test Period")
+        # Build the summary for all properties
+        summary = reports.build_financial_summary(period="Test Period")
+        if summary.rows:
+            subject, text_content, html_content = email_service.render_financial_summary(summary)
+            found = True
+            success = email_service.send_email([recipient_email], subject, text_content, html_content)
     
     if success:
         flash(f"Test template email ({template_type}) sent successfully to {recipient_email}!", "success")
@@ -1609,8 +1719,10 @@ def test_template():
             event_type='email_template_test',
             description=f'Test {template_type} template email sent to {recipient_email}',
         )
-    else:
+    elif found:
         flash(f"Failed to send template email. Check server logs for details.", "danger")
+    else:
+        flash(f"No sample data available for the {template_type} template.", "warning")
     
     return redirect(url_for('test_email'))
 #
@@ -1649,6 +1761,20 @@ def strata_settings():
     
     return render_template('strata_settings.html', settings=settings)
 
+@app.route('/api/admin/pool-metrics', methods=['GET', 'POST'])
+@require_role('admin')
+def pool_metrics():
+    """
+    Database connection pool, read replica and response cache metrics for
+    this worker process. POST returns the metrics and starts counting the
+    pool's figures again from zero.
+    """
+    metrics = db_pool.snapshot(db.engine)
+    metrics['replica'] = replica.status()
+    metrics['response_cache'] = response_cache.status()
+    if request.method == 'POST':
+        db_pool.stats.reset()
+    return jsonify(metrics)
 
 # Context processor to make strata settings available in all templates
 @app.context_processor
@@ -0,0 +1,197 @@
+"""
+Scheduler for StrataHub background jobs.
+Runs registered periodic jobs either from the command line (e.g. cron)
+or from an in-process thread. Job run times are stored in the database so
+several web workers can share the schedule without running a job twice.
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+from app import app, db
+from models import SchedulerState
+
+POLL_INTERVAL_SECONDS = int(os.environ.get('SCHEDULER_POLL_INTERVAL', 60))
+
+# Registered jobs: name -> {'func': callable, 'interval': timedelta}
+JOBS = {}
+
+def register_job(name, interval_seconds, func):
+    """
+    Register a periodic job.
+
+    Args:
+        name (str): Unique job name
+        interval_seconds (int): Minimum time between runs
+        func (callable): Called as func(last_run) inside an app context;
+                         should return a dict of metrics
+    """
+    JOBS[name] = {'func': func, 'interval': timedelta(seconds=interval_seconds)}
+
+def get_last_run(name):
+    """Get the last run time of a job, or None if it has never run."""
+    state = db.session.get(SchedulerState, name)
+    return state.last_run_at if state else None
+
+def _claim_run(name, interval, now):
+    """
+    Atomically mark a job as run if it is due.
+
+    Returns:
+        tuple: (claimed, previous last_run_at)
+    """
+    state = db.session.get(SchedulerState, name)
+    if state is None:
+        db.session.add(SchedulerState(job_name=name, last_run_at=None))
+        try:
+            db.session.commit()
+        except Exception:
+            # Another worker created it first
+            db.session.rollback()
+        state = db.session.get(SchedulerState, name)
+
+    previous = state.last_run_at
+    if previous is not None and now - previous < interval:
+        return False, previous
+
+    # Conditional update so only one worker wins the run
+    query = SchedulerState.query.filter(SchedulerState.job_name == name)
+    if previous is None:
+        query = query.filter(SchedulerState.last_run_at.is_(None))
+    else:
+        query = query.filter(SchedulerState.last_run_at == previous)
+
+    claimed = query.update({'last_run_at': now}, synchronize_session=False) == 1
+    db.session.commit()
+    return claimed, previous
+
+def run_job(name, force=False):
+    """
+    Run a job if it is due (or always, if force is set).
+
+    Returns:
+        dict: Job metrics, or None if the job was not due
+    """
+    job = JOBS[name]
+    # Local time, to match how fee and due dates are stored
+    now = datetime.now()
+
+    if force:
+        previous = get_last_run(name)
+        state = db.session.get(SchedulerState, name) or SchedulerState(job_name=name)
+        state.last_run_at = now
+        db.session.add(state)
+        db.session.commit()
+    else:
+        claimed, previous = _claim_run(name, job['interval'], now)
+        if not claimed:
+            return None
+
+    try:
+        result = job['func'](previous) or {}
+    except Exception as e:
+        db.session.rollback()
+        print(f"Scheduler: job {name} failed: {e}")
+        # Let the job be retried on the next poll
+        SchedulerState.query.filter_by(job_name=name).update(
+            {'last_run_at': previous, 'last_result': json.dumps({'error': str(e)})},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return {'error': str(e)}
+
+    SchedulerState.query.filter_by(job_name=name).update(
+        {'last_result': json.dumps(result, default=str)},
+        synchronize_session=False
+    )
+    db.session.commit()
+    print(f"Scheduler: job {name} finished: {result}")
+    return result
+
+def run_pending(force=False, only=None):
+    """
+    Run every registered job that is due.
+
+    Returns:
+        dict: Job name -> metrics for the jobs that ran
+    """
+    results = {}
+    for name in list(JOBS):
+        if only and name not in only:
+            continue
+        result = run_job(name, force=force)
+        if result is not None:
+            results[name] = result
+    return results
+
+def _scheduler_loop(stop_event):
+    """Poll for due jobs until stop_event is set."""
+    while not stop_event.is_set():
+        with app.app_context():
+            try:
+                run_pending()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Scheduler error: {e}")
+        stop_event.wait(POLL_INTERVAL_SECONDS)
+
+def start_scheduler_thread():
+    """
+    Run the scheduler in a daemon thread inside the current process.
+
+    Returns:
+        threading.Event: Set it to stop the scheduler
+    """
+    load_jobs()
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_scheduler_loop, args=(stop_event,), name="scheduler", daemon=True)
+    thread.start()
+    return stop_event
+
+def load_jobs():
+    """Import the modules that register scheduled jobs."""
+    import overdue_reminders  # noqa: F401
+    import token_sweeper  # noqa: F401
+    import rate_limit  # noqa: F401
+    import session_store  # noqa: F401
+
+def main():
+    """Parse arguments and run scheduled jobs."""
+    parser = argparse.ArgumentParser(description='Run StrataHub scheduled jobs.')
+    parser.add_argument('--once', action='store_true', help='Run due jobs once and exit (for cron)')
+    parser.add_argument('--force', action='store_true', help='Run jobs even if they are not due')
+    parser.add_argument('--job', action='append', help='Only run the named job (can be repeated)')
+    parser.add_argument('--list', action='store_true', help='List registered jobs and exit')
+    args = parser.parse_args()
+
+    load_jobs()
+
+    if args.list:
+        with app.app_context():
+            for name, job in JOBS.items():
+                print(f"{name:<30} every {job['interval']}  last run: {get_last_run(name) or 'never'}")
+        return
+
+    if args.once or args.force:
+        with app.app_context():
+            results = run_pending(force=args.force, only=args.job)
+            if not results:
+                print("No jobs were due.")
+        return
+
+    print("Starting scheduler (Ctrl+C to stop)")
+    stop_event = threading.Event()
+    try:
+        _scheduler_loop(stop_event)
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+if __name__ == "__main__":
+    # Jobs register themselves on the importable `scheduler` module, so run
+    # through it rather than this __main__ copy
+    import scheduler
+    scheduler.main()
@@ -0,0 +1,292 @@
+"""
+Search module for StrataHub application.
+Maintains a full-text index over contacts, properties, payments and expenses
+and answers ranked searches against it.
+
+On PostgreSQL the index is a table with a weighted tsvector column and a GIN
+index; on SQLite it is an FTS5 virtual table. Model events keep it current in
+the same transaction as the change; run `python search.py --rebuild` after
+bulk imports or restores that bypass the ORM.
+"""
+
+import re
+import argparse
+
+from sqlalchemy import event, inspect, text
+
+from app import app, db
+from models import Contact, Property, Payment, Expense
+
+INDEX_TABLE = 'search_document'
+MAX_TERMS = 8
+REBUILD_BATCH_SIZE = 500
+
+POSTGRES_SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS {INDEX_TABLE} (
+        entity_type VARCHAR(20) NOT NULL,
+        entity_id INTEGER NOT NULL,
+        title TEXT,
+        content TEXT,
+        document TSVECTOR,
+        PRIMARY KEY (entity_type, entity_id)
+    )""",
+    f"CREATE INDEX IF NOT EXISTS ix_{INDEX_TABLE}_document ON {INDEX_TABLE} USING GIN (document)",
+]
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5(
+        entity_type UNINDEXED,
+        entity_id UNINDEXED,
+        title,
+        content,
+        tokenize = 'unicode61'
+    )""",
+]
+
+def _join(*values):
+    return ' '.join(str(value) for value in values if value)
+
+def contact_document(contact):
+    return contact.name, _join(contact.email, contact.phone, contact.notes)
+
+def property_document(property):
+    return f"Unit {property.unit_number}", _join(property.unit_number, property.description)
+
+def payment_document(payment):
+    return payment.description or f"Payment {payment.id}", _join(payment.reference)
+
+def expense_document(expense):
+    return expense.name, _join(expense.description)
+
+# entity type -> (model, function returning (title, content), attributes the document is built from)
+SEARCH_SOURCES = {
+    'contact': (Contact, contact_document, ('name', 'email', 'phone', 'notes')),
+    'property': (Property, property_document, ('unit_number', 'description')),
+    'payment': (Payment, payment_document, ('description', 'reference')),
+    'expense': (Expense, expense_document, ('name', 'description')),
+}
+
+# FTS5 rows are keyed by rowid (its UNINDEXED columns can't be looked up
+# without a full scan): the entity type's code in the high 32 bits and the
+# entity's ID in the low ones
+SQLITE_TYPE_CODES = {'contact': 1, 'property': 2, 'payment': 3, 'expense': 4}
+
+def _sqlite_rowid(entity_type, entity_id):
+    return (SQLITE_TYPE_CODES[entity_type] << 32) | entity_id
+
+_schema_ready = False
+
+def _backend(connection):
+    """Get the index backend for a connection: 'postgresql', 'sqlite' or None."""
+    name = connection.dialect.name
+    return name if name in ('postgresql', 'sqlite') else None
+
+def ensure_schema(connection=None):
+    """
+    Create the search index table if it doesn't exist (or has an outdated layout).
+
+    Returns:
+        bool: True if the table was created by this call and needs filling
+    """
+    global _schema_ready
+    if connection is None:
+        with db.engine.begin() as connection:
+            return ensure_schema(connection)
+
+    backend = _backend(connection)
+    if backend is None:
+        _schema_ready = True
+        return False
+
+    created = not inspect(connection).has_table(INDEX_TABLE)
+    if not created and backend == 'sqlite' and connection.execute(
+        text(f"SELECT 1 FROM {INDEX_TABLE} WHERE rowid < :first LIMIT 1"), {'first': 1 << 32}
+    ).first():
+        # Built before rows were keyed by rowid; start again
+        connection.execute(text(f"DROP TABLE {INDEX_TABLE}"))
+        created = True
+    for statement in (POSTGRES_SCHEMA if backend == 'postgresql' else SQLITE_SCHEMA):
+        connection.execute(text(statement))
+    _schema_ready = True
+    return created
+
+def _write_document(connection, entity_type, entity_id, title, content):
+    """Insert or replace one entity's document."""
+    params = {'entity_type': entity_type, 'entity_id': entity_id, 'title': title or '', 'content': content or ''}
+
+    if _backend(connection) == 'postgresql':
+        connection.execute(text(f"""
+            INSERT INTO {INDEX_TABLE} (entity_type, entity_id, title, content, document)
+            VALUES (:entity_type, :entity_id, :title, :content,
+                    setweight(to_tsvector('simple', :title), 'A') || setweight(to_tsvector('simple', :content), 'B'))
+            ON CONFLICT (entity_type, entity_id) DO UPDATE
+            SET title = EXCLUDED.title, content = EXCLUDED.content, document = EXCLUDED.document
+        """), params)
+    else:
+        _delete_document(connection, entity_type, entity_id)
+        params['rowid'] = _sqlite_rowid(entity_type, entity_id)
+        connection.execute(text(f"""
+            INSERT INTO {INDEX_TABLE} (rowid, entity_type, entity_id, title, content)
+            VALUES (:rowid, :entity_type, :entity_id, :title, :content)
+        """), params)
+
+def _delete_document(connection, entity_type, entity_id):
+    if _backend(connection) == 'postgresql':
+        connection.execute(
+            text(f"DELETE FROM {INDEX_TABLE} WHERE entity_type = :entity_type AND entity_id = :entity_id"),
+            {'entity_type': entity_type, 'entity_id': entity_id}
+        )
+    else:
+        connection.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE rowid = :rowid"),
+                           {'rowid': _sqlite_rowid(entity_type, entity_id)})
+
+def _register_events(entity_type, model, build_document, fields):
+    """Keep an entity type's documents in step with inserts, updates and deletes."""
+    def index_entity(mapper, connection, target):
+        if _backend(connection) is None:
+            return
+        if not _schema_ready:
+            ensure_schema(connection)
+        title, content = build_document(target)
+        _write_document(connection, entity_type, target.id, title, content)
+
+    def unindex_entity(mapper, connection, target):
+        if _backend(connection) is None:
+            return
+        if not _schema_ready:
+            ensure_schema(connection)
+        _delete_document(connection, entity_type, target.id)
+
+    def reindex_entity(mapper, connection, target):
+        # Most updates (balances, payment matching) don't touch the document
+        attrs = inspect(target).attrs
+        if any(attrs[field].history.has_changes() for field in fields):
+            index_entity(mapper, connection, target)
+
+    event.listen(model, 'after_insert', index_entity)
+    event.listen(model, 'after_update', reindex_entity)
+    event.listen(model, 'after_delete', unindex_entity)
+
+for _entity_type, (_model, _build_document, _fields) in SEARCH_SOURCES.items():
+    _register_events(_entity_type, _model, _build_document, _fields)
+
+def rebuild_index():
+    """
+    Rebuild the whole search index from the database.
+
+    Returns:
+        int: Number of documents indexed
+    """
+    with db.engine.begin() as connection:
+        if _backend(connection) is None:
+            return 0
+        ensure_schema(connection)
+        connection.execute(text(f"DELETE FROM {INDEX_TABLE}"))
+
+    indexed = 0
+    for entity_type, (model, build_document, _) in SEARCH_SOURCES.items():
+        last_id = 0
+        while True:
+            batch = model.query.filter(model.id > last_id).order_by(model.id).limit(REBUILD_BATCH_SIZE).all()
+            if not batch:
+                break
+            with db.engine.begin() as connection:
+                for item in batch:
+                    title, content = build_document(item)
+                    _write_document(connection, entity_type, item.id, title, content)
+            last_id = batch[-1].id
+            indexed += len(batch)
+        db.session.expunge_all()
+    return indexed
+
+def _query_terms(query):
+    """Split a search string into at most MAX_TERMS lowercase word terms."""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+def search(query, entity_types=None, limit=20):
+    """
+    Search the index, best matches first.
+
+    Every term must match; the last characters of each term may be left off
+    (prefix matching), so "smi jo" finds "John Smith".
+
+    Args:
+        query (str): Search text
+        entity_types (list, optional): Restrict to these types, e.g. ['contact']
+        limit (int): Maximum number of results
+
+    Returns:
+        list: Dicts with entity_type, entity_id, title, content and rank
+    """
+    terms = _query_terms(query or '')
+    if not terms:
+        return []
+
+    if entity_types:
+        entity_types = [entity_type for entity_type in entity_types if entity_type in SEARCH_SOURCES]
+        if not entity_types:
+            return []
+
+    connection = db.session.connection()
+    backend = _backend(connection)
+    if backend is None:
+        return []
+    if not _schema_ready:
+        ensure_schema(connection)
+
+    params = {'limit': limit}
+    type_filter = ''
+    if entity_types:
+        placeholders = ', '.join(f':type_{i}' for i in range(len(entity_types)))
+        type_filter = f"AND entity_type IN ({placeholders})"
+        params.update({f'type_{i}': entity_type for i, entity_type in enumerate(entity_types)})
+
+    if backend == 'postgresql':
+        params['query'] = ' & '.join(f"{term}:*" for term in terms)
+        sql = f"""
+            SELECT entity_type, entity_id, title, content,
+                   ts_rank(document, to_tsquery('simple', :query)) AS rank
+            FROM {INDEX_TABLE}
+            WHERE document @@ to_tsquery('simple', :query) {type_filter}
+            ORDER BY rank DESC
+            LIMIT :limit
+        """
+    else:
+        params['query'] = ' AND '.join(f'"{term}"*' for term in terms)
+        # bm25() is lower for better matches; title matches count five times as much
+        sql = f"""
+            SELECT entity_type, entity_id, title, content,
+                   bm25({INDEX_TABLE}, 0.0, 0.0, 5.0, 1.0) AS rank
+            FROM {INDEX_TABLE}
+            WHERE {INDEX_TABLE} MATCH :query {type_filter}
+            ORDER BY rank
+            LIMIT :limit
+        """
+
+    return [
+        {
+            'entity_type': row.entity_type,
+            'entity_id': int(row.entity_id),
+            'title': row.title,
+            'content': row.content,
+            'rank': float(row.rank)
+        }
+        for row in connection.execute(text(sql), params)
+    ]
+
+def main():
+    """Parse arguments and rebuild or query the search index."""
+    parser = argparse.ArgumentParser(description='Manage the StrataHub search index.')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index from the database')
+    parser.add_argument('--query', help='Run a search and print the results')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.rebuild:
+            print(f"Indexed {rebuild_index()} documents.")
+        if args.query:
+            for result in search(args.query):
+                print(f"{result['rank']:>8.3f}  {result['entity_type']:<9} {result['entity_id']:>6}  {result['title']}")
+
+if __name__ == "__main__":
+    main()
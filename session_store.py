@@ -0,0 +1,245 @@
+"""
+Server-side session module for StrataHub application.
+Keeps session data in the database or on the local filesystem so the cookie
+only carries a random session ID, however much state a flow stores.
+
+Select the backend with SESSION_STORE=database (default), filesystem or
+cookie (Flask's signed cookie sessions).
+
+Signed cookie sessions issued before the switch are still accepted and moved
+into the store on their next request, so users stay logged in across the
+deploy. Once they have all expired (PERMANENT_SESSION_LIFETIME), set
+SESSION_ACCEPT_COOKIE_SESSIONS=0.
+"""
+
+import os
+import hashlib
+import secrets
+import tempfile
+import threading
+from datetime import datetime
+
+from flask.sessions import SessionInterface, SessionMixin, SecureCookieSessionInterface
+from werkzeug.datastructures import CallbackDict
+from itsdangerous import BadSignature
+from sqlalchemy import delete
+
+from app import app, db
+from models import ServerSession
+import scheduler
+
+SESSION_STORE = os.environ.get('SESSION_STORE', 'database')
+SESSION_DIR = os.environ.get(
+    'SESSION_DIR',
+    os.path.join(tempfile.gettempdir(), 'stratahub_sessions')
+)
+SWEEP_INTERVAL_SECONDS = int(os.environ.get('SESSION_SWEEP_INTERVAL', 3600))
+# Accept Flask's signed cookie sessions and move them into the store
+ACCEPT_COOKIE_SESSIONS = os.environ.get('SESSION_ACCEPT_COOKIE_SESSIONS', '1') == '1'
+SWEEP_BATCH_SIZE = 1000
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict that tracks changes and carries its server-side ID."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.rotate = False
+
+def _storage_key(sid):
+    """Hash a session ID so the store never holds usable cookie values."""
+    return hashlib.sha256(sid.encode('utf-8')).hexdigest()
+
+class DatabaseSessionStore:
+    """Session data in the server_session table."""
+
+    def load(self, key, now):
+        record = db.session.get(ServerSession, key)
+        if record is None or record.expires_at < now:
+            return None
+        return record.data
+
+    def save(self, key, data, expires_at):
+        # Own transaction so saving never flushes or commits the request's work
+        table = ServerSession.__table__
+        with db.engine.begin() as connection:
+            updated = connection.execute(
+                table.update().where(table.c.id == key).values(data=data, expires_at=expires_at)
+            ).rowcount
+            if not updated:
+                connection.execute(table.insert().values(id=key, data=data, expires_at=expires_at))
+
+    def delete(self, key):
+        table = ServerSession.__table__
+        with db.engine.begin() as connection:
+            connection.execute(table.delete().where(table.c.id == key))
+
+    def purge_expired(self, now):
+        """Delete expired sessions in batches; returns the number deleted."""
+        purged = 0
+        while True:
+            keys = [key for key, in db.session.query(ServerSession.id)
+                    .filter(ServerSession.expires_at < now)
+                    .limit(SWEEP_BATCH_SIZE)]
+            if not keys:
+                break
+            db.session.execute(delete(ServerSession).where(ServerSession.id.in_(keys)))
+            db.session.commit()
+            purged += len(keys)
+        return purged
+
+class FilesystemSessionStore:
+    """Session data in one file per session under SESSION_DIR."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key, now):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                expires_at = datetime.fromisoformat(f.readline().strip())
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+        return data if expires_at >= now else None
+
+    def save(self, key, data, expires_at):
+        # Write to a temporary file and rename so readers never see a partial file
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(expires_at.isoformat() + "\n")
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def purge_expired(self, now):
+        """Delete expired session files; returns the number deleted."""
+        purged = 0
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                continue
+            if self.load(name, now) is None:
+                self.delete(name)
+                purged += 1
+        return purged
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface backed by a DatabaseSessionStore or FilesystemSessionStore."""
+
+    serializer = SecureCookieSessionInterface.serializer
+    session_class = ServerSideSession
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.load(_storage_key(sid), datetime.utcnow())
+            if data is not None:
+                try:
+                    return self.session_class(self.serializer.loads(data), sid=sid)
+                except ValueError:
+                    pass
+            # Session IDs never contain a '.'; signed cookie sessions always do
+            if ACCEPT_COOKIE_SESSIONS and '.' in sid:
+                session = self._open_cookie_session(app, sid)
+                if session is not None:
+                    return session
+        return self.session_class(new=True)
+
+    def _open_cookie_session(self, app, value):
+        """Load a signed cookie session and mark it to be saved under a new session ID."""
+        signer = SecureCookieSessionInterface().get_signing_serializer(app)
+        if signer is None:
+            return None
+        try:
+            data = signer.loads(value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return None
+        session = self.session_class(data, new=True)
+        session.modified = True
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # Empty sessions are never stored, so anonymous visitors cost nothing
+        if not session:
+            if session.sid:
+                self.store.delete(_storage_key(session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.rotate and session.sid:
+            self.store.delete(_storage_key(session.sid))
+            session.sid = None
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+            session.modified = True
+
+        if not (session.modified or self.should_set_cookie(app, session)):
+            return
+
+        expires_at = datetime.utcnow() + app.permanent_session_lifetime
+        self.store.save(_storage_key(session.sid), self.serializer.dumps(dict(session)), expires_at)
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+def rotate_session(session):
+    """
+    Issue a new session ID while keeping the data, e.g. after logging in.
+    Has no effect with cookie sessions.
+    """
+    if isinstance(session, ServerSideSession):
+        session.rotate = True
+        session.modified = True
+
+def build_store():
+    """Build the configured session store, or None for cookie sessions."""
+    if SESSION_STORE == 'database':
+        return DatabaseSessionStore()
+    if SESSION_STORE == 'filesystem':
+        return FilesystemSessionStore(SESSION_DIR)
+    return None
+
+def install(flask_app=app):
+    """Use the configured server-side session backend for the app."""
+    store = build_store()
+    if store is not None:
+        flask_app.session_interface = ServerSideSessionInterface(store)
+
+def _scheduled_sweep(last_run):
+    """Scheduler entry point: delete expired sessions."""
+    store = build_store()
+    if store is None:
+        return {'purged': 0}
+    return {'purged': store.purge_expired(datetime.utcnow())}
+
+scheduler.register_job('expired_sessions', SWEEP_INTERVAL_SECONDS, _scheduled_sweep)
@@ -0,0 +1,34 @@
+"""
+Login token sweeper for StrataHub application.
+Clears expired magic link tokens in batches so the unique token index only
+holds links that can still be used.
+"""
+
+import os
+import argparse
+
+from app import app
+from models import User
+import scheduler
+
+SWEEP_INTERVAL_SECONDS = int(os.environ.get('TOKEN_SWEEP_INTERVAL', 3600))
+BATCH_SIZE = int(os.environ.get('TOKEN_SWEEP_BATCH_SIZE', 500))
+
+def _scheduled_sweep(last_run):
+    """Scheduler entry point: clear every expired token."""
+    return {'purged': User.purge_expired_tokens(batch_size=BATCH_SIZE)}
+
+scheduler.register_job('expired_login_tokens', SWEEP_INTERVAL_SECONDS, _scheduled_sweep)
+
+def main():
+    """Parse arguments and clear expired login tokens."""
+    parser = argparse.ArgumentParser(description='Clear expired magic link login tokens.')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Users to update per commit')
+    args = parser.parse_args()
+
+    with app.app_context():
+        purged = User.purge_expired_tokens(batch_size=args.batch_size)
+        print(f"Cleared {purged} expired login tokens.")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,3 @@
-import pandas as pd
 import re
 import hashlib
 from datetime import datetime
@@ -6,6 +5,9 @@ from io import StringIO
 
 from app import db
 from models import Property, Payment, Fee, ActivityLog
+import payer_history
+import allocation
+import fuzzy_match
 
 def log_activity(event_type, description, related_type=None, related_id=None):
     """
@@ -31,6 +33,9 @@ def process_csv(csv_content):
     Process CSV bank statement and extract payment information.
     Returns a list of payment dictionaries.
     """
+    # pandas takes a while to import, so only load it once a statement is uploaded
+    import pandas as pd
+
     # Read CSV content
     df = pd.read_csv(StringIO(csv_content))
     
@@ -151,8 +156,27 @@ def suggest_property_matches(payments):
     """
     # Get all properties
     properties = Property.query.all()
+    properties_by_id = {prop.id: prop for prop in properties}
+    owner_names = fuzzy_match.load_owner_names()
+    owner_index = fuzzy_match.OwnerNameIndex(owner_names)
     
-    for payment in payments:
+    # Recurring payers: look up what they were confirmed against before
+    history_matches = payer_history.lookup_payments(payments)
+    payer_history.report_hit_rate(payments, history_matches)
+    
+    for index, payment in enumerate(payments):
+        learned = history_matches.get(index)
+        if learned and learned['property_id'] in properties_by_id:
+            learned_property = properties_by_id[learned['property_id']]
+            payment['suggested_property'] = {
+                'id': learned_property.id,
+                'unit_number': learned_property.unit_number,
+                'owner': owner_names.get(learned_property.id, "No owner assigned"),
+                'confidence': learned['confidence'],
+                'source': 'history'
+            }
+            continue
+        
         # Try to find property by unit number or owner name in reference or description
         text_to_search = f"{payment['reference']} {payment['description']}".lower()
         
@@ -226,32 +250,25 @@ def suggest_property_matches(payments):
                 matched_property = prop
                 match_confidence = 80  # Good confidence for numeric match in short text
                 break
-            
-            # Check if there's an owner contact for this property
-            owner_contact = prop.get_owner()
-            if owner_contact:
-                # Check if owner name is in the text (split into words for more flexible matching)
-                owner_parts = owner_contact.name.lower().split()
-                if all(part in text_to_search for part in owner_parts if len(part) > 2):
-                    matched_property = prop
-                    match_confidence = 70  # Medium confidence for owner name match
-                    break
-            
+        
+        # No unit number found - try the owners' names, allowing for typos and initials
+        if not matched_property:
+            owner_property_id, owner_confidence = owner_index.best_match(text_to_search)
+            if owner_property_id in properties_by_id:
+                matched_property = properties_by_id[owner_property_id]
+                match_confidence = owner_confidence
+        
         # No automatic matching for generic "strata fee" mentions
         # We'll handle these in the UI by letting the user select the right property
         
         # Add property suggestion to payment
         if matched_property:
-            owner = matched_property.get_owner()
-            owner_name = "No owner assigned"
-            if owner is not None:
-                owner_name = owner.name
-                
             payment['suggested_property'] = {
                 'id': matched_property.id,
                 'unit_number': matched_property.unit_number,
-                'owner': owner_name,
-                'confidence': match_confidence
+                'owner': owner_names.get(matched_property.id, "No owner assigned"),
+                'confidence': match_confidence,
+                'source': 'heuristic'
             }
         else:
             payment['suggested_property'] = None
@@ -260,67 +277,12 @@ def suggest_property_matches(payments):
 
 def suggest_fee_matches(payments):
     """
-    Suggest potential fee matches for each payment that has a suggested property.
-    Adds fee suggestions to payment dictionaries.
+    Suggest fee matches for each payment that has a suggested property.
+    Allocates the whole batch at once so no fee is suggested for two payments
+    and lump sums are split across the fees they cover; see allocation.py.
+    Adds 'suggested_fee' and 'fee_allocations' to payment dictionaries.
     """
-    for payment in payments:
-        # Initialize with None as default
-        payment['suggested_fee'] = None
-        
-        # Skip if no suggested property
-        suggested_property = payment.get('suggested_property')
-        if not suggested_property:
-            continue
-        
-        # Get property ID (safely)
-        property_id = suggested_property.get('id')
-        if not property_id:
-            continue
-        
-        # Get unpaid fees for this property, ordered by date (oldest first)
-        try:
-            unpaid_fees = Fee.query.filter_by(
-                property_id=property_id,
-                paid=False
-            ).order_by(Fee.date.asc()).all()
-        except Exception:
-            # If any database error occurs, skip
-            continue
-        
-        # Try to find a matching fee by amount
-        matching_fee = None
-        for fee in unpaid_fees:
-            try:
-                # Exact match
-                if abs(fee.amount - payment['amount']) < 0.01:
-                    matching_fee = fee
-                    break
-                # Close match (within 5%)
-                elif abs(fee.amount - payment['amount']) / fee.amount < 0.05:
-                    matching_fee = fee
-                    break
-            except (TypeError, ValueError, ZeroDivisionError):
-                # Skip this fee if there's any calculation error
-                continue
-        
-        # If no fee matches by amount, suggest the oldest unpaid fee
-        if not matching_fee and unpaid_fees:
-            matching_fee = unpaid_fees[0]
-        
-        # Add fee suggestion to payment
-        if matching_fee:
-            try:
-                payment['suggested_fee'] = {
-                    'id': matching_fee.id,
-                    'amount': matching_fee.amount,
-                    'period': matching_fee.period,
-                    'exact_match': abs(matching_fee.amount - payment['amount']) < 0.01
-                }
-            except Exception:
-                # If any error occurs while creating the suggestion dict, skip
-                payment['suggested_fee'] = None
-    
-    return payments
+    return allocation.suggest_allocations(payments)
 
 def analyze_payments(payments):
     """
@@ -0,0 +1,11 @@
+"""
+WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Set AUTO_CREATE_SCHEMA=0 and run `python init_db.py` once per deploy so
+workers don't check the schema each time they start.
+"""
+from main import app
+
+application = app